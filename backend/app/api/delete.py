@@ -1,13 +1,14 @@
 from fastapi import APIRouter, HTTPException, Depends
 from ..core.auth import get_current_user
 from ..services.supabase_client import supabase_client
+from ..services.user_locks import user_locks
 import os
 import json
 
 router = APIRouter()
 
 @router.delete("/synced")
-async def delete_synced_files(user: dict = Depends(get_current_user)):
+def delete_synced_files(user: dict = Depends(get_current_user)):
     user_id = user["id"]
     print(f"\n🗑️ DELETE SYNCED FILES: user_id={user_id}")
     
@@ -34,17 +35,12 @@ async def delete_synced_files(user: dict = Depends(get_current_user)):
             
             file_manager.hash_registry = file_manager._load_registry()
         
-        # Remove synced file nodes from KG
-        if user_id in kg_builder.graphs:
-            G = kg_builder.graphs[user_id]
-            nodes_to_remove = [n for n, d in G.nodes(data=True) if d.get('file_id') in synced_file_ids]
-            G.remove_nodes_from(nodes_to_remove)
-            kg_builder._save_graph(user_id)
-        
-        # Remove synced file embeddings
-        if user_id in rag_engine.documents:
-            rag_engine.documents[user_id] = [d for d in rag_engine.documents[user_id] if d.get('file_id') not in synced_file_ids]
-            rag_engine._save_index(user_id)
+        with user_locks.writer(user_id):
+            # Remove synced file nodes from KG
+            kg_builder.remove_file_nodes(user_id, synced_file_ids)
+            
+            # Remove synced file embeddings
+            rag_engine.delete_files(user_id, synced_file_ids)
         
         print(f"✅ Deleted {len(synced_file_ids)} synced files")
         return {"message": f"Deleted {len(synced_file_ids)} synced files", "count": len(synced_file_ids)}
@@ -54,7 +50,7 @@ async def delete_synced_files(user: dict = Depends(get_current_user)):
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.delete("/all")
-async def delete_all_data(user: dict = Depends(get_current_user)):
+def delete_all_data(user: dict = Depends(get_current_user)):
     user_id = user["id"]
     print(f"\n🗑️ DELETE ALL DATA: user_id={user_id}")
     
@@ -62,6 +58,7 @@ async def delete_all_data(user: dict = Depends(get_current_user)):
         from ..services.file_manager import file_manager
         from ..services.kg_builder import kg_builder
         from ..services.rag_engine import rag_engine
+        from ..services.embedding_sync import embedding_sync
         import shutil
         
         # Delete from Supabase
@@ -93,25 +90,19 @@ async def delete_all_data(user: dict = Depends(get_current_user)):
             
             file_manager.hash_registry = file_manager._load_registry()
         
-        # Delete graph
-        graph_path = f"storage/graphs/{user_id}.pkl"
-        if os.path.exists(graph_path):
-            os.remove(graph_path)
-        
-        # Delete embeddings
-        index_path = f"storage/{user_id}.index"
-        docs_path = f"storage/{user_id}.pkl"
-        if os.path.exists(index_path):
-            os.remove(index_path)
-        if os.path.exists(docs_path):
-            os.remove(docs_path)
-        
-        # Clear from memory
-        if user_id in kg_builder.graphs:
-            del kg_builder.graphs[user_id]
-        if user_id in rag_engine.indices:
-            del rag_engine.indices[user_id]
-            del rag_engine.documents[user_id]
+        with user_locks.writer(user_id):
+            # Delete graph snapshot and delta log
+            kg_builder.delete_graph(user_id)
+            
+            # Delete embeddings
+            for path in (f"storage/{user_id}.index", f"storage/{user_id}.pkl", f"storage/{user_id}.vec",
+                         f"storage/{user_id}.del"):
+                if os.path.exists(path):
+                    os.remove(path)
+            
+            # Clear from memory
+            rag_engine.drop(user_id)
+            embedding_sync.discard(user_id)
         
         print(f"✅ Deleted all data for user {user_id}")
         return {"message": "All data deleted successfully"}
@@ -121,7 +112,7 @@ async def delete_all_data(user: dict = Depends(get_current_user)):
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.delete("/file/{file_id}")
-async def delete_file(file_id: str, user: dict = Depends(get_current_user)):
+def delete_file(file_id: str, user: dict = Depends(get_current_user)):
     user_id = user["id"]
     print(f"\n🗑️ DELETE REQUEST: file_id={file_id}, user_id={user_id}")
     
@@ -180,16 +171,13 @@ async def delete_file(file_id: str, user: dict = Depends(get_current_user)):
             else:
                 print(f"  ⚠️ No matching file found in registry")
         
-        # Reload graphs from storage
+        # Remove the file's nodes from the KG
         from ..services.kg_builder import kg_builder
         from ..services.rag_engine import rag_engine
         
-        if user_id in kg_builder.graphs:
-            del kg_builder.graphs[user_id]
-        
-        if user_id in rag_engine.indices:
-            del rag_engine.indices[user_id]
-            del rag_engine.documents[user_id]
+        with user_locks.writer(user_id):
+            kg_builder.remove_file_nodes(user_id, [file_id])
+            rag_engine.delete_files(user_id, [file_id])
         
         return {"message": "File deleted successfully", "file_id": file_id}
     
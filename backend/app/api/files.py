@@ -5,7 +5,7 @@ from typing import List, Dict, Any
 router = APIRouter(prefix="/files", tags=["files"])
 
 @router.get("/list")
-async def list_files(user: dict = Depends(get_current_user)):
+def list_files(user: dict = Depends(get_current_user)):
     from ..services.file_manager import file_manager
     from ..services.kg_builder import kg_builder
     user_id = user["id"]
@@ -13,14 +13,8 @@ async def list_files(user: dict = Depends(get_current_user)):
     # Load file registry from disk if not in memory
     file_manager._load_registry()
     
-    # Load graph to check which files have been processed
-    if user_id not in kg_builder.graphs:
-        kg_builder._load_graph(user_id)
-    
-    processed_files = set()
-    if user_id in kg_builder.graphs:
-        G = kg_builder.graphs[user_id]
-        processed_files = set(d.get('file_id') for _, d in G.nodes(data=True) if d.get('file_id'))
+    # Check which files have been processed (from the shard manifest when the graph is not loaded)
+    processed_files = set(kg_builder.file_ids(user_id))
     
     uploaded = []
     synced = []
@@ -44,30 +38,23 @@ async def list_files(user: dict = Depends(get_current_user)):
     }
 
 @router.get("/kg/{file_id}")
-async def get_file_kg(file_id: str, user: dict = Depends(get_current_user)):
+def get_file_kg(file_id: str, user: dict = Depends(get_current_user)):
     from ..services.kg_builder import kg_builder
     user_id = user["id"]
     
     print(f"[KG] Fetching KG for file_id: {file_id}, user_id: {user_id}")
     
-    # Load user's graph
-    if user_id not in kg_builder.graphs:
-        kg_builder._load_graph(user_id)
+    # Last published snapshot, shared by every worker process
+    G = kg_builder.read_graph(user_id, file_ids=[file_id])
     
-    if user_id not in kg_builder.graphs:
+    if G is None:
         print(f"[KG] No graph found for user {user_id}")
         return {"nodes": [], "edges": [], "error": "No graph found for user"}
     
-    G = kg_builder.graphs[user_id]
     print(f"[KG] Graph has {G.number_of_nodes()} nodes, {G.number_of_edges()} edges")
     
-    # Get all file_ids in graph for debugging
-    all_file_ids = set(data.get('file_id') for _, data in G.nodes(data=True) if data.get('file_id'))
-    print(f"[KG] File IDs in graph: {all_file_ids}")
-    
-    # Filter nodes by file_id
-    file_nodes = [(node, data) for node, data in G.nodes(data=True) 
-                  if data.get('file_id') == file_id]
+    # Nodes of this file, from the file_id index
+    file_nodes = [(node, G.nodes[node]) for node in G.file_nodes(file_id)]
     
     print(f"[KG] Found {len(file_nodes)} nodes for file_id {file_id}")
     
@@ -76,7 +63,7 @@ async def get_file_kg(file_id: str, user: dict = Depends(get_current_user)):
             "nodes": [], 
             "edges": [], 
             "error": f"No nodes found for file {file_id}. File may not be processed yet.",
-            "available_files": list(all_file_ids)
+            "available_files": kg_builder.file_ids(user_id)
         }
     
     # Build node map
@@ -0,0 +1,23 @@
+from fastapi import APIRouter, Depends, HTTPException
+from ..core.auth import get_current_user
+from ..services.job_queue import job_queue
+
+router = APIRouter(prefix="/jobs", tags=["jobs"])
+
+@router.get("/")
+async def list_jobs(user: dict = Depends(get_current_user)):
+    return {"jobs": job_queue.list_jobs(user["id"])}
+
+@router.get("/{job_id}")
+async def get_job(job_id: str, user: dict = Depends(get_current_user)):
+    job = job_queue.get(job_id, user["id"])
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@router.post("/{job_id}/cancel")
+async def cancel_job(job_id: str, user: dict = Depends(get_current_user)):
+    job = job_queue.cancel(job_id, user["id"])
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
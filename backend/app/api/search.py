@@ -2,6 +2,7 @@ from fastapi import APIRouter, Depends
 from ..models.schemas import SearchRequest, SearchResponse, SearchResult, FeedbackRequest
 from ..core.auth import get_current_user
 from ..services.search_engine import search_engine
+from ..services.rag_engine import rag_engine
 from ..services.answer_generator import answer_generator
 from ..services.kg_builder import kg_builder
 from ..services.query_analyzer import query_analyzer
@@ -10,8 +11,9 @@ from ..services.feedback_learner import feedback_learner
 
 router = APIRouter(prefix="/search", tags=["search"])
 
+# Plain def: FastAPI runs it in its threadpool, so one user's slow search does not stall the event loop for others
 @router.post("/", response_model=SearchResponse)
-async def search(request: SearchRequest, user: dict = Depends(get_current_user)):
+def search(request: SearchRequest, user: dict = Depends(get_current_user)):
     user_id = user["id"]
     
     # Analyze query to determine type
@@ -98,3 +100,8 @@ async def submit_feedback(request: FeedbackRequest, user: dict = Depends(get_cur
 async def get_search_analytics(user: dict = Depends(get_current_user)):
     patterns = feedback_learner.get_query_patterns()
     return patterns
+
+@router.get("/index-report")
+def get_index_report(user: dict = Depends(get_current_user)):
+    # Recall@10 / latency of the user's vector index against exact search (brute force, so not cheap)
+    return rag_engine.index_report(user["id"])
@@ -8,6 +8,7 @@ router = APIRouter(prefix="/sync", tags=["sync"])
 async def sync_google_drive(user: dict = Depends(get_current_user)):
     from ..services.file_manager import file_manager
     from ..services.token_validator import token_validator
+    from ..services.job_queue import job_queue
     import requests as http_requests
     user_id = user["id"]
     access_token = user.get("access_token")
@@ -86,68 +87,26 @@ async def sync_google_drive(user: dict = Depends(get_current_user)):
         file_manager._save_registry()
         print(f"[SYNC] Synced {len(synced_files)} files: {synced_files}")
         
-        # Auto-process synced files
-        processed_count = 0
-        processing_errors = []
+        # Queue supported files for background processing
+        job_ids = []
         
         for gdrive_file in gdrive_files:
-            try:
-                # Only process supported file types
-                mime_type = gdrive_file.get('mimeType', '')
-                if 'google-apps.spreadsheet' in mime_type or 'google-apps.document' in mime_type:
-                    print(f"[SYNC] Auto-processing: {gdrive_file['name']}")
-                    
-                    # Download and process
-                    if 'spreadsheet' in mime_type:
-                        export_mime = 'text/csv'
-                        ext = '.csv'
-                    elif 'document' in mime_type:
-                        export_mime = 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
-                        ext = '.docx'
-                    else:
-                        continue
-                    
-                    response = http_requests.get(
-                        f"https://www.googleapis.com/drive/v3/files/{gdrive_file['id']}/export",
-                        headers=headers,
-                        params={"mimeType": export_mime},
-                        timeout=30
-                    )
-                    
-                    if response.status_code == 200:
-                        from ..services.parser import parser
-                        from ..services.kg_builder import kg_builder
-                        from ..services.rag_engine import rag_engine
-                        from ..services.doc_type_detector import doc_detector
-                        import os
-                        
-                        temp_path = f"uploads/temp_{gdrive_file['id']}{ext}"
-                        with open(temp_path, 'wb') as f:
-                            f.write(response.content)
-                        
-                        parsed_data = parser.parse_file(temp_path)
-                        sample_content = str(parsed_data[0].get('content', ''))[:2000] if parsed_data else ""
-                        doc_info = doc_detector.detect_type(sample_content)
-                        doc_type = doc_info.get("type", "unknown")
-                        
-                        kg_builder.build_graph(parsed_data, gdrive_file['id'], user_id, doc_type)
-                        rag_engine.store_embeddings(parsed_data, gdrive_file['id'], user_id)
-                        
-                        os.remove(temp_path)
-                        processed_count += 1
-                        print(f"[SYNC] ✓ Processed: {gdrive_file['name']}")
-            except Exception as e:
-                error_msg = f"{gdrive_file['name']}: {str(e)}"
-                processing_errors.append(error_msg)
-                print(f"[SYNC] ✗ Failed to process {gdrive_file['name']}: {e}")
+            mime_type = gdrive_file.get('mimeType', '')
+            if 'google-apps.spreadsheet' in mime_type or 'google-apps.document' in mime_type:
+                job = job_queue.submit(user_id, "gdrive", gdrive_file['id'], gdrive_file['name'],
+                                       {"mime_type": mime_type}, secret=access_token)
+                job_ids.append(job["job_id"])
+                print(f"[SYNC] Queued for processing: {gdrive_file['name']}")
         
         return {
             "status": "success",
-            "message": f"Synced {len(synced_files)} files, processed {processed_count}",
+            "message": f"Synced {len(synced_files)} files, queued {len(job_ids)} for processing",
             "files_synced": len(synced_files),
-            "files_processed": processed_count,
+            "files_processed": 0,
+            "files_queued": len(job_ids),
+            "job_ids": job_ids,
             "files": synced_files,
-            "processing_errors": processing_errors
+            "processing_errors": []
         }
     except HTTPException:
         raise
@@ -157,17 +116,31 @@ async def sync_google_drive(user: dict = Depends(get_current_user)):
 
 @router.get("/status")
 async def get_sync_status(user: dict = Depends(get_current_user)):
+    from ..services.job_queue import job_queue
     user_id = user["id"]
+    
+    jobs = [j for j in job_queue.list_jobs(user_id) if j["kind"] == "gdrive"]
+    active = [j for j in jobs if j["status"] in ("queued", "running")]
+    finished = [j for j in jobs if j["finished_at"]]
+    
+    rows_total = sum(j["rows_total"] or 0 for j in active)
+    etas = [j["eta_seconds"] for j in active if j["eta_seconds"] is not None]
+    
     return {
-        "synced": False,
-        "last_sync": None
+        "synced": bool(jobs) and not active,
+        "last_sync": max(j["finished_at"] for j in finished) if finished else None,
+        "in_progress": len(active),
+        "completed": len([j for j in jobs if j["status"] == "completed"]),
+        "failed": len([j for j in jobs if j["status"] == "failed"]),
+        "rows_processed": sum(j["rows_processed"] for j in active),
+        "rows_total": rows_total or None,
+        "eta_seconds": max(etas) if etas else None,
+        "jobs": active
     }
 
 @router.post("/process/{file_id}")
 async def process_gdrive_file(file_id: str, user: dict = Depends(get_current_user)):
-    from ..services.parser import parser
-    from ..services.kg_builder import kg_builder
-    from ..services.rag_engine import rag_engine
+    from ..services.ingestion import ingestion_pipeline
     import requests as http_requests
     import io
     
@@ -227,14 +200,8 @@ async def process_gdrive_file(file_id: str, user: dict = Depends(get_current_use
         with open(temp_path, 'wb') as f:
             f.write(response.content)
         
-        # Parse
-        parsed_data = parser.parse_file(temp_path)
-        
-        # Build KG
-        kg_builder.build_graph(parsed_data, file_id, user_id, "unknown")
-        
-        # Store embeddings
-        rag_engine.store_embeddings(parsed_data, file_id, user_id)
+        # Parse, build KG and store embeddings
+        ingestion_pipeline.run(temp_path, file_id, user_id, doc_type="unknown")
         
         # Clean up
         import os
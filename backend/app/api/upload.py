@@ -2,10 +2,7 @@ from fastapi import APIRouter, UploadFile, File, Depends, HTTPException
 from ..models.schemas import FileUploadResponse
 from ..core.auth import get_current_user
 from ..services.file_manager import file_manager
-from ..services.parser import parser
-from ..services.kg_builder import kg_builder
-from ..services.rag_engine import rag_engine
-from ..services.doc_type_detector import doc_detector
+from ..services.job_queue import job_queue
 
 router = APIRouter(prefix="/upload", tags=["upload"])
 
@@ -25,35 +22,15 @@ async def upload_file(file: UploadFile = File(...), user: dict = Depends(get_cur
             )
         raise
     
-    # Parse file
-    parsed_data = parser.parse_file(file_info["path"])
-    
-    # Detect document type from filename first
-    filename_lower = file.filename.lower()
-    if 'customer' in filename_lower:
-        doc_type = 'customers'
-    elif 'deal' in filename_lower:
-        doc_type = 'deals'
-    elif 'invoice' in filename_lower:
-        doc_type = 'invoices'
-    elif 'order' in filename_lower:
-        doc_type = 'orders'
-    else:
-        # Fallback to LLM detection
-        sample_content = str(parsed_data[0].get('content', ''))[:2000] if parsed_data else ""
-        doc_info = doc_detector.detect_type(sample_content)
-        doc_type = doc_info.get("type", "unknown")
-    
-    # Build KG with document type awareness
-    kg_result = kg_builder.build_graph(parsed_data, file_info["file_id"], user_id, doc_type)
-    
-    # Store embeddings
-    rag_engine.store_embeddings(parsed_data, file_info["file_id"], user_id)
+    # Parse, build KG and store embeddings in the background
+    job = job_queue.submit(user_id, "file", file_info["file_id"], file_info["filename"],
+                           {"path": file_info["path"]})
     
     return FileUploadResponse(
         file_id=file_info["file_id"],
         filename=file_info["filename"],
-        status=f"processed_{doc_type}"
+        status="queued",
+        job_id=job["job_id"]
     )
 
 @router.post("/google-drive")
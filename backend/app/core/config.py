@@ -8,12 +8,61 @@ class Settings(BaseSettings):
     OPENROUTER_API_KEY: Optional[str] = "sk-dummy-key"
     OPENROUTER_BASE_URL: str = "https://openrouter.ai/api/v1"
     LLM_MODEL: str = "deepseek/deepseek-r1"
+    LLM_BATCH_TOKEN_BUDGET: int = 6000
+    LLM_BATCH_MAX_RECORDS: int = 20
+    LLM_CACHE_ENABLED: bool = True
+    LLM_CACHE_MAX_MB: int = 256
+    LLM_MAX_CONCURRENCY: int = 8
+    LLM_RATE_LIMIT_RPS: float = 5.0
+    LLM_RATE_LIMIT_BURST: int = 10
+    LLM_MAX_RETRIES: int = 3
+    LLM_TIMEOUT: float = 120.0
     JWT_SECRET: str
     JWT_ALGORITHM: str = "HS256"
     FRONTEND_URL: str
     BACKEND_URL: str
     SUPABASE_URL: str = ""
     SUPABASE_KEY: str = ""
+    MAX_UPLOAD_SIZE_MB: int = 50
+    EMBED_MODEL: str = "all-MiniLM-L6-v2"
+    EMBED_BATCH_SIZE: int = 64
+    EMBED_CACHE_ENABLED: bool = True
+    EMBED_CACHE_MAX_MB: int = 512
+    VECTOR_ANN_MIN_VECTORS: int = 200000
+    VECTOR_ANN_TYPE: str = "hnsw"
+    VECTOR_HNSW_M: int = 32
+    VECTOR_HNSW_EF_CONSTRUCTION: int = 200
+    VECTOR_HNSW_EF_SEARCH: int = 64
+    VECTOR_IVF_NLIST: int = 0
+    VECTOR_IVF_NPROBE: int = 16
+    VECTOR_RECALL_TARGET: float = 0.95
+    VECTOR_RECALL_QUERIES: int = 200
+    VECTOR_FILTER_EXACT_MAX: int = 20000
+    VECTOR_QUANTIZATION: str = "none"
+    VECTOR_QUANTIZE_MIN_VECTORS: int = 20000
+    VECTOR_PQ_M: int = 96
+    VECTOR_RERANK_FACTOR: int = 4
+    VECTOR_COMPACT_RATIO: float = 0.1
+    INGEST_WORKERS: int = 2
+    INGEST_CHECKPOINT_BATCHES: int = 10
+    JOB_LEASE_SECONDS: float = 60.0
+    JOB_POLL_INTERVAL: float = 2.0
+    KG_TABULAR_SCHEMA: bool = True
+    KG_LOG_COMPACT_MIN_MB: int = 16
+    KG_SHARD_CACHE_SIZE: int = 64
+    KG_TRAVERSAL_MAX_HOPS: int = 2
+    KG_TRAVERSAL_FANOUT: int = 25
+    KG_TRAVERSAL_MAX_SCAN: int = 2000
+    KG_TRAVERSAL_TIME_BUDGET_MS: float = 0.0
+    KG_CENTRALITY_DAMPING: float = 0.85
+    KG_CENTRALITY_TOLERANCE: float = 1e-3
+    KG_ENTITY_RESOLUTION: bool = True
+    KG_ER_BANDS: int = 16
+    KG_ER_ROWS: int = 4
+    KG_ER_THRESHOLD: float = 0.8
+    SUPABASE_SYNC_BATCH_SIZE: int = 500
+    SUPABASE_SYNC_INTERVAL: float = 2.0
+    SUPABASE_SYNC_RETRIES: int = 3
     
     class Config:
         env_file = ".env"
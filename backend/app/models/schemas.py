@@ -12,6 +12,7 @@ class FileUploadResponse(BaseModel):
     file_id: str
     filename: str
     status: str
+    job_id: Optional[str] = None
 
 class SearchRequest(BaseModel):
     query: str
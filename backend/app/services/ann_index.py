@@ -0,0 +1,307 @@
+import math
+import time
+import faiss
+import numpy as np
+from typing import Dict, Any, Optional
+from ..core.config import settings
+
+RECALL_K = 10
+
+# Index stages by size: exact float32, quantized flat, approximate (HNSW / IVF)
+FLAT, QUANTIZED, ANN = 0, 1, 2
+
+class AnnIndexBuilder:
+    """Builds and tunes the vector index a tenant's size calls for.
+    
+    Small tenants keep an exact IndexFlatL2. From VECTOR_QUANTIZE_MIN_VECTORS the
+    vectors are stored quantized (VECTOR_QUANTIZATION: fp16 / int8 scalar or product
+    quantization), and from VECTOR_ANN_MIN_VECTORS they go into an HNSW or IVF index
+    (VECTOR_ANN_TYPE) with the same encoding. Searches over quantized codes fetch
+    VECTOR_RERANK_FACTOR times the wanted hits and re-score them exactly against the
+    full-precision vectors kept on disk.
+    
+    Every index stores vectors under their chunk id (the document's position), either
+    in an IndexIDMap or, for IVF, in the inverted lists themselves, so ids survive
+    vectors being removed.
+    
+    tune() raises efSearch / nprobe from its configured value until recall@10 against
+    exact search reaches VECTOR_RECALL_TARGET, measured on a sample of the stored
+    vectors used as queries. Tuned values are set on the index, so they are saved and
+    cloned with it.
+    """
+    
+    def __init__(self):
+        self.min_vectors = settings.VECTOR_ANN_MIN_VECTORS
+        self.index_type = settings.VECTOR_ANN_TYPE.lower()
+        self.hnsw_m = settings.VECTOR_HNSW_M
+        self.ef_construction = settings.VECTOR_HNSW_EF_CONSTRUCTION
+        self.ef_search = settings.VECTOR_HNSW_EF_SEARCH
+        self.nlist = settings.VECTOR_IVF_NLIST
+        self.nprobe = settings.VECTOR_IVF_NPROBE
+        self.recall_target = settings.VECTOR_RECALL_TARGET
+        self.recall_queries = settings.VECTOR_RECALL_QUERIES
+        self.exact_filter_max = settings.VECTOR_FILTER_EXACT_MAX
+        self.quantization = settings.VECTOR_QUANTIZATION.lower()
+        self.quantize_min_vectors = settings.VECTOR_QUANTIZE_MIN_VECTORS
+        self.pq_m = settings.VECTOR_PQ_M
+        self.rerank_factor = settings.VECTOR_RERANK_FACTOR
+    
+    def target_stage(self, n: int) -> int:
+        if self.min_vectors > 0 and n >= self.min_vectors:
+            return ANN
+        if self.quantization != "none" and n >= self.quantize_min_vectors:
+            return QUANTIZED
+        return FLAT
+    
+    def should_promote(self, index) -> bool:
+        return self.target_stage(index.ntotal) > stage(index)
+    
+    def factory(self, n: int) -> Optional[str]:
+        """index_factory description for n vectors (None: plain IndexFlatL2)"""
+        target = self.target_stage(n)
+        if target == FLAT:
+            return None
+        encoding = {"fp16": "SQfp16", "int8": "SQ8", "pq": f"PQ{self.pq_m}"}.get(self.quantization, "Flat")
+        if target == QUANTIZED:
+            # IndexPQ takes neither ids nor id selectors; a single-list IVF scans the same codes exhaustively
+            return f"IVF1,{encoding}" if encoding.startswith("PQ") else encoding
+        if self.index_type == "ivf":
+            return f"IVF{self._nlist(n)},{encoding}"
+        # HNSW has no PQ-coded variant worth its recall loss; int8 codes are the closest
+        return f"HNSW{self.hnsw_m},{'SQ8' if encoding.startswith('PQ') else encoding}"
+    
+    def build(self, vectors: np.ndarray, ids: np.ndarray):
+        """Index of the given vectors stored under ids, of the type their count calls for"""
+        n, d = vectors.shape
+        description = self.factory(n)
+        if description is None:
+            index = new_index(d)
+            index.add_with_ids(vectors, ids)
+            return index
+        
+        index = faiss.index_factory(d, description)
+        if not index.is_trained:
+            # k-means (IVF centroids, PQ codebooks) needs a few hundred points per centroid, not all of them
+            rng = np.random.default_rng(17)
+            index.train(vectors[rng.choice(n, min(n, 256 * max(256, self._nlist(n))), replace=False)])
+        base = faiss.downcast_index(index)
+        if isinstance(base, faiss.IndexIVF):
+            base.nprobe = min(self.nprobe, base.nlist)
+            # Ids are arbitrary, so look them up by hash: keeps reconstruct() and remove_ids() working
+            base.set_direct_map_type(faiss.DirectMap.Hashtable)
+        else:
+            if isinstance(base, faiss.IndexHNSW):
+                base.hnsw.efConstruction = self.ef_construction
+                base.hnsw.efSearch = self.ef_search
+            index = faiss.IndexIDMap(index)
+        index.add_with_ids(vectors, ids)
+        return index
+    
+    def tune(self, index, vectors, ids: np.ndarray) -> Dict[str, Any]:
+        """Raise efSearch / nprobe until the recall target is met; returns the recall-vs-latency report
+        
+        vectors holds the full-precision vectors by id, ids the ids stored in index.
+        """
+        report = self.report(index, vectors, ids)
+        
+        base = unwrap(index)
+        limit = 0
+        if isinstance(base, faiss.IndexIVF):
+            limit = base.nlist
+        elif isinstance(base, faiss.IndexHNSW):
+            limit = 16 * self.ef_search
+        while report["steps"][-1]["recall"] < self.recall_target and get_search_param(base) < limit:
+            set_search_param(base, min(limit, 2 * get_search_param(base)))
+            report["steps"].append(self._measure(index, report["queries"], report["truth"], vectors))
+        
+        report["chosen"] = get_search_param(base)
+        report["target_met"] = report["steps"][-1]["recall"] >= self.recall_target
+        return report
+    
+    def report(self, index, vectors, ids: np.ndarray) -> Dict[str, Any]:
+        """Recall@10 and per-query latency of index (with re-scoring) against exact search over vectors[ids]
+        
+        The exact baseline scans vectors a chunk at a time (exact_search), the way filtered
+        searches run, so no second copy of the vectors is built for it.
+        """
+        ids = np.sort(ids)
+        rng = np.random.default_rng(17)
+        queries = np.asarray(vectors[ids[np.sort(rng.choice(len(ids), min(len(ids), self.recall_queries), replace=False))]])
+        k = min(RECALL_K, len(ids))
+        
+        start = time.perf_counter()
+        _, truth = exact_search(queries, ids, vectors, k)
+        exact_ms = (time.perf_counter() - start) * 1000 / len(queries)
+        
+        return {"index": type(unwrap(index)).__name__, "vectors": int(index.ntotal),
+                "bytes_per_vector": bytes_per_vector(index), "k": k, "queries": queries, "truth": truth,
+                "exact_ms": round(exact_ms, 3), "steps": [self._measure(index, queries, truth, vectors)]}
+    
+    def search(self, index, queries: np.ndarray, k: int, vectors=None, params=None):
+        """index.search, over-fetching and re-scoring exactly when the index stores lossy codes"""
+        if vectors is None or not is_quantized(index):
+            return index.search(queries, k, params=params)
+        _, shortlist = index.search(queries, min(index.ntotal, k * self.rerank_factor), params=params)
+        return rescore(queries, shortlist, vectors, k)
+    
+    def _measure(self, index, queries: np.ndarray, truth: np.ndarray, vectors) -> Dict[str, Any]:
+        start = time.perf_counter()
+        _, found = self.search(index, queries, truth.shape[1], vectors)
+        ms = (time.perf_counter() - start) * 1000 / len(queries)
+        hits = sum(len(set(row_found) & set(row_truth)) for row_found, row_truth in zip(found, truth))
+        return {"param": get_search_param(unwrap(index)),
+                "recall": round(hits / truth.size, 4), "ms_per_query": round(ms, 3)}
+    
+    def _nlist(self, n: int) -> int:
+        return self.nlist or max(1, int(4 * math.sqrt(n)))
+
+def rescore(queries: np.ndarray, shortlist: np.ndarray, vectors, k: int):
+    """Exact L2 over each query's shortlisted ids; returns (distances, ids) like Index.search"""
+    distances = np.full((len(queries), k), np.inf, dtype=np.float32)
+    ids = np.full((len(queries), k), -1, dtype=np.int64)
+    for row, (query, candidates) in enumerate(zip(queries, shortlist)):
+        # Sorted ids read the memory-mapped vectors front to back
+        candidates = np.sort(candidates[candidates >= 0])
+        if not len(candidates):
+            continue
+        exact = ((np.asarray(vectors[candidates]) - query) ** 2).sum(axis=1)
+        order = np.argsort(exact)[:k]
+        distances[row, :len(order)] = exact[order]
+        ids[row, :len(order)] = candidates[order]
+    return distances, ids
+
+def exact_search(queries: np.ndarray, ids: np.ndarray, vectors, k: int, chunk_size: int = 4096):
+    """Exact L2 over the given sorted ids, reading their vectors a chunk at a time; returns (distances, ids)
+    
+    Nothing is kept between searches: memory is one chunk of vectors plus a running top-k.
+    """
+    queries = np.asarray(queries, dtype=np.float32)
+    query_norms = (queries ** 2).sum(axis=1)[:, None]
+    distances = np.full((len(queries), k), np.inf, dtype=np.float32)
+    found = np.full((len(queries), k), -1, dtype=np.int64)
+    for start in range(0, len(ids), chunk_size):
+        chunk_ids = ids[start:start + chunk_size]
+        block = np.asarray(vectors[chunk_ids], dtype=np.float32)
+        # ||q - x||² = ||q||² + ||x||² - 2 q·x: one matrix product instead of a queries x chunk x d difference
+        exact = np.maximum(query_norms + (block ** 2).sum(axis=1)[None, :] - 2 * queries @ block.T, 0)
+        merged = np.concatenate([distances, exact], axis=1)
+        merged_ids = np.concatenate([found, np.broadcast_to(chunk_ids, exact.shape)], axis=1)
+        order = np.argsort(merged, axis=1, kind="stable")[:, :k]
+        distances = np.take_along_axis(merged, order, axis=1)
+        found = np.take_along_axis(merged_ids, order, axis=1)
+    return distances, np.where(np.isfinite(distances), found, -1)
+
+def new_index(d: int):
+    """Empty exact index that stores vectors under explicit ids"""
+    return faiss.IndexIDMap(faiss.IndexFlatL2(d))
+
+def unwrap(index):
+    """The index doing the search, under an IndexIDMap if there is one"""
+    base = faiss.downcast_index(index)
+    if isinstance(base, faiss.IndexIDMap):
+        return faiss.downcast_index(base.index)
+    return base
+
+def is_id_mapped(index) -> bool:
+    """Whether vectors are stored under explicit ids (older indexes numbered them by position)"""
+    return isinstance(faiss.downcast_index(index), (faiss.IndexIDMap, faiss.IndexIVF))
+
+def stored_ids(index) -> np.ndarray:
+    """Ids of the vectors in the index, in storage order"""
+    base = faiss.downcast_index(index)
+    if isinstance(base, faiss.IndexIDMap):
+        return faiss.vector_to_array(base.id_map).astype(np.int64)
+    if isinstance(base, faiss.IndexIVF):
+        invlists = base.invlists
+        lists = [faiss.rev_swig_ptr(invlists.get_ids(i), invlists.list_size(i)).copy()
+                 for i in range(base.nlist) if invlists.list_size(i)]
+        return np.concatenate(lists).astype(np.int64) if lists else np.zeros(0, dtype=np.int64)
+    return np.arange(index.ntotal, dtype=np.int64)
+
+def decode_vectors(index, count: int) -> np.ndarray:
+    """(count, d) vectors by id, decoded from the index (lossy if quantized; zeros for ids it lacks)"""
+    vectors = np.zeros((count, index.d), dtype=np.float32)
+    if index.ntotal == 0:
+        return vectors
+    ids = stored_ids(index)
+    base = faiss.downcast_index(index)
+    if isinstance(base, faiss.IndexIDMap):
+        rows = unwrap(index).reconstruct_n(0, index.ntotal)
+    elif isinstance(base, faiss.IndexIVF):
+        rows = index.reconstruct_batch(ids)
+    else:
+        rows = index.reconstruct_n(0, index.ntotal)
+    keep = ids < count
+    vectors[ids[keep]] = rows[keep]
+    return vectors
+
+def remove_ids(index, ids: np.ndarray):
+    """Copy of index without the given ids, or None if its type cannot remove vectors (HNSW)"""
+    index = faiss.clone_index(index)
+    ids = np.asarray(ids, dtype=np.int64)
+    if isinstance(faiss.downcast_index(index), faiss.IndexIVF):
+        # The id hashtable looks each one up directly, and only accepts a plain array of them
+        selector = faiss.IDSelectorArray(len(ids), faiss.swig_ptr(ids))
+    else:
+        selector = faiss.IDSelectorBatch(len(ids), faiss.swig_ptr(ids))
+    try:
+        index.remove_ids(selector)
+    except RuntimeError:
+        return None
+    return index
+
+def stage(index) -> int:
+    base = unwrap(index)
+    if isinstance(base, faiss.IndexIVF) and base.nlist == 1:
+        return QUANTIZED
+    if isinstance(base, (faiss.IndexHNSW, faiss.IndexIVF)):
+        return ANN
+    return QUANTIZED if is_quantized(base) else FLAT
+
+def is_flat(index) -> bool:
+    return isinstance(unwrap(index), faiss.IndexFlat)
+
+def is_quantized(index) -> bool:
+    """Whether the index stores lossy codes rather than the float32 vectors"""
+    base = unwrap(index)
+    if isinstance(base, faiss.IndexHNSW):
+        return not isinstance(faiss.downcast_index(base.storage), faiss.IndexFlat)
+    if isinstance(base, faiss.IndexIVF):
+        return not isinstance(base, faiss.IndexIVFFlat)
+    return not isinstance(base, faiss.IndexFlat)
+
+def bytes_per_vector(index) -> int:
+    base = unwrap(index)
+    if isinstance(base, faiss.IndexHNSW):
+        base = faiss.downcast_index(base.storage)
+    code_size = getattr(base, "code_size", None)
+    return int(code_size) if code_size is not None else 4 * index.d
+
+def get_search_param(index) -> int:
+    """efSearch for HNSW, nprobe for IVF (0 for flat indexes)"""
+    if isinstance(index, faiss.IndexHNSW):
+        return index.hnsw.efSearch
+    if isinstance(index, faiss.IndexIVF):
+        return index.nprobe
+    return 0
+
+def set_search_param(index, value: int):
+    if isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efSearch = value
+    elif isinstance(index, faiss.IndexIVF):
+        index.nprobe = value
+
+def search_parameters(index, selector=None):
+    """Search parameters of the right type for index (faiss rejects a mismatched type)"""
+    base = unwrap(index)
+    if isinstance(base, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=base.hnsw.efSearch)
+    if isinstance(base, faiss.IndexIVF):
+        return faiss.SearchParametersIVF(sel=selector, nprobe=base.nprobe)
+    return faiss.SearchParameters(sel=selector)
+
+def public_report(report: Dict[str, Any]) -> Dict[str, Any]:
+    """The report without the sample queries / ground truth arrays"""
+    return {key: value for key, value in report.items() if key not in ("queries", "truth")}
+
+ann_builder = AnnIndexBuilder()
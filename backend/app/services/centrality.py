@@ -0,0 +1,87 @@
+from collections import deque
+from typing import Dict, Any, List, Optional
+from ..core.config import settings
+
+class CentralityIndex:
+    """PageRank of knowledge graph nodes, kept up to date incrementally.
+    
+    Scores solve x(v) = (1 - d) + d * sum(x(u) / deg(u) for u ~ v), i.e. PageRank
+    scaled so the mean is 1; the scale does not depend on the node count, so adding
+    nodes leaves every other equation unchanged. Updates are residual pushes: after a
+    change only the equations of touched nodes and their neighbors are re-evaluated,
+    and mass is pushed from nodes whose residual exceeds the tolerance until none does.
+    Removals (whose former neighbors are not in the ops) re-evaluate every equation,
+    still starting from the previous scores.
+    
+    Scores live in G.centrality and are stored with the graph snapshot (see GraphStore).
+    """
+    
+    def __init__(self):
+        self.damping = settings.KG_CENTRALITY_DAMPING
+        self.tolerance = settings.KG_CENTRALITY_TOLERANCE
+    
+    def update(self, G, ops: Optional[List[tuple]] = None):
+        """Refresh G.centrality after ops were applied to G; None recomputes every node"""
+        if G.partial or (ops is not None and not ops and G.centrality):
+            return
+        
+        scores = G.centrality
+        if ops is None or not scores:
+            affected = list(G._adj)
+        else:
+            touched = {}
+            sweep = False
+            for op in ops:
+                if op[0] in ('remove_node', 'clear'):
+                    sweep = True
+                elif op[0] == 'add_node':
+                    touched[op[1]] = None
+                elif op[0] in ('add_edge', 'remove_edge'):
+                    touched[op[1]] = None
+                    touched[op[2]] = None
+            
+            if sweep:
+                for n in [n for n in scores if n not in G._adj]:
+                    del scores[n]
+            if sweep or len(touched) * 2 > len(G):
+                affected = list(G._adj)
+            else:
+                affected = {}
+                for n in touched:
+                    if n in G._adj:
+                        affected[n] = None
+                        affected.update(dict.fromkeys(G._adj[n]))
+        
+        residuals = {n: self._residual(G, scores, n) for n in affected}
+        self._push(G, scores, residuals)
+    
+    def score(self, G, node: Any) -> float:
+        # Nodes added to a view since the snapshot have no score yet: rank them as average
+        return G.centrality.get(node, 1.0)
+    
+    def _residual(self, G, scores: Dict[Any, float], n: Any) -> float:
+        adj = G._adj
+        incoming = sum(scores.get(u, 1.0) / len(adj[u]) for u in adj[n])
+        return (1 - self.damping) + self.damping * incoming - scores.get(n, 1.0)
+    
+    def _push(self, G, scores: Dict[Any, float], residuals: Dict[Any, float]):
+        adj = G._adj
+        queue = deque(n for n, r in residuals.items() if abs(r) > self.tolerance)
+        while queue:
+            n = queue.popleft()
+            r = residuals.pop(n, 0.0)
+            if abs(r) <= self.tolerance:
+                continue
+            scores[n] = scores.get(n, 1.0) + r
+            neighbors = adj[n]
+            if not neighbors:
+                continue
+            share = self.damping * r / len(neighbors)
+            for neighbor in neighbors:
+                before = residuals.get(neighbor, 0.0)
+                residuals[neighbor] = before + share
+                # Queue it when it crosses the tolerance; a node queued twice is skipped once settled
+                if abs(before) <= self.tolerance < abs(before + share):
+                    queue.append(neighbor)
+
+centrality_index = CentralityIndex()
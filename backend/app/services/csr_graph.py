@@ -0,0 +1,487 @@
+import json
+import mmap
+import struct
+import numpy as np
+from collections.abc import Mapping
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Iterator, Tuple
+
+CSR_MAGIC = b'KGCS'
+CSR_FORMAT = 2
+CSR_HEADER = struct.Struct('<4sIQ')
+MISSING = -1
+# Node attributes stored as string-table columns; everything else goes to the JSON sections
+STRING_COLUMNS = ('entity_text', 'entity_type', 'entity_value', 'file_id', 'doc_type')
+
+class CSRGraph:
+    """Immutable, memory-mapped snapshot of a knowledge graph.
+    
+    One file holds every array, so all worker processes map the same pages and opening
+    it costs no unpickling:
+    - strings: every distinct string (node ids, attribute values, relations), sorted, so
+      lookups are binary searches over the mapped bytes
+    - indptr / indices / relations: CSR adjacency (each row sorted) with relation codes
+    - one int32 column per STRING_COLUMNS attribute, pointing into the string table
+    - metadata rows (deduplicated) and any other attributes, as JSON decoded on access
+    - entity / file / doc_type indexes as (sorted key, node) arrays
+    - text: every distinct lowercased entity_text (sorted) with its nodes, and trigram:
+      every trigram of those texts (sorted) with the texts containing it, so substring
+      search intersects a few posting lists instead of scanning all text
+    
+    Nodes are the int positions of the node ids in sorted order; G.nodes[i]['node_id']
+    gives the id back. The read API mirrors what the query paths use on KnowledgeGraph
+    (nodes, _adj, neighbors, search_text, find_entities, file_nodes, doc_type_nodes,
+    centrality), so they run unchanged on either.
+    """
+    
+    partial = False
+    
+    def __init__(self, path: Path):
+        with open(path, 'rb') as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, header_size = CSR_HEADER.unpack_from(self.mm, 0)
+        if magic != CSR_MAGIC or version != CSR_FORMAT:
+            raise ValueError(f"Not a graph snapshot: {path}")
+        self.header = json.loads(self.mm[CSR_HEADER.size:CSR_HEADER.size + header_size])
+        data_start = -(-(CSR_HEADER.size + header_size) // 8) * 8
+        self.log_generation = self.header["log_generation"]
+        self.log_offset = self.header["log_offset"]
+        
+        self.sections: Dict[str, int] = {}
+        self.arrays: Dict[str, np.ndarray] = {}
+        for name, (dtype, offset, count) in self.header["arrays"].items():
+            self.sections[name] = data_start + offset
+            self.arrays[name] = np.frombuffer(self.mm, dtype=dtype, count=count, offset=data_start + offset)
+        
+        self.string_offsets = self.arrays["strings.offsets"]
+        self.indptr = self.arrays["indptr"]
+        self.indices = self.arrays["indices"]
+        self.relations = self.arrays["relations"]
+        self.node_ids = self.arrays["node_id"]
+        self.nodes = CSRNodes(self)
+        self._adj = CSRAdjacency(self)
+        self.centrality = CSRScores(self.arrays["centrality"])
+    
+    def __len__(self) -> int:
+        return len(self.node_ids)
+    
+    def __iter__(self) -> Iterator[int]:
+        return iter(range(len(self.node_ids)))
+    
+    def __contains__(self, n) -> bool:
+        return isinstance(n, (int, np.integer)) and 0 <= n < len(self.node_ids)
+    
+    def number_of_nodes(self) -> int:
+        return len(self.node_ids)
+    
+    def number_of_edges(self) -> int:
+        return self.header["edges"]
+    
+    def neighbors(self, n: int) -> Iterator[int]:
+        return iter(self._adj[n])
+    
+    def get_edge_data(self, u: int, v: int, default=None) -> Optional[Dict[str, Any]]:
+        neighbors = self._adj[u]
+        return neighbors[v] if v in neighbors else default
+    
+    def node_index(self, node_id: Any) -> Optional[int]:
+        sid = self.string_id(str(node_id))
+        if sid is None:
+            return None
+        i = int(np.searchsorted(self.node_ids, sid))
+        return i if i < len(self.node_ids) and self.node_ids[i] == sid else None
+    
+    def find_entities(self, key: Any) -> List[int]:
+        """Nodes whose entity_text / entity_value / alias equals key; node ids resolve too"""
+        nodes = self._lookup("entity", self.string_id(str(key)))
+        i = self.node_index(key)
+        return nodes + [i] if i is not None and i not in nodes else nodes
+    
+    def file_nodes(self, file_id: Any) -> List[int]:
+        sid = MISSING if file_id is None else self.string_id(str(file_id))
+        return self._lookup("file", sid)
+    
+    def doc_type_nodes(self, doc_type: str) -> Dict[int, None]:
+        return dict.fromkeys(self._lookup("doc_type", self.string_id(str(doc_type).lower())))
+    
+    def file_ids(self) -> List[str]:
+        keys = self.arrays["file.keys"]
+        return [self.string(sid) for sid in np.unique(keys[keys != MISSING]).tolist()]
+    
+    def search_text(self, query: str) -> Iterator[int]:
+        """Lazily yield nodes whose lowercased entity_text contains query.
+        
+        The posting lists of the query's trigrams are intersected and only the texts left
+        are checked; queries too short for trigrams scan the distinct texts instead.
+        """
+        query = query.lower()
+        needle = query.encode("utf-8")
+        grams = trigrams(query)
+        if grams:
+            indptr = self.arrays["trigram.indptr"]
+            postings = []
+            for gram in grams:
+                g = self._find_blob("trigram", gram.encode("utf-8"))
+                if g is None:
+                    return
+                postings.append(self.arrays["trigram.texts"][indptr[g]:indptr[g + 1]])
+            postings.sort(key=len)
+            candidates = postings[0]
+            for texts in postings[1:]:
+                candidates = np.intersect1d(candidates, texts, assume_unique=True)
+            matches = (t for t in candidates.tolist() if needle in self._blob_bytes("text", t))
+        else:
+            matches = self._scan_texts(needle)
+        
+        indptr, nodes = self.arrays["text.indptr"], self.arrays["text.nodes"]
+        for t in matches:
+            yield from nodes[indptr[t]:indptr[t + 1]].tolist()
+    
+    def string(self, sid: int) -> str:
+        return self._string_bytes(sid).decode("utf-8")
+    
+    def string_id(self, value: str) -> Optional[int]:
+        return self._find_blob("strings", value.encode("utf-8"))
+    
+    def json_value(self, section: str, index: int) -> Any:
+        offsets = self.arrays[f"{section}.offsets"]
+        base = self.sections[f"{section}.data"]
+        return json.loads(self.mm[base + int(offsets[index]):base + int(offsets[index + 1])])
+    
+    def _string_bytes(self, sid: int) -> bytes:
+        base = self.sections["strings.data"]
+        return self.mm[base + int(self.string_offsets[sid]):base + int(self.string_offsets[sid + 1])]
+    
+    def _blob_bytes(self, section: str, index: int) -> bytes:
+        offsets = self.arrays[f"{section}.offsets"]
+        base = self.sections[f"{section}.data"]
+        return self.mm[base + int(offsets[index]):base + int(offsets[index + 1])]
+    
+    def _find_blob(self, section: str, target: bytes) -> Optional[int]:
+        """Position of target in a sorted blob section (binary search over the mapped bytes)"""
+        lo, hi = 0, len(self.arrays[f"{section}.offsets"]) - 1
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._blob_bytes(section, mid) < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < len(self.arrays[f"{section}.offsets"]) - 1 and self._blob_bytes(section, lo) == target:
+            return lo
+        return None
+    
+    def _scan_texts(self, needle: bytes) -> Iterator[int]:
+        # Texts are stored back to back: a match running into the next text does not count
+        offsets = self.arrays["text.offsets"]
+        if not needle:
+            yield from range(len(offsets) - 1)
+            return
+        base = self.sections["text.data"]
+        start, end = base, base + int(offsets[-1])
+        while start < end:
+            pos = self.mm.find(needle, start, end)
+            if pos < 0:
+                return
+            t = int(np.searchsorted(offsets, pos - base, side='right')) - 1
+            if pos - base + len(needle) <= offsets[t + 1]:
+                yield t
+                start = base + int(offsets[t + 1])
+            else:
+                start = pos + 1
+    
+    def _lookup(self, index: str, sid: Optional[int]) -> List[int]:
+        if sid is None:
+            return []
+        keys = self.arrays[f"{index}.keys"]
+        lo, hi = np.searchsorted(keys, sid, side='left'), np.searchsorted(keys, sid, side='right')
+        return self.arrays[f"{index}.nodes"][lo:hi].tolist()
+    
+    @classmethod
+    def encode(cls, G, log_generation: int, log_offset: int) -> bytes:
+        """Serialize a KnowledgeGraph into the snapshot format"""
+        node_keys = sorted(G._adj, key=str)
+        position = {n: i for i, n in enumerate(node_keys)}
+        attrs = [G._node[n] for n in node_keys]
+        
+        # Collect every string first: ids must be positions in the sorted table
+        strings = {str(n) for n in node_keys}
+        entity_keys: List[List[str]] = []
+        for data in attrs:
+            for name in STRING_COLUMNS:
+                if data.get(name) is not None:
+                    strings.add(str(data[name]))
+            if data.get('doc_type') is not None:
+                strings.add(str(data['doc_type']).lower())
+            keys = G._index_keys(data)
+            strings.update(keys)
+            entity_keys.append(sorted(keys))
+        for u in node_keys:
+            for data in G._adj[u].values():
+                if data.get('relation') is not None:
+                    strings.add(str(data['relation']))
+        table = sorted(strings)
+        sid = {s: i for i, s in enumerate(table)}
+        
+        def column(values) -> np.ndarray:
+            return np.array([sid[str(v)] if v is not None else MISSING for v in values], dtype=np.int32)
+        
+        arrays: Dict[str, np.ndarray] = {}
+        arrays["strings.data"], arrays["strings.offsets"] = cls._blob(s.encode("utf-8") for s in table)
+        arrays["node_id"] = column(node_keys)
+        for name in STRING_COLUMNS:
+            arrays[name] = column(data.get(name) for data in attrs)
+        
+        # CSR adjacency, rows sorted so membership is a binary search
+        indptr, indices, relations = [0], [], []
+        for u in node_keys:
+            row = sorted((position[v], data.get('relation')) for v, data in G._adj[u].items())
+            indices.extend(v for v, _ in row)
+            relations.extend(sid[str(r)] if r is not None else MISSING for _, r in row)
+            indptr.append(len(indices))
+        arrays["indptr"] = np.array(indptr, dtype=np.int64)
+        arrays["indices"] = np.array(indices, dtype=np.int32)
+        arrays["relations"] = np.array(relations, dtype=np.int32)
+        arrays["centrality"] = np.array([G.centrality.get(n, 1.0) for n in node_keys], dtype=np.float32)
+        
+        # Metadata rows are shared by every node extracted from them: store each once
+        record_ids: Dict[int, int] = {}
+        records, node_records, extras, node_extras = [], [], [], []
+        for data in attrs:
+            record = data.get('metadata')
+            if record is None:
+                node_records.append(MISSING)
+            else:
+                if id(record) not in record_ids:
+                    record_ids[id(record)] = len(records)
+                    records.append(cls._json(record))
+                node_records.append(record_ids[id(record)])
+            rest = {k: v for k, v in data.items() if k not in STRING_COLUMNS and k != 'metadata'}
+            if rest:
+                node_extras.append(len(extras))
+                extras.append(cls._json(rest))
+            else:
+                node_extras.append(MISSING)
+        arrays["metadata.data"], arrays["metadata.offsets"] = cls._blob(records)
+        arrays["metadata"] = np.array(node_records, dtype=np.int32)
+        arrays["extras.data"], arrays["extras.offsets"] = cls._blob(extras)
+        arrays["extras"] = np.array(node_extras, dtype=np.int32)
+        
+        # (key, node) indexes, sorted by key
+        entity_pairs = [(sid[key], i) for i, keys in enumerate(entity_keys) for key in keys]
+        doc_types = [str(d['doc_type']).lower() if d.get('doc_type') is not None else None for d in attrs]
+        for name, pairs in (("entity", entity_pairs),
+                            ("file", [(v, i) for i, v in enumerate(arrays["file_id"].tolist())]),
+                            ("doc_type", [(sid[d], i) for i, d in enumerate(doc_types) if d is not None])):
+            pairs.sort()
+            arrays[f"{name}.keys"] = np.array([k for k, _ in pairs], dtype=np.int32)
+            arrays[f"{name}.nodes"] = np.array([n for _, n in pairs], dtype=np.int32)
+        
+        # Substring index: a text shared by many nodes is stored and posted once
+        texts = [G._text_key(data) for data in attrs]
+        distinct = sorted({text for text in texts if text is not None})
+        text_id = {text: t for t, text in enumerate(distinct)}
+        text_nodes: List[List[int]] = [[] for _ in distinct]
+        for i, text in enumerate(texts):
+            if text is not None:
+                text_nodes[text_id[text]].append(i)
+        arrays["text.data"], arrays["text.offsets"] = cls._blob(text.encode("utf-8") for text in distinct)
+        arrays["text.indptr"], arrays["text.nodes"] = cls._rows(text_nodes)
+        
+        postings: Dict[bytes, List[int]] = {}
+        for t, text in enumerate(distinct):
+            for gram in trigrams(text):
+                postings.setdefault(gram.encode("utf-8"), []).append(t)
+        grams = sorted(postings)
+        arrays["trigram.data"], arrays["trigram.offsets"] = cls._blob(grams)
+        arrays["trigram.indptr"], arrays["trigram.texts"] = cls._rows(postings[gram] for gram in grams)
+        
+        return cls._pack(arrays, {"log_generation": log_generation, "log_offset": log_offset,
+                                  "nodes": len(node_keys), "edges": G.number_of_edges()})
+    
+    @staticmethod
+    def _blob(items) -> Tuple[np.ndarray, np.ndarray]:
+        offsets, chunks, size = [0], [], 0
+        for item in items:
+            chunks.append(item)
+            size += len(item)
+            offsets.append(size)
+        return np.frombuffer(b''.join(chunks), dtype=np.uint8), np.array(offsets, dtype=np.int64)
+    
+    @staticmethod
+    def _rows(rows) -> Tuple[np.ndarray, np.ndarray]:
+        """Lists of ints as CSR (indptr, values)"""
+        indptr, values = [0], []
+        for row in rows:
+            values.extend(row)
+            indptr.append(len(values))
+        return np.array(indptr, dtype=np.int64), np.array(values, dtype=np.int32)
+    
+    @staticmethod
+    def _json(value: Any) -> bytes:
+        try:
+            return json.dumps(value, default=str).encode("utf-8")
+        except (TypeError, ValueError):
+            # e.g. non-string keys json cannot take as they are
+            return json.dumps({str(k): v for k, v in value.items()}, default=str).encode("utf-8")
+    
+    @staticmethod
+    def _pack(arrays: Dict[str, np.ndarray], header: Dict[str, Any]) -> bytes:
+        # Arrays are laid out 8-byte aligned after the header, so every one maps without a copy;
+        # offsets are relative to the aligned end of the header
+        layout = {}
+        offset = 0
+        for name, array in arrays.items():
+            layout[name] = [array.dtype.str, offset, len(array)]
+            offset += -(-array.nbytes // 8) * 8
+        header_bytes = json.dumps({**header, "arrays": layout}).encode("utf-8")
+        
+        parts = [CSR_HEADER.pack(CSR_MAGIC, CSR_FORMAT, len(header_bytes)), header_bytes,
+                 b'\0' * (-(CSR_HEADER.size + len(header_bytes)) % 8)]
+        for array in arrays.values():
+            data = array.tobytes()
+            parts.append(data)
+            parts.append(b'\0' * (-len(data) % 8))
+        return b''.join(parts)
+
+def trigrams(text: str) -> set:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+class CSRScores:
+    """Read-only node -> centrality mapping over the snapshot's score column"""
+    
+    def __init__(self, scores: np.ndarray):
+        self.scores = scores
+    
+    def get(self, n: int, default: float = None) -> Optional[float]:
+        return float(self.scores[n]) if 0 <= n < len(self.scores) else default
+
+class CSRNodes:
+    """G.nodes stand-in: G.nodes[i] for attributes, G.nodes(data=True) to iterate"""
+    
+    def __init__(self, graph: CSRGraph):
+        self.graph = graph
+    
+    def __call__(self, data: bool = False):
+        if data:
+            return ((i, CSRNodeAttrs(self.graph, i)) for i in range(len(self.graph)))
+        return iter(range(len(self.graph)))
+    
+    def __getitem__(self, n: int) -> "CSRNodeAttrs":
+        if n not in self.graph:
+            raise KeyError(n)
+        return CSRNodeAttrs(self.graph, n)
+    
+    def __iter__(self) -> Iterator[int]:
+        return iter(self.graph)
+    
+    def __len__(self) -> int:
+        return len(self.graph)
+    
+    def __contains__(self, n) -> bool:
+        return n in self.graph
+
+class CSRNodeAttrs(Mapping):
+    """One node's attributes, decoded from the mapped columns on access"""
+    
+    __slots__ = ('graph', 'n')
+    
+    def __init__(self, graph: CSRGraph, n: int):
+        self.graph = graph
+        self.n = n
+    
+    def __getitem__(self, key: str) -> Any:
+        arrays = self.graph.arrays
+        if key in STRING_COLUMNS:
+            sid = arrays[key][self.n]
+            if sid != MISSING:
+                return self.graph.string(int(sid))
+        elif key == 'node_id':
+            return self.graph.string(int(arrays['node_id'][self.n]))
+        elif key == 'metadata':
+            rid = arrays['metadata'][self.n]
+            if rid != MISSING:
+                return self.graph.json_value('metadata', int(rid))
+        else:
+            extras = self._extras()
+            if key in extras:
+                return extras[key]
+        raise KeyError(key)
+    
+    def __iter__(self) -> Iterator[str]:
+        arrays = self.graph.arrays
+        for name in STRING_COLUMNS:
+            if arrays[name][self.n] != MISSING:
+                yield name
+        if arrays['metadata'][self.n] != MISSING:
+            yield 'metadata'
+        yield from self._extras()
+    
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+    
+    def __repr__(self) -> str:
+        return repr(dict(self))
+    
+    def _extras(self) -> Dict[str, Any]:
+        eid = self.graph.arrays['extras'][self.n]
+        return self.graph.json_value('extras', int(eid)) if eid != MISSING else {}
+
+class CSRAdjacency(Mapping):
+    """G._adj stand-in: G._adj[i] is the row of node i"""
+    
+    def __init__(self, graph: CSRGraph):
+        self.graph = graph
+    
+    def __getitem__(self, n: int) -> "CSRNeighbors":
+        if n not in self.graph:
+            raise KeyError(n)
+        return CSRNeighbors(self.graph, int(self.graph.indptr[n]), int(self.graph.indptr[n + 1]))
+    
+    def __iter__(self) -> Iterator[int]:
+        return iter(self.graph)
+    
+    def __len__(self) -> int:
+        return len(self.graph)
+    
+    def __contains__(self, n) -> bool:
+        return n in self.graph
+
+class CSRNeighbors(Mapping):
+    """neighbor -> edge attributes for one CSR row"""
+    
+    __slots__ = ('graph', 'start', 'end')
+    
+    def __init__(self, graph: CSRGraph, start: int, end: int):
+        self.graph = graph
+        self.start = start
+        self.end = end
+    
+    def __getitem__(self, v: int) -> Dict[str, Any]:
+        i = self._find(v)
+        if i is None:
+            raise KeyError(v)
+        return self._edge_data(i)
+    
+    def __contains__(self, v) -> bool:
+        return self._find(v) is not None
+    
+    def __iter__(self) -> Iterator[int]:
+        return iter(self.graph.indices[self.start:self.end].tolist())
+    
+    def __len__(self) -> int:
+        return self.end - self.start
+    
+    def items(self):
+        neighbors = self.graph.indices[self.start:self.end].tolist()
+        return ((v, self._edge_data(self.start + k)) for k, v in enumerate(neighbors))
+    
+    def _find(self, v) -> Optional[int]:
+        if not isinstance(v, (int, np.integer)):
+            return None
+        row = self.graph.indices[self.start:self.end]
+        k = int(np.searchsorted(row, v))
+        return self.start + k if k < len(row) and row[k] == v else None
+    
+    def _edge_data(self, i: int) -> Dict[str, Any]:
+        code = self.graph.relations[i]
+        return {'relation': self.graph.string(int(code))} if code != MISSING else {}
@@ -1,19 +1,10 @@
-from openai import OpenAI
 from typing import Dict, Any
 import json
-from ..core.config import settings
+from .llm_gateway import llm_gateway
 
 class DocTypeDetector:
     def __init__(self):
-        try:
-            self.client = OpenAI(
-                api_key=settings.OPENROUTER_API_KEY,
-                base_url=settings.OPENROUTER_BASE_URL
-            )
-            self.enabled = True
-        except:
-            self.client = None
-            self.enabled = False
+        self.enabled = llm_gateway.enabled
     
     def detect_type(self, content: str) -> Dict[str, Any]:
         if not self.enabled or not content.strip():
@@ -37,8 +28,7 @@ Return JSON:
 }}"""
         
         try:
-            response = self.client.chat.completions.create(
-                model=settings.LLM_MODEL,
+            content = llm_gateway.complete(
                 messages=[
                     {"role": "system", "content": "You are a document classification expert. Return valid JSON only."},
                     {"role": "user", "content": prompt}
@@ -46,7 +36,7 @@ Return JSON:
                 temperature=0.1
             )
             
-            result = json.loads(response.choices[0].message.content)
+            result = json.loads(content)
             return result
         except Exception as e:
             print(f"Doc type detection error: {e}")
@@ -0,0 +1,36 @@
+import hashlib
+import numpy as np
+from typing import List, Tuple
+from ..core.config import settings
+from .sqlite_cache import SQLiteLRUCache
+
+class EmbeddingCache(SQLiteLRUCache):
+    """Disk-backed, size-bounded LRU cache of chunk embeddings keyed by (model, chunk hash)"""
+    
+    table = "embeddings"
+    tags = ("model",)
+    tag_index = "idx_embeddings_model"
+    value_column = "vector"
+    value_type = "BLOB"
+    
+    def __init__(self, db_path: str = "storage/cache/embeddings.db", max_bytes: int = None):
+        super().__init__(db_path, max_bytes or settings.EMBED_CACHE_MAX_MB * 1024 * 1024)
+    
+    @staticmethod
+    def make_key(chunk: str, model: str) -> str:
+        return hashlib.sha256(f"{model}\0{chunk}".encode("utf-8")).hexdigest()
+    
+    def encode(self, vector: np.ndarray) -> bytes:
+        return np.asarray(vector, dtype=np.float32).tobytes()
+    
+    def decode(self, stored: bytes) -> np.ndarray:
+        return np.frombuffer(stored, dtype=np.float32)
+    
+    def put_many(self, entries: List[Tuple[str, np.ndarray]], model: str):
+        self._put_many(entries, (model,))
+    
+    def invalidate(self, model: str = None) -> int:
+        """Remove entries for a model (everything if not given)"""
+        return self._invalidate(model=model)
+
+embedding_cache = EmbeddingCache()
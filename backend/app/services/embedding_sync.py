@@ -0,0 +1,198 @@
+import json
+import os
+import numpy as np
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Set, Tuple
+from .supabase_client import supabase_client
+from .write_behind import WriteBehindSync
+
+class EmbeddingSync(WriteBehindSync):
+    """Write-behind sync of chunk embeddings to the Supabase embeddings table.
+    
+    A user's documents are append-only, indexed by chunk id (deleted ones become
+    None), so a per-user high-water mark (persisted in storage/{user}.sync) says how
+    many ids have been pushed. Saves queue only the rows past it, with the vectors read from the
+    user's stored float32 vectors instead of re-encoded; the background worker (see
+    WriteBehindSync) upserts them in batches of SUPABASE_SYNC_BATCH_SIZE on
+    (user_id, chunk_id) and advances the mark after each batch, so a restart resends
+    at most one batch and resending never duplicates rows.
+    
+    Deleted chunks are queued by id with remove(): they are dropped from what is still
+    pending and deleted from Supabase before the next upserts. The ids still to delete
+    are kept in the .sync file too, and start() queues them again after a restart.
+    """
+    
+    thread_name = "embedding-sync"
+    label = "Supabase embedding sync"
+    
+    def __init__(self, storage_dir: str = "storage"):
+        super().__init__()
+        self.storage_dir = Path(storage_dir)
+        # user_id -> rows (position, row) not pushed yet, in position order
+        self.pending: Dict[str, List[Tuple[int, Dict[str, Any]]]] = {}
+        # user_id -> chunk ids to delete from Supabase
+        self.removed: Dict[str, Set[int]] = {}
+        # user_id -> number of documents queued or pushed
+        self.queued: Dict[str, int] = {}
+        self.replayed = False
+    
+    def mark_path(self, user_id: str) -> Path:
+        return self.storage_dir / f"{user_id}.sync"
+    
+    def start(self):
+        if not self.replayed and supabase_client.enabled:
+            self.replayed = True
+            self._replay_removed()
+        super().start()
+    
+    def mark(self, user_id: str, vectors, documents: List[Dict[str, Any]]):
+        """Queue the documents added since the last save (call with the writer lock held)"""
+        if not supabase_client.enabled or vectors is None:
+            return
+        
+        with self.lock:
+            start = self.queued.get(user_id)
+            if start is None:
+                start = self._read_mark(user_id)
+            self.queued[user_id] = len(documents)
+        if start == len(documents):
+            return
+        
+        # Rows are built here, on the saving thread, so the worker never reads an index being mutated
+        vectors = np.asarray(vectors[start:len(documents)])
+        rows = [(start + i, self._row(user_id, start + i, doc, vector))
+                for i, (doc, vector) in enumerate(zip(documents[start:], vectors)) if doc is not None]
+        if not rows:
+            return
+        with self.lock:
+            self.pending.setdefault(user_id, []).extend(rows)
+        
+        self._notify()
+    
+    def remove(self, user_id: str, chunk_ids: List[int]):
+        """Queue deleted chunks for deletion from Supabase, dropping any still waiting to be pushed"""
+        if not supabase_client.enabled or not chunk_ids:
+            return
+        ids = set(chunk_ids)
+        with self.lock:
+            rows = self.pending.get(user_id)
+            if rows:
+                # In place: a push in flight checks it still holds the same list
+                rows[:] = [row for row in rows if row[0] not in ids]
+            self.removed.setdefault(user_id, set()).update(ids)
+            # Persisted before returning: the worker may not get to them before a restart
+            self._write_mark(user_id)
+        self._notify()
+    
+    def renumber(self, user_id: str, count: int, previous: int):
+        """The user's chunks were renumbered 0..count-1 (from previous ids): resend every row
+        from the next save and delete the ids past the new end (call with the writer lock held)"""
+        if not supabase_client.enabled:
+            return
+        with self.lock:
+            self.pending.pop(user_id, None)
+            self.queued.pop(user_id, None)
+            self._write_mark(user_id, 0)
+        self.remove(user_id, list(range(count, previous)))
+    
+    def discard(self, user_id: str):
+        with self.lock:
+            self.pending.pop(user_id, None)
+            self.removed.pop(user_id, None)
+            self.queued.pop(user_id, None)
+            self.mark_path(user_id).unlink(missing_ok=True)
+    
+    def _pending_users(self) -> List[str]:
+        return list(dict.fromkeys([*self.pending, *self.removed]))
+    
+    def _pending_rows(self) -> int:
+        return sum(len(rows) for rows in self.pending.values()) + sum(len(ids) for ids in self.removed.values())
+    
+    def _push(self, user_id: str):
+        # Deletes go first, after any upsert of the same chunks that was already in flight
+        with self.lock:
+            removed = sorted(self.removed.pop(user_id, ()))
+        deleted = 0
+        try:
+            for batch in self._batches(removed):
+                self._with_retry(lambda: supabase_client.client.table('embeddings').delete()
+                                 .eq('user_id', user_id).in_('chunk_id', batch).execute())
+                deleted += len(batch)
+        finally:
+            with self.lock:
+                if deleted < len(removed):
+                    self.removed.setdefault(user_id, set()).update(removed[deleted:])
+                if removed and self.mark_path(user_id).exists():
+                    self._write_mark(user_id)
+        
+        pushed = 0
+        while True:
+            with self.lock:
+                rows = self.pending.get(user_id)
+                if not rows:
+                    self.pending.pop(user_id, None)
+                    break
+                batch = rows[:self.batch_size]
+            
+            self._with_retry(lambda: supabase_client.client.table('embeddings')
+                             .upsert([row for _, row in batch], on_conflict='user_id,chunk_id').execute())
+            
+            with self.lock:
+                # Skip the mark update if the user was discarded or reset while we were pushing
+                if self.pending.get(user_id) is rows:
+                    last = batch[-1][0]
+                    done = 0
+                    while done < len(rows) and rows[done][0] <= last:
+                        done += 1
+                    del rows[:done]
+                    self._write_mark(user_id, last + 1)
+            pushed += len(batch)
+            self.synced_rows += len(batch)
+        
+        if pushed or deleted:
+            print(f"✅ Synced {pushed} embeddings to Supabase for {user_id} ({deleted} deleted)")
+    
+    def _replay_removed(self):
+        """Queue the deletes a previous run persisted but did not push"""
+        for path in self.storage_dir.glob("*.sync"):
+            removed = self._read_state(path).get("removed")
+            if removed:
+                with self.lock:
+                    self.removed.setdefault(path.stem, set()).update(int(i) for i in removed)
+    
+    def _read_state(self, path: Path) -> Dict[str, Any]:
+        try:
+            with open(path) as f:
+                state = json.load(f)
+            return state if isinstance(state, dict) else {}
+        except (FileNotFoundError, ValueError):
+            return {}
+    
+    def _read_mark(self, user_id: str) -> int:
+        try:
+            return int(self._read_state(self.mark_path(user_id))["synced"])
+        except (KeyError, TypeError, ValueError):
+            return 0
+    
+    def _write_mark(self, user_id: str, synced: Optional[int] = None):
+        """Persist the high-water mark (unchanged when None) and the chunk ids still to delete
+        (call with self.lock held)"""
+        if synced is None:
+            synced = self._read_mark(user_id)
+        path = self.mark_path(user_id)
+        tmp = path.with_suffix(".sync.tmp")
+        with open(tmp, 'w') as f:
+            json.dump({"synced": synced, "removed": sorted(self.removed.get(user_id, ()))}, f)
+        os.replace(tmp, path)
+    
+    def _row(self, user_id: str, position: int, doc: Dict[str, Any], vector) -> Dict[str, Any]:
+        return {
+            'user_id': user_id,
+            'chunk_id': position,
+            'file_id': doc.get('file_id'),
+            'content': doc.get('content', ''),
+            'chunk': doc['chunk'],
+            'embedding': vector.tolist()
+        }
+
+embedding_sync = EmbeddingSync()
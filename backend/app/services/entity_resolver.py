@@ -0,0 +1,192 @@
+import random
+import re
+import unicodedata
+import zlib
+import numpy as np
+from typing import Dict, Any, Optional, Iterable, Tuple
+from ..core.config import settings
+
+# Mersenne prime 2^31 - 1: a * x + b stays below 2^63 for 32-bit shingle hashes
+PRIME = (1 << 31) - 1
+
+class MinHashLSH:
+    """Banded MinHash buckets over character trigrams of normalized entity names.
+    
+    Names sharing any band of their signature land in the same bucket, so a lookup
+    only touches names likely to be similar instead of every node of the type.
+    """
+    
+    def __init__(self, bands: int, rows: int):
+        self.bands = bands
+        self.rows = rows
+        # Fixed seed: signatures must agree across processes and rebuilds
+        rng = random.Random(17)
+        perms = bands * rows
+        self.a = np.array([rng.randrange(1, PRIME) for _ in range(perms)], dtype=np.uint64)
+        self.b = np.array([rng.randrange(0, PRIME) for _ in range(perms)], dtype=np.uint64)
+        self.buckets: Dict[tuple, Dict[Any, None]] = {}
+    
+    def signature(self, shingles: set) -> np.ndarray:
+        x = np.array([zlib.crc32(s.encode("utf-8")) for s in shingles], dtype=np.uint64)
+        return ((self.a[:, None] * x[None, :] + self.b[:, None]) % PRIME).min(axis=1)
+    
+    def insert(self, prefix: Any, signature: np.ndarray, node: Any):
+        for key in self._band_keys(prefix, signature):
+            self.buckets.setdefault(key, {})[node] = None
+    
+    def candidates(self, prefix: Any, signature: np.ndarray) -> Dict[Any, None]:
+        found = {}
+        for key in self._band_keys(prefix, signature):
+            for node in self.buckets.get(key, ()):
+                found[node] = None
+        return found
+    
+    def _band_keys(self, prefix: Any, signature: np.ndarray) -> Iterable[tuple]:
+        for band in range(self.bands):
+            yield (prefix, band, signature[band * self.rows:(band + 1) * self.rows].tobytes())
+
+class ResolutionIndex:
+    """Canonical nodes of one graph, blocked by file_id and entity type"""
+    
+    def __init__(self, G, bands: int, rows: int):
+        self.graph = G
+        self.lsh = MinHashLSH(bands, rows)
+        # ((file_id, entity_type), normalized name) -> canonical node, for exact matches and names with digits
+        self.exact: Dict[tuple, Any] = {}
+        self.shingles: Dict[Any, set] = {}
+
+class EntityResolver:
+    """Merges near-duplicate entity nodes ("Alpha Co", "Alpha Co.", "ALPHA CO").
+    
+    Runs on the nodes added since the last save only: each is looked up in a per-graph
+    LSH index of canonical nodes of the same entity_type and, when a candidate's
+    trigram Jaccard similarity reaches KG_ER_THRESHOLD (or the normalized names are
+    equal), merged into it: edges move to the canonical node, the duplicate's text is
+    kept in its `aliases` and the duplicate is removed. Names containing digits (ids,
+    amounts, dates) only merge on equal normalized names.
+    
+    Only nodes of the same file merge: a node is stored in its file's shard and
+    deleted with that file (remove_file_nodes), so a canonical node standing for
+    several files would lose the others' entities with it, or keep the deleted one's.
+    
+    The index is derived data, built from the graph on first use in a process.
+    """
+    
+    def __init__(self):
+        self.enabled = settings.KG_ENTITY_RESOLUTION
+        self.bands = settings.KG_ER_BANDS
+        self.rows = settings.KG_ER_ROWS
+        self.threshold = settings.KG_ER_THRESHOLD
+        self.indexes: Dict[str, ResolutionIndex] = {}
+    
+    def resolve(self, user_id: str, G, nodes: Iterable[Any]) -> int:
+        """Merge each of nodes into a matching canonical node; returns the number merged"""
+        if not self.enabled or G.partial:
+            return 0
+        
+        index = self.indexes.get(user_id)
+        if index is None or index.graph is not G:
+            index = self.indexes[user_id] = self._build_index(G)
+        
+        merged = 0
+        for node in dict.fromkeys(nodes):
+            if node not in G:
+                continue
+            key = self._key(G.nodes[node])
+            if key is None:
+                continue
+            
+            canonical = self._match(G, index, node, key)
+            if canonical is None:
+                self._insert(index, node, key)
+            else:
+                self._merge(G, canonical, node)
+                merged += 1
+        
+        if merged:
+            print(f"🔗 Merged {merged} duplicate entities for {user_id}")
+        return merged
+    
+    def discard(self, user_id: str):
+        self.indexes.pop(user_id, None)
+    
+    def _build_index(self, G) -> ResolutionIndex:
+        index = ResolutionIndex(G, self.bands, self.rows)
+        for node, data in G.nodes(data=True):
+            key = self._key(data)
+            if key is not None and key not in index.exact:
+                self._insert(index, node, key)
+        return index
+    
+    def _match(self, G, index: ResolutionIndex, node: Any, key: Tuple[tuple, str]) -> Optional[Any]:
+        exact = index.exact.get(key)
+        if exact is not None and exact != node and self._is_live(G, exact, key[0]):
+            return exact
+        block, name = key
+        if any(ch.isdigit() for ch in name):
+            return None
+        
+        shingles = self._shingles(name)
+        best, best_rank = None, None
+        for candidate in index.lsh.candidates(block, index.lsh.signature(shingles)):
+            if candidate == node or not self._is_live(G, candidate, block):
+                continue
+            other = index.shingles[candidate]
+            score = len(shingles & other) / len(shingles | other)
+            if score < self.threshold:
+                continue
+            # Ties go to the better connected node, then the node id, so merges are deterministic
+            rank = (score, len(G._adj[candidate]), str(candidate))
+            if best_rank is None or rank > best_rank:
+                best, best_rank = candidate, rank
+        return best
+    
+    def _insert(self, index: ResolutionIndex, node: Any, key: Tuple[tuple, str]):
+        block, name = key
+        index.exact[key] = node
+        if not any(ch.isdigit() for ch in name):
+            shingles = index.shingles[node] = self._shingles(name)
+            index.lsh.insert(block, index.lsh.signature(shingles), node)
+    
+    def _merge(self, G, canonical: Any, duplicate: Any):
+        for neighbor, data in list(G._adj[duplicate].items()):
+            if neighbor != canonical and neighbor not in G._adj[canonical]:
+                G.add_edge(canonical, neighbor, **data)
+        
+        canonical_text = G.nodes[canonical].get('entity_text')
+        aliases = list(G.nodes[canonical].get('aliases') or ())
+        duplicate_data = G.nodes[duplicate]
+        for text in [duplicate_data.get('entity_text')] + list(duplicate_data.get('aliases') or ()):
+            if text is not None and text != canonical_text and text not in aliases:
+                aliases.append(text)
+        
+        G.remove_node(duplicate)
+        G.add_node(canonical, aliases=aliases)
+    
+    def _is_live(self, G, node: Any, block: tuple) -> bool:
+        # Index entries are never removed; nodes deleted, merged or re-added by another file since are skipped here
+        return node in G and self._block(G.nodes[node]) == block
+    
+    def _key(self, data) -> Optional[Tuple[tuple, str]]:
+        text = data.get('entity_text')
+        if text is None:
+            return None
+        name = self._normalize(text)
+        if not name:
+            return None
+        return self._block(data), name
+    
+    def _block(self, data) -> tuple:
+        return data.get('file_id'), str(data.get('entity_type', '')).upper()
+    
+    def _normalize(self, text: Any) -> str:
+        text = unicodedata.normalize('NFKD', str(text)).lower()
+        text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+        text = re.sub(r'[^\w\s]', ' ', text)
+        return ' '.join(text.split())
+    
+    def _shingles(self, name: str) -> set:
+        padded = f" {name} "
+        return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+entity_resolver = EntityResolver()
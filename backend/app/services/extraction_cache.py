@@ -0,0 +1,41 @@
+import hashlib
+import json
+from typing import Dict, Any, List, Optional, Tuple
+from ..core.config import settings
+from .sqlite_cache import SQLiteLRUCache
+
+class ExtractionCache(SQLiteLRUCache):
+    """Disk-backed, size-bounded LRU cache for LLM extraction results"""
+    
+    table = "extractions"
+    tags = ("model", "prompt_version")
+    tag_index = "idx_extractions_version"
+    
+    def __init__(self, db_path: str = "storage/cache/extractions.db", max_bytes: int = None):
+        super().__init__(db_path, max_bytes or settings.LLM_CACHE_MAX_MB * 1024 * 1024)
+    
+    @staticmethod
+    def make_key(content: str, doc_type: str, model: str, prompt_version: str) -> str:
+        payload = json.dumps([content, doc_type, model, prompt_version], ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+    
+    def encode(self, value: Dict[str, Any]) -> str:
+        return json.dumps(value, ensure_ascii=False, default=str)
+    
+    def decode(self, stored: str) -> Dict[str, Any]:
+        return json.loads(stored)
+    
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        return self.get_many([key]).get(key)
+    
+    def put(self, key: str, model: str, prompt_version: str, value: Dict[str, Any]):
+        self.put_many([(key, value)], model, prompt_version)
+    
+    def put_many(self, entries: List[Tuple[str, Dict[str, Any]]], model: str, prompt_version: str):
+        self._put_many(entries, (model, prompt_version))
+    
+    def invalidate(self, model: str = None, prompt_version: str = None) -> int:
+        """Remove entries for a model and/or prompt version (everything if neither is given)"""
+        return self._invalidate(model=model, prompt_version=prompt_version)
+
+extraction_cache = ExtractionCache()
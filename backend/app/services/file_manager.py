@@ -1,11 +1,15 @@
 import hashlib
+import os
+import tempfile
 from pathlib import Path
 from fastapi import UploadFile, HTTPException
 from typing import Dict, Any, Optional
 import json
+from ..core.config import settings
 
 ALLOWED_EXTENSIONS = {'.csv', '.xlsx', '.docx', '.pdf', '.json', '.txt'}
-MAX_FILE_SIZE = 50 * 1024 * 1024
+MAX_FILE_SIZE = settings.MAX_UPLOAD_SIZE_MB * 1024 * 1024
+UPLOAD_CHUNK_SIZE = 1024 * 1024
 
 class FileManager:
     def __init__(self):
@@ -41,28 +45,43 @@ class FileManager:
     
     async def save_file(self, file: UploadFile, user_id: str) -> Dict[str, Any]:
         self.validate_file(file)
-        content = await file.read()
         
-        if len(content) > MAX_FILE_SIZE:
-            raise HTTPException(400, "File too large")
+        # Stream to a temp file in the upload dir so the final rename stays atomic
+        hasher = hashlib.sha256()
+        size = 0
+        fd, temp_name = tempfile.mkstemp(dir=self.upload_dir, prefix=".upload_", suffix=".part")
+        temp_path = Path(temp_name)
         
-        file_hash = self.get_file_hash(content)
-        
-        # Check for duplicate
-        existing = self.check_duplicate(file_hash, user_id)
-        if existing:
-            raise HTTPException(409, f"File already uploaded: {existing['filename']}")
-        
-        file_path = self.upload_dir / f"{user_id}_{file_hash}{Path(file.filename).suffix}"
-        
-        with open(file_path, "wb") as f:
-            f.write(content)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                while True:
+                    chunk = await file.read(UPLOAD_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    if size > MAX_FILE_SIZE:
+                        raise HTTPException(400, "File too large")
+                    hasher.update(chunk)
+                    f.write(chunk)
+            
+            file_hash = hasher.hexdigest()
+            
+            # Check for duplicate
+            existing = self.check_duplicate(file_hash, user_id)
+            if existing:
+                raise HTTPException(409, f"File already uploaded: {existing['filename']}")
+            
+            file_path = self.upload_dir / f"{user_id}_{file_hash}{Path(file.filename).suffix}"
+            os.replace(temp_path, file_path)
+        except BaseException:
+            temp_path.unlink(missing_ok=True)
+            raise
         
         file_info = {
             "file_id": file_hash,
             "filename": file.filename,
             "path": str(file_path),
-            "size": len(content),
+            "size": size,
             "hash": file_hash,
             "user_id": user_id
         }
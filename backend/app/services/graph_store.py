@@ -0,0 +1,596 @@
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import struct
+import threading
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Tuple, Iterable
+from ..core.config import settings
+from .knowledge_graph import KnowledgeGraph
+from .centrality import centrality_index
+from .csr_graph import CSRGraph
+from .user_locks import user_locks
+
+LOG_MAGIC = b'KGLG'
+LOG_HEADER = struct.Struct('<4sI')
+FRAME_HEADER = struct.Struct('<I')
+
+class GraphStore:
+    """Sharded snapshot + append-only delta log persistence for per-user knowledge graphs.
+    
+    The snapshot lives in {user}/: one shard per file_id holding that file's nodes and
+    the edges between them, a cross shard for edges spanning files, and manifest.json
+    listing the shards (with their doc_types) and the log position they cover.
+    {user}.log holds the node/edge ops applied since. Saving only appends the ops
+    drained from the graph's journal, so it costs O(delta).
+    
+    Every save appends one frame (length + pickled op list), so a crash mid-write loses
+    at most that save. Readers stop at the last complete frame; only a writer (holding
+    user_locks.writer) truncates a torn one, before its own append. Once the log outgrows the snapshot it is compacted: only shards
+    of files touched since the last compaction are rewritten, and the manifest swap is
+    the commit point. Each log starts with a generation number and the manifest records
+    the (generation, offset) it covers, so a crash at any point replays exactly the ops
+    the snapshot is missing. The cross shard also carries the graph's centrality scores.
+    
+    load() builds the full graph; load_view() builds a partial graph from just the shards
+    a request needs, through an LRU cache of decoded shards.
+    
+    Readers never see a graph being written: publish_snapshot() writes an immutable
+    memory-mapped CSR copy of a saved graph, which open_snapshot() maps lock-free (once
+    per process, shared pages across processes) until the next publish replaces it.
+    Snapshots carry the log position they cover and never replace a newer one.
+    rebuild_snapshot() publishes from disk instead, for writers holding only a view.
+    A publish whose log position the current snapshot already covers does nothing, so
+    several worker processes asked to publish the same graph encode it once.
+    """
+    
+    def __init__(self, storage_dir: str = "storage/graphs"):
+        self.storage_dir = Path(storage_dir)
+        self.storage_dir.mkdir(parents=True, exist_ok=True)
+        self.compact_min_bytes = settings.KG_LOG_COMPACT_MIN_MB * 1024 * 1024
+        self.cache_size = settings.KG_SHARD_CACHE_SIZE
+        self.locks: Dict[str, threading.Lock] = {}
+        self.compacting = set()
+        self.guard = threading.Lock()
+        self.shard_cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.cache_lock = threading.Lock()
+        # user_id -> (file identity, mapped snapshot) for this process
+        self.snapshots: Dict[str, Tuple[tuple, CSRGraph]] = {}
+        # user_id -> (log inode, generation, offset) up to which this process knows the log is whole
+        self.log_ends: Dict[str, Tuple[int, int, int]] = {}
+    
+    def user_dir(self, user_id: str) -> Path:
+        return self.storage_dir / user_id
+    
+    def manifest_path(self, user_id: str) -> Path:
+        return self.user_dir(user_id) / "manifest.json"
+    
+    def legacy_path(self, user_id: str) -> Path:
+        # Single-pickle snapshot written before sharding
+        return self.storage_dir / f"{user_id}.pkl"
+    
+    def log_path(self, user_id: str) -> Path:
+        return self.storage_dir / f"{user_id}.log"
+    
+    def snapshot_path(self, user_id: str) -> Path:
+        # Read-only CSR snapshot shared by all worker processes (see CSRGraph)
+        return self.user_dir(user_id) / "graph.kgc"
+    
+    def _lock(self, user_id: str) -> threading.Lock:
+        with self.guard:
+            return self.locks.setdefault(user_id, threading.Lock())
+    
+    def exists(self, user_id: str) -> bool:
+        return (self.manifest_path(user_id).exists() or self.legacy_path(user_id).exists()
+                or self.log_path(user_id).exists())
+    
+    def load(self, user_id: str) -> Optional[KnowledgeGraph]:
+        # Under the lock so a concurrent compaction cannot swap the manifest mid-load
+        with self._lock(user_id):
+            return self._load_locked(user_id)
+    
+    def _load_locked(self, user_id: str) -> Optional[KnowledgeGraph]:
+        if not self.exists(user_id):
+            return None
+        manifest = self._read_manifest(user_id)
+        legacy_path = self.legacy_path(user_id)
+        log_path = self.log_path(user_id)
+        
+        generation, offset = 0, 0
+        G = KnowledgeGraph()
+        G.journal = None
+        if manifest is not None:
+            generation, offset = manifest["log_generation"], manifest["log_offset"]
+            # Full loads bypass the shard cache so the graph is not held twice
+            for entry in manifest["shards"].values():
+                shard = self._read_shard(user_id, entry["path"])
+                G.add_nodes_from(shard["nodes"])
+                G.add_edges_from(shard["edges"])
+            if manifest.get("cross"):
+                cross = self._read_shard(user_id, manifest["cross"])
+                G.add_edges_from(e for e in cross["edges"] if e[0] in G and e[1] in G)
+                G.centrality = cross.get("centrality", {})
+            G.dirty_files = set()
+        elif legacy_path.exists():
+            with open(legacy_path, 'rb') as f:
+                snapshot = pickle.load(f)
+            if isinstance(snapshot, dict) and "graph" in snapshot:
+                G = KnowledgeGraph.from_graph(snapshot["graph"])
+                generation, offset = snapshot["log_generation"], snapshot["log_offset"]
+            else:
+                # Snapshot written before the delta log existed
+                G = KnowledgeGraph.from_graph(snapshot)
+            # No shards on disk yet: the first compaction writes all of them
+            G.dirty_files = None
+        
+        ops = self._read_log(log_path, generation, offset)
+        G.apply(ops)
+        G.journal = []
+        
+        # Snapshot scores plus a local update for the replayed ops (a full pass if none were stored)
+        centrality_index.update(G, ops)
+        
+        if ops:
+            print(f"📂 Loaded graph for {user_id}: snapshot + {len(ops)} logged ops")
+        return G
+    
+    def load_view(self, user_id: str, file_ids: Iterable[Any] = (), doc_type: str = None) -> Optional[KnowledgeGraph]:
+        """Partial graph holding only the given files' nodes (plus every file of doc_type).
+        
+        Returns None when the user has no sharded snapshot yet; callers then fall back
+        to a full load. Saving a view appends its ops to the log but never compacts.
+        """
+        with self._lock(user_id):
+            manifest = self._read_manifest(user_id)
+            if manifest is None:
+                return None
+            ops = self._read_log(self.log_path(user_id), manifest["log_generation"], manifest["log_offset"])
+            return self._build_view(user_id, manifest, ops, file_ids, doc_type)
+    
+    def _build_view(self, user_id: str, manifest: Dict[str, Any], ops: List[tuple],
+                    file_ids: Iterable[Any], doc_type: Optional[str]) -> KnowledgeGraph:
+        keys = {self._shard_key(file_id) for file_id in file_ids}
+        if doc_type:
+            doc_type = str(doc_type).lower()
+            keys.update(key for key, entry in manifest["shards"].items() if doc_type in entry["doc_types"])
+            keys.update(self._shard_key(op[2].get('file_id')) for op in ops
+                        if op[0] == 'add_node' and str(op[2].get('doc_type', '')).lower() == doc_type)
+        
+        G = KnowledgeGraph()
+        G.partial = True
+        G.journal = None
+        for key in keys:
+            entry = manifest["shards"].get(key)
+            if entry:
+                shard = self._cached_shard(user_id, entry["path"])
+                G.add_nodes_from(shard["nodes"])
+                G.add_edges_from(shard["edges"])
+        if manifest.get("cross") and len(G):
+            cross = self._cached_shard(user_id, manifest["cross"])
+            G.add_edges_from(e for e in cross["edges"] if e[0] in G and e[1] in G)
+            # Shared with the cache: views never update their scores
+            G.centrality = cross.get("centrality", {})
+        
+        self._replay_partial(G, ops, keys)
+        G.journal = []
+        G.dirty_files = set()
+        return G
+    
+    def file_ids(self, user_id: str) -> Optional[List[Any]]:
+        """file_ids with nodes in the snapshot or added since, without loading any shard"""
+        with self._lock(user_id):
+            manifest = self._read_manifest(user_id)
+            if manifest is None:
+                return None
+            ops = self._read_log(self.log_path(user_id), manifest["log_generation"], manifest["log_offset"])
+        file_ids = {entry["file_id"]: None for entry in manifest["shards"].values()}
+        file_ids.update((op[2]['file_id'], None) for op in ops if op[0] == 'add_node' and op[2].get('file_id'))
+        return [file_id for file_id in file_ids if file_id is not None]
+    
+    def _replay_partial(self, G: KnowledgeGraph, ops: List[tuple], keys: set):
+        # Like KnowledgeGraph.apply, restricted to the nodes owned by the viewed shards
+        for op in ops:
+            kind = op[0]
+            if kind == 'add_node':
+                n, attrs = op[1], op[2]
+                if 'file_id' in attrs and self._shard_key(attrs['file_id']) in keys:
+                    G.apply([op])
+                elif n in G:
+                    # Either an update of a viewed node, or the node moved to another file
+                    G.apply([op] if 'file_id' not in attrs else [('remove_node', n)])
+            elif kind == 'add_edge':
+                if op[1] in G and op[2] in G:
+                    G.apply([op])
+            elif kind == 'remove_node':
+                if op[1] in G:
+                    G.apply([op])
+            elif kind == 'remove_edge':
+                if G.has_edge(op[1], op[2]):
+                    G.apply([op])
+            elif kind == 'clear':
+                G.apply([op])
+    
+    def append(self, user_id: str, G: KnowledgeGraph) -> List[tuple]:
+        """Persist the graph's pending journal and return the ops written"""
+        ops = G.drain_journal()
+        if not ops:
+            return ops
+        
+        payload = self._frame(ops)
+        # Appends from every worker process serialize on the writer lock
+        with user_locks.writer(user_id):
+            with self._lock(user_id):
+                log_path = self.log_path(user_id)
+                if not log_path.exists():
+                    self._write_atomic(log_path, LOG_HEADER.pack(LOG_MAGIC, self._next_generation(user_id)))
+                else:
+                    self._repair_log(user_id)
+                with open(log_path, 'ab') as f:
+                    f.write(payload)
+                    f.flush()
+                    os.fsync(f.fileno())
+                    log_size = f.tell()
+                    inode = os.fstat(f.fileno()).st_ino
+                self.log_ends[user_id] = (inode, self._log_position(user_id)[0], log_size)
+            
+            if not G.partial and log_size > max(self.compact_min_bytes, self._snapshot_size(user_id)):
+                self.compact(user_id, G)
+        return ops
+    
+    def compact(self, user_id: str, G: KnowledgeGraph, background: bool = True):
+        if G.partial:
+            return
+        with self.guard:
+            if user_id in self.compacting:
+                return
+            self.compacting.add(user_id)
+        
+        try:
+            # Serialize on the caller's thread so the graph is not mutated mid-pickle.
+            # Only dirty shards are pickled, and only once the log outgrows the snapshot
+            with self._lock(user_id):
+                generation, offset = self._log_position(user_id)
+                manifest = self._read_manifest(user_id)
+                dirty, G.dirty_files = G.dirty_files, set()
+                previous = None
+                if manifest is None or dirty is None:
+                    known = manifest["shards"].values() if manifest else ()
+                    dirty = set(G.file_index) | {entry["file_id"] for entry in known}
+                elif manifest.get("cross"):
+                    previous = self._read_shard(user_id, manifest["cross"])["edges"]
+                shards = {self._shard_key(file_id): self._encode_shard(G, file_id) for file_id in dirty}
+                edges = self._cross_edges(G) if previous is None else self._update_cross_edges(G, previous, dirty)
+                cross = pickle.dumps({"nodes": [], "edges": edges, "centrality": G.centrality},
+                                     protocol=pickle.HIGHEST_PROTOCOL)
+        except Exception:
+            G.dirty_files = None
+            with self.guard:
+                self.compacting.discard(user_id)
+            raise
+        
+        args = (user_id, G, manifest, shards, cross, generation, offset)
+        if background:
+            threading.Thread(target=self._finish_compaction, args=args,
+                             name=f"kg-compact-{user_id}", daemon=True).start()
+        else:
+            self._finish_compaction(*args)
+    
+    def _finish_compaction(self, user_id: str, G: KnowledgeGraph, manifest: Optional[Dict[str, Any]],
+                           shards: Dict[str, Any], cross: bytes, generation: int, offset: int):
+        try:
+            user_dir = self.user_dir(user_id)
+            (user_dir / "shards").mkdir(parents=True, exist_ok=True)
+            old_shards = manifest["shards"] if manifest else {}
+            new_shards = dict(old_shards)
+            written = 0
+            # Unique per compaction, so one racing in another process never overwrites these files
+            tag = f"{generation}-{uuid.uuid4().hex[:8]}"
+            
+            for key, shard in shards.items():
+                if shard is None:
+                    new_shards.pop(key, None)
+                    continue
+                path = f"shards/{key}-{tag}.pkl"
+                self._write_atomic(user_dir / path, shard["data"])
+                new_shards[key] = {"file_id": shard["file_id"], "path": path,
+                                   "doc_types": shard["doc_types"], "nodes": shard["nodes"]}
+                written += len(shard["data"])
+            
+            cross_path = f"shards/cross-{tag}.pkl"
+            self._write_atomic(user_dir / cross_path, cross)
+            
+            # The writer lock keeps appends from other worker processes out of the log rotation
+            with user_locks.writer(user_id), self._lock(user_id):
+                log_path = self.log_path(user_id)
+                if not log_path.exists():
+                    # The graph was deleted while the shards were being written
+                    shutil.rmtree(user_dir, ignore_errors=True)
+                    return
+                if self._log_position(user_id)[0] != generation:
+                    # Another process compacted first; its snapshot already covers these ops
+                    for entry in new_shards.values():
+                        if entry["path"].endswith(f"-{tag}.pkl"):
+                            (user_dir / entry["path"]).unlink(missing_ok=True)
+                    (user_dir / cross_path).unlink(missing_ok=True)
+                    G.dirty_files = None
+                    return
+                
+                # The manifest swap commits the new snapshot
+                new_manifest = {"log_generation": generation, "log_offset": offset,
+                                "shards": new_shards, "cross": cross_path}
+                self._write_atomic(self.manifest_path(user_id), json.dumps(new_manifest).encode("utf-8"))
+                
+                # Rotate the log: keep only the ops appended after the snapshot was taken
+                with open(log_path, 'rb') as f:
+                    f.seek(offset)
+                    tail = f.read()
+                self._write_atomic(log_path, LOG_HEADER.pack(LOG_MAGIC, generation + 1) + tail)
+            
+            # Shards the new manifest no longer points at
+            obsolete = {entry["path"] for entry in old_shards.values()} - {entry["path"] for entry in new_shards.values()}
+            if manifest and manifest.get("cross") != cross_path:
+                obsolete.add(manifest["cross"])
+            for path in obsolete:
+                (user_dir / path).unlink(missing_ok=True)
+            self.legacy_path(user_id).unlink(missing_ok=True)
+            
+            print(f"🗜️ Compacted graph log for {user_id}: {len(shards)} shards rewritten "
+                  f"({written / 1024:.0f} KB), {len(new_shards)} total")
+        except Exception as e:
+            # The dirty set was handed over; make the next compaction rewrite every shard
+            G.dirty_files = None
+            print(f"⚠️ Graph compaction failed for {user_id}: {e}")
+        finally:
+            with self.guard:
+                self.compacting.discard(user_id)
+    
+    def publish_snapshot(self, user_id: str, G: KnowledgeGraph):
+        """Make a saved graph the version readers see, as a new CSR snapshot"""
+        if G.partial:
+            return
+        with self._lock(user_id):
+            # The journal was just drained into the log, so G matches the current log position
+            position = self._log_position(user_id)
+        if not self._published_at(user_id, position):
+            self._write_snapshot(user_id, CSRGraph.encode(G, *position), position, len(G))
+    
+    def rebuild_snapshot(self, user_id: str) -> bool:
+        """Publish a snapshot of the graph as saved on disk (shards + log)"""
+        with self._lock(user_id):
+            if not self.exists(user_id):
+                return False
+            position = self._log_position(user_id)
+            if self._published_at(user_id, position):
+                return True
+            G = self._load_locked(user_id)
+        self._write_snapshot(user_id, CSRGraph.encode(G, *position), position, len(G))
+        return True
+    
+    def _published_at(self, user_id: str, position: Tuple[int, int]) -> bool:
+        current = self.open_snapshot(user_id)
+        return current is not None and (current.log_generation, current.log_offset) >= position
+    
+    def _write_snapshot(self, user_id: str, data: bytes, position: Tuple[int, int], nodes: int):
+        with self._lock(user_id):
+            current = self.open_snapshot(user_id)
+            if current is not None and (current.log_generation, current.log_offset) > position:
+                # A newer version was published while this one was being encoded
+                return
+            self.user_dir(user_id).mkdir(parents=True, exist_ok=True)
+            # Replacing the file is atomic; processes that mapped the old one keep reading it
+            self._write_atomic(self.snapshot_path(user_id), data)
+        print(f"🗺️ Published graph snapshot for {user_id}: {nodes} nodes ({len(data) / 1024:.0f} KB)")
+    
+    def open_snapshot(self, user_id: str) -> Optional[CSRGraph]:
+        """The last published snapshot, mapped once per process; takes no lock"""
+        path = self.snapshot_path(user_id)
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            self.snapshots.pop(user_id, None)
+            return None
+        
+        identity = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        cached = self.snapshots.get(user_id)
+        if cached is not None and cached[0] == identity:
+            return cached[1]
+        try:
+            snapshot = CSRGraph(path)
+        except (OSError, ValueError) as e:
+            # Replaced or removed while we opened it
+            print(f"⚠️ Could not map graph snapshot for {user_id}: {e}")
+            return None
+        self.snapshots[user_id] = (identity, snapshot)
+        return snapshot
+    
+    def delete(self, user_id: str):
+        with self._lock(user_id):
+            self.log_ends.pop(user_id, None)
+            for path in (self.legacy_path(user_id), self.log_path(user_id)):
+                if path.exists():
+                    path.unlink()
+            shutil.rmtree(self.user_dir(user_id), ignore_errors=True)
+        self.snapshots.pop(user_id, None)
+        with self.cache_lock:
+            for key in [key for key in self.shard_cache if key.startswith(f"{user_id}/")]:
+                del self.shard_cache[key]
+    
+    def _encode_shard(self, G: KnowledgeGraph, file_id: Any) -> Optional[Dict[str, Any]]:
+        members = G.file_index.get(file_id)
+        if not members:
+            return None
+        
+        nodes = [(n, dict(G.nodes[n])) for n in members]
+        edges = []
+        done = set()
+        for n in members:
+            for neighbor, data in G._adj[n].items():
+                # Emit each internal edge once, from whichever endpoint comes first
+                if neighbor in members and neighbor not in done:
+                    edges.append((n, neighbor, dict(data)))
+            done.add(n)
+        
+        doc_types = sorted({str(data['doc_type']).lower() for _, data in nodes if data.get('doc_type') is not None})
+        payload = pickle.dumps({"nodes": nodes, "edges": edges}, protocol=pickle.HIGHEST_PROTOCOL)
+        return {"file_id": file_id, "data": payload, "doc_types": doc_types, "nodes": len(nodes)}
+    
+    def _cross_edges(self, G: KnowledgeGraph) -> List[Tuple[Any, Any, Dict[str, Any]]]:
+        owner = {}
+        for file_id, members in G.file_index.items():
+            for n in members:
+                owner[n] = file_id
+        return [(u, v, dict(data)) for u, v, data in G.edges(data=True) if owner.get(u) != owner.get(v)]
+    
+    def _update_cross_edges(self, G: KnowledgeGraph, previous: List[tuple], dirty: set) -> List[tuple]:
+        """Cross edges from the last compaction, redone only around nodes of dirty files.
+        
+        Every edge change and every node add/remove/move marks the files of its endpoints
+        dirty, so an edge between two clean files is exactly as the previous cross shard has it.
+        """
+        def owner(n):
+            return G._node[n].get('file_id')
+        
+        edges = [(u, v, dict(G._adj[u][v])) for u, v, _ in previous
+                 if u in G._adj and v in G._adj[u] and owner(u) not in dirty and owner(v) not in dirty]
+        done = set()
+        for file_id in dirty:
+            for n in G.file_index.get(file_id, ()):
+                for neighbor, data in G._adj[n].items():
+                    # Edges between two dirty nodes are emitted once, from whichever comes first
+                    if neighbor not in done and owner(neighbor) != file_id:
+                        edges.append((n, neighbor, dict(data)))
+                done.add(n)
+        return edges
+    
+    def _shard_key(self, file_id: Any) -> str:
+        # file_ids come from user input, so shard file names are derived from a hash
+        return hashlib.sha1(repr(file_id).encode("utf-8")).hexdigest()[:16]
+    
+    def _read_manifest(self, user_id: str) -> Optional[Dict[str, Any]]:
+        path = self.manifest_path(user_id)
+        if not path.exists():
+            return None
+        with open(path, 'r') as f:
+            return json.load(f)
+    
+    def _snapshot_size(self, user_id: str) -> int:
+        manifest = self._read_manifest(user_id)
+        if manifest is not None:
+            paths = [entry["path"] for entry in manifest["shards"].values()] + [manifest["cross"]]
+            return sum((self.user_dir(user_id) / path).stat().st_size for path in paths)
+        legacy_path = self.legacy_path(user_id)
+        return legacy_path.stat().st_size if legacy_path.exists() else 0
+    
+    def _read_shard(self, user_id: str, path: str) -> Dict[str, Any]:
+        with open(self.user_dir(user_id) / path, 'rb') as f:
+            return pickle.load(f)
+    
+    def _cached_shard(self, user_id: str, path: str) -> Dict[str, Any]:
+        # Shard paths embed the generation they were written at, so entries never go stale
+        key = f"{user_id}/{path}"
+        with self.cache_lock:
+            shard = self.shard_cache.get(key)
+            if shard is not None:
+                self.shard_cache.move_to_end(key)
+                return shard
+        
+        shard = self._read_shard(user_id, path)
+        with self.cache_lock:
+            self.shard_cache[key] = shard
+            while len(self.shard_cache) > self.cache_size:
+                self.shard_cache.popitem(last=False)
+        return shard
+    
+    def _log_position(self, user_id: str) -> Tuple[int, int]:
+        log_path = self.log_path(user_id)
+        if not log_path.exists():
+            return self._next_generation(user_id) - 1, LOG_HEADER.size
+        with open(log_path, 'rb') as f:
+            _, generation = LOG_HEADER.unpack(f.read(LOG_HEADER.size))
+        return generation, log_path.stat().st_size
+    
+    def _next_generation(self, user_id: str) -> int:
+        # A fresh log must continue after the generation the snapshot already covers
+        manifest = self._read_manifest(user_id)
+        if manifest is not None:
+            return manifest["log_generation"] + 1
+        legacy_path = self.legacy_path(user_id)
+        if legacy_path.exists():
+            with open(legacy_path, 'rb') as f:
+                snapshot = pickle.load(f)
+            if isinstance(snapshot, dict) and "log_generation" in snapshot:
+                return snapshot["log_generation"] + 1
+        return 1
+    
+    def _read_log(self, log_path: Path, generation: int, offset: int) -> List[tuple]:
+        if not log_path.exists():
+            return []
+        
+        with open(log_path, 'rb') as f:
+            header = f.read(LOG_HEADER.size)
+            if len(header) < LOG_HEADER.size:
+                return []
+            magic, log_generation = LOG_HEADER.unpack(header)
+            if magic != LOG_MAGIC or log_generation < generation:
+                return []
+            # Same generation: the snapshot already covers everything before offset
+            if log_generation == generation:
+                f.seek(offset)
+            # Never modifies the file: a torn tail may be a frame another process is still writing
+            return self._read_frames(f)[0]
+    
+    def _read_frames(self, f) -> Tuple[List[tuple], int]:
+        """Ops of the complete frames from f's position on, and the offset where they end"""
+        ops = []
+        good_end = f.tell()
+        while True:
+            size_bytes = f.read(FRAME_HEADER.size)
+            if len(size_bytes) < FRAME_HEADER.size:
+                break
+            (size,) = FRAME_HEADER.unpack(size_bytes)
+            payload = f.read(size)
+            if len(payload) < size:
+                break
+            try:
+                ops.extend(pickle.loads(payload))
+            except Exception:
+                break
+            good_end = f.tell()
+        return ops, good_end
+    
+    def _repair_log(self, user_id: str):
+        """Drop a frame torn by a crash so the next append starts on a clean boundary (writer lock held)"""
+        log_path = self.log_path(user_id)
+        with open(log_path, 'r+b') as f:
+            header = f.read(LOG_HEADER.size)
+            if len(header) < LOG_HEADER.size:
+                return
+            _, generation = LOG_HEADER.unpack(header)
+            stat = os.fstat(f.fileno())
+            known = self.log_ends.get(user_id)
+            # Only what was appended since this process last checked needs scanning
+            if known is not None and known[:2] == (stat.st_ino, generation) and known[2] <= stat.st_size:
+                f.seek(known[2])
+            good_end = self._read_frames(f)[1]
+            if good_end < stat.st_size:
+                print(f"⚠️ Truncating torn graph log tail in {log_path.name}")
+                f.truncate(good_end)
+            self.log_ends[user_id] = (stat.st_ino, generation, good_end)
+    
+    def _frame(self, ops: List[tuple]) -> bytes:
+        payload = pickle.dumps(ops, protocol=pickle.HIGHEST_PROTOCOL)
+        return FRAME_HEADER.pack(len(payload)) + payload
+    
+    def _write_atomic(self, path: Path, data: bytes):
+        temp_path = path.with_suffix(path.suffix + ".tmp")
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+
+graph_store = GraphStore()
@@ -0,0 +1,175 @@
+from typing import Dict, Any, List, Optional
+from .supabase_client import supabase_client
+from .write_behind import WriteBehindSync
+
+class UserChanges:
+    """Coalesced rows waiting to be pushed for one user; a None row means delete"""
+    
+    def __init__(self):
+        self.cleared = False
+        self.nodes: Dict[str, Optional[Dict[str, Any]]] = {}
+        self.edges: Dict[frozenset, Optional[Dict[str, Any]]] = {}
+
+class GraphSync(WriteBehindSync):
+    """Write-behind sync of knowledge graph changes to the kg_nodes / kg_edges tables.
+    
+    Saves only mark the nodes and edges touched since the last save (taken from the
+    graph journal). The background worker (see WriteBehindSync) pushes them in bulk
+    upserts of SUPABASE_SYNC_BATCH_SIZE rows; anything still failing is kept and
+    retried on the next cycle.
+    """
+    
+    thread_name = "graph-sync"
+    label = "Supabase sync"
+    
+    def __init__(self):
+        super().__init__()
+        self.pending: Dict[str, UserChanges] = {}
+    
+    def mark(self, user_id: str, G, ops: List[tuple]):
+        """Queue the rows touched by journal ops; reads their current state from G"""
+        if not ops or not supabase_client.enabled:
+            return
+        
+        # Everything before the last clear is superseded by it
+        cleared = False
+        for i in range(len(ops) - 1, -1, -1):
+            if ops[i][0] == 'clear':
+                cleared, ops = True, ops[i + 1:]
+                break
+        
+        touched_nodes = {}
+        touched_edges = {}
+        for op in ops:
+            if op[0] in ('add_node', 'remove_node'):
+                touched_nodes[op[1]] = None
+            elif op[0] in ('add_edge', 'remove_edge'):
+                touched_edges[frozenset((op[1], op[2]))] = (op[1], op[2])
+        
+        # Rows are built here, on the saving thread, so the worker never reads a graph being mutated
+        nodes = {str(n): self._node_row(user_id, n, G.nodes[n]) if n in G else None for n in touched_nodes}
+        edges = {}
+        for key, (u, v) in touched_edges.items():
+            if G.has_edge(u, v):
+                edges[key] = self._edge_row(user_id, u, v, G.get_edge_data(u, v))
+            elif u in G and v in G:
+                edges[key] = None
+        
+        with self.lock:
+            changes = self.pending.get(user_id)
+            if changes is None or cleared:
+                changes = self.pending[user_id] = UserChanges()
+                changes.cleared = cleared
+            changes.nodes.update(nodes)
+            changes.edges.update(edges)
+        
+        self._notify()
+    
+    def discard(self, user_id: str):
+        with self.lock:
+            self.pending.pop(user_id, None)
+    
+    def _pending_rows(self) -> int:
+        return sum(len(c.nodes) + len(c.edges) for c in self.pending.values())
+    
+    def _push(self, user_id: str):
+        with self.lock:
+            changes = self.pending.pop(user_id, None)
+        if changes is None:
+            return
+        try:
+            self._push_changes(user_id, changes)
+        except Exception:
+            self._requeue(user_id, changes)
+            raise
+    
+    def _push_changes(self, user_id: str, changes: UserChanges):
+        # Each step removes what it sent, so a failure requeues only the remainder
+        if changes.cleared:
+            self._with_retry(lambda: supabase_client.client.table('kg_edges').delete().eq('user_id', user_id).execute())
+            self._with_retry(lambda: supabase_client.client.table('kg_nodes').delete().eq('user_id', user_id).execute())
+            changes.cleared = False
+        
+        removed_nodes = [n for n, row in changes.nodes.items() if row is None]
+        for batch in self._batches(removed_nodes):
+            for column in ('source_node', 'target_node'):
+                self._with_retry(lambda: supabase_client.client.table('kg_edges').delete()
+                                 .eq('user_id', user_id).in_(column, batch).execute())
+            self._with_retry(lambda: supabase_client.client.table('kg_nodes').delete()
+                             .eq('user_id', user_id).in_('node_id', batch).execute())
+            for n in batch:
+                del changes.nodes[n]
+        
+        for key in [key for key, row in changes.edges.items() if row is None]:
+            u, v = [str(n) for n in (list(key) * 2)[:2]]
+            for source, target in ((u, v), (v, u)):
+                self._with_retry(lambda: supabase_client.client.table('kg_edges').delete()
+                                 .eq('user_id', user_id).eq('source_node', source).eq('target_node', target).execute())
+            del changes.edges[key]
+        
+        node_rows = list(changes.nodes.items())
+        for batch in self._batches(node_rows):
+            self._with_retry(lambda: supabase_client.client.table('kg_nodes')
+                             .upsert([row for _, row in batch], on_conflict='user_id,node_id').execute())
+            for n, _ in batch:
+                del changes.nodes[n]
+            self.synced_rows += len(batch)
+        
+        edge_rows = list(changes.edges.items())
+        for batch in self._batches(edge_rows):
+            self._with_retry(lambda: supabase_client.client.table('kg_edges')
+                             .upsert([row for _, row in batch], on_conflict='user_id,source_node,target_node').execute())
+            for key, _ in batch:
+                del changes.edges[key]
+            self.synced_rows += len(batch)
+        
+        if node_rows or edge_rows:
+            print(f"✅ Synced {len(node_rows)} nodes, {len(edge_rows)} edges to Supabase for {user_id}")
+    
+    def _requeue(self, user_id: str, changes: UserChanges):
+        with self.lock:
+            current = self.pending.get(user_id)
+            if current is None:
+                self.pending[user_id] = changes
+                return
+            if current.cleared:
+                # A newer clear supersedes whatever we failed to send
+                return
+            # Newer marks win over the rows we failed to send
+            changes.nodes.update(current.nodes)
+            changes.edges.update(current.edges)
+            self.pending[user_id] = changes
+    
+    def _node_row(self, user_id: str, node, data: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            'user_id': user_id,
+            'node_id': str(node),
+            'entity_text': data.get('entity_text'),
+            'entity_type': data.get('entity_type'),
+            'entity_value': data.get('entity_value'),
+            'file_id': data.get('file_id'),
+            'doc_type': data.get('doc_type'),
+            'metadata': self._clean_metadata(data.get('metadata', {}))
+        }
+    
+    def _edge_row(self, user_id: str, source, target, data: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            'user_id': user_id,
+            'source_node': str(source),
+            'target_node': str(target),
+            'relation': data.get('relation', 'related')
+        }
+    
+    def _clean_metadata(self, metadata: Dict[str, Any]) -> Dict[str, Any]:
+        # Convert metadata to JSON-serializable format
+        clean_metadata = {}
+        for k, v in (metadata or {}).items():
+            if hasattr(v, 'isoformat'):  # Timestamp/datetime
+                clean_metadata[k] = v.isoformat()
+            elif isinstance(v, (str, int, float, bool, type(None))):
+                clean_metadata[k] = v
+            else:
+                clean_metadata[k] = str(v)
+        return clean_metadata
+
+graph_sync = GraphSync()
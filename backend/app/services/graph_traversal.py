@@ -0,0 +1,122 @@
+import heapq
+import math
+import time
+from typing import Dict, Any, List, Optional, Callable, Iterable
+from ..core.config import settings
+
+# Extra cost per hop, scaled by log(degree) of the node entered
+HUB_PENALTY = 0.1
+
+class GraphTraversal:
+    """Bounded best-first k-hop expansion from a set of seed nodes.
+    
+    Nodes are expanded cheapest-first. A hop costs 1 plus a penalty that grows with the
+    degree of the node entered, so specific entities win over hubs. Ties break on the
+    node id, so results are deterministic. Work is bounded by the hop limit, the node
+    budget and a per-node neighbor scan cap and fan-out; hitting any of them stops early
+    and marks the result truncated. An optional time budget (off by default, since it
+    makes results depend on machine load) can cap latency on top of that.
+    """
+    
+    def __init__(self):
+        self.max_hops = settings.KG_TRAVERSAL_MAX_HOPS
+        self.fanout = settings.KG_TRAVERSAL_FANOUT
+        self.max_scan = settings.KG_TRAVERSAL_MAX_SCAN
+        self.time_budget_ms = settings.KG_TRAVERSAL_TIME_BUDGET_MS
+    
+    def traverse(self, G, seeds: Iterable[Any], max_hops: int = None, relations: Iterable[str] = None,
+                 max_nodes: int = 50, node_filter: Callable[[Any], bool] = None,
+                 time_budget_ms: float = None) -> Dict[str, Any]:
+        """Returns {"nodes", "edges", "paths", "hops", "truncated"}; nodes in visit order"""
+        max_hops = self.max_hops if max_hops is None else max_hops
+        relations = {str(r).lower() for r in relations} if relations else None
+        budget_ms = self.time_budget_ms if time_budget_ms is None else time_budget_ms
+        deadline = time.perf_counter() + budget_ms / 1000 if budget_ms > 0 else math.inf
+        adj = G._adj
+        
+        costs: Dict[Any, float] = {}
+        parents: Dict[Any, Optional[Any]] = {}
+        hops: Dict[Any, int] = {}
+        frontier = []
+        seq = 0
+        for seed in seeds:
+            if seed in adj and seed not in costs and (node_filter is None or node_filter(seed)):
+                costs[seed], parents[seed], hops[seed] = 0.0, None, 0
+                heapq.heappush(frontier, (0.0, str(seed), seq, seed))
+                seq += 1
+        
+        visited: Dict[Any, None] = {}
+        truncated = False
+        while frontier:
+            if len(visited) >= max_nodes or time.perf_counter() > deadline:
+                truncated = True
+                break
+            
+            cost, _, _, node = heapq.heappop(frontier)
+            if node in visited or cost > costs[node]:
+                continue
+            visited[node] = None
+            if hops[node] >= max_hops:
+                continue
+            
+            candidates = []
+            for scanned, (neighbor, data) in enumerate(adj[node].items()):
+                if scanned >= self.max_scan:
+                    truncated = True
+                    break
+                if neighbor in visited:
+                    continue
+                if relations is not None and str(data.get('relation', '')).lower() not in relations:
+                    continue
+                if node_filter is not None and not node_filter(neighbor):
+                    continue
+                step = 1 + HUB_PENALTY * math.log1p(len(adj[neighbor]))
+                candidates.append((cost + step, str(neighbor), neighbor))
+            
+            if len(candidates) > self.fanout:
+                truncated = True
+                candidates = heapq.nsmallest(self.fanout, candidates, key=lambda c: (c[0], c[1]))
+            
+            for new_cost, key, neighbor in candidates:
+                if neighbor not in costs or new_cost < costs[neighbor]:
+                    costs[neighbor], parents[neighbor], hops[neighbor] = new_cost, node, hops[node] + 1
+                    heapq.heappush(frontier, (new_cost, key, seq, neighbor))
+                    seq += 1
+        
+        nodes = list(visited)
+        return {
+            "nodes": nodes,
+            "edges": self.induced_edges(G, nodes, relations),
+            "paths": {node: self._path(parents, node) for node in nodes},
+            "hops": {node: hops[node] for node in nodes},
+            "truncated": truncated
+        }
+    
+    def induced_edges(self, G, nodes: List[Any], relations: Optional[set] = None) -> List[tuple]:
+        """Edges among nodes, each once, without scanning the full adjacency of hubs"""
+        adj = G._adj
+        position = {node: i for i, node in enumerate(nodes)}
+        edges = []
+        for i, node in enumerate(nodes):
+            neighbors = adj[node]
+            # Probe from the smaller side so a hub does not cost its full degree
+            if len(neighbors) > len(nodes):
+                pairs = ((other, neighbors[other]) for other in nodes if other in neighbors)
+            else:
+                pairs = ((other, data) for other, data in neighbors.items() if other in position)
+            for other, data in pairs:
+                if position[other] < i:
+                    continue
+                if relations is not None and str(data.get('relation', '')).lower() not in relations:
+                    continue
+                edges.append((node, other, data))
+        return edges
+    
+    def _path(self, parents: Dict[Any, Optional[Any]], node: Any) -> List[Any]:
+        path = [node]
+        while parents[path[-1]] is not None:
+            path.append(parents[path[-1]])
+        path.reverse()
+        return path
+
+graph_traversal = GraphTraversal()
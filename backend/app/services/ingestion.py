@@ -0,0 +1,164 @@
+import os
+import requests
+from pathlib import Path
+from typing import Dict, Any, Optional, Callable
+from ..core.config import settings
+from .parser import parser, DEFAULT_BATCH_SIZE
+from .kg_builder import kg_builder
+from .rag_engine import rag_engine
+from .doc_type_detector import doc_detector
+from .schema_extractor import schema_extractor
+from .job_queue import job_queue
+from .user_locks import user_locks
+
+TABULAR_EXTENSIONS = {'.csv', '.xlsx'}
+
+DRIVE_EXPORTS = {
+    'spreadsheet': ('text/csv', '.csv'),
+    'document': ('application/vnd.openxmlformats-officedocument.wordprocessingml.document', '.docx'),
+}
+
+def drive_export_format(mime_type: str) -> Optional[tuple]:
+    """Return (export mime, extension) for supported Google Workspace files"""
+    for key, export in DRIVE_EXPORTS.items():
+        if key in (mime_type or ''):
+            return export
+    return None
+
+class IngestionPipeline:
+    """Stream a parsed file through KG building and embedding batch by batch"""
+    
+    def __init__(self, batch_size: int = DEFAULT_BATCH_SIZE):
+        self.batch_size = batch_size
+        self.checkpoint_batches = settings.INGEST_CHECKPOINT_BATCHES
+    
+    def detect_doc_type(self, filename: str, sample_content: str) -> str:
+        # Detect document type from filename first
+        filename_lower = filename.lower()
+        if 'customer' in filename_lower:
+            return 'customers'
+        elif 'deal' in filename_lower:
+            return 'deals'
+        elif 'invoice' in filename_lower:
+            return 'invoices'
+        elif 'order' in filename_lower:
+            return 'orders'
+        
+        # Fallback to LLM detection
+        doc_info = doc_detector.detect_type(sample_content)
+        return doc_info.get("type", "unknown")
+    
+    def run(self, file_path: str, file_id: str, user_id: str, filename: str = "", doc_type: Optional[str] = None,
+            progress: Optional[Callable] = None, start_row: int = 0) -> Dict[str, Any]:
+        """Ingest a file; rows before start_row are skipped when resuming from a checkpoint"""
+        # One writer per user at a time; searches keep reading the last published version meanwhile
+        with user_locks.writer(user_id):
+            # Make sure new rows are appended to what is already on disk
+            if user_id not in kg_builder.graphs:
+                kg_builder._load_graph(user_id)
+            if user_id not in rag_engine.indices:
+                rag_engine._load_index(user_id)
+            
+            rows = 0
+            nodes = 0
+            unsaved_batches = 0
+            tabular = settings.KG_TABULAR_SCHEMA and Path(file_path).suffix.lower() in TABULAR_EXTENSIONS
+            schema = None
+            
+            try:
+                for batch in parser.iter_records(file_path, self.batch_size):
+                    if rows + len(batch) <= start_row:
+                        rows += len(batch)
+                        continue
+                    if rows < start_row:
+                        batch = batch[start_row - rows:]
+                        rows = start_row
+                    
+                    if doc_type is None:
+                        sample_content = str(batch[0].get('content', ''))[:2000] if batch else ""
+                        doc_type = self.detect_doc_type(filename, sample_content)
+                    
+                    # Progress callbacks may raise to cancel, so only report between batches
+                    if progress:
+                        progress("ingesting", rows, doc_type=doc_type)
+                    # Tabular files share one schema, inferred from the first batch
+                    if tabular and schema is None:
+                        schema = schema_extractor.infer_schema(batch, doc_type) or {}
+                    if schema:
+                        kg_result = kg_builder.build_graph_from_schema(batch, schema, file_id, user_id, doc_type, save=False)
+                    else:
+                        kg_result = kg_builder.build_graph(batch, file_id, user_id, doc_type, save=False)
+                    rag_engine.store_embeddings(batch, file_id, user_id, doc_type, save=False)
+                    
+                    rows += len(batch)
+                    nodes += kg_result["nodes"]
+                    unsaved_batches += 1
+                    
+                    if unsaved_batches >= self.checkpoint_batches:
+                        self._save(user_id)
+                        unsaved_batches = 0
+                        if progress:
+                            progress("checkpoint", rows, doc_type=doc_type, checkpoint=rows)
+            finally:
+                # Rows already ingested stay ingested, even if the job is cancelled or fails
+                if unsaved_batches:
+                    self._save(user_id)
+                # Readers in every worker process switch to the new graph version
+                if rows > start_row:
+                    kg_builder.publish_snapshot(user_id)
+        
+        return {"rows": rows, "nodes": nodes, "doc_type": doc_type or "unknown"}
+    
+    def run_job(self, job: Dict[str, Any], progress: Callable) -> Dict[str, Any]:
+        """Job handler for both local uploads and Google Drive files"""
+        payload = job["payload"]
+        path = payload.get("path")
+        
+        if job["kind"] == "gdrive" and not (path and os.path.exists(path)):
+            progress("downloading", 0)
+            path = self._download_drive_file(job)
+        
+        if job.get("rows_total") is None:
+            progress("counting", 0, rows_total=parser.count_rows(path))
+        
+        result = self.run(path, job["file_id"], job["user_id"],
+                          filename=job.get("filename", "") if job["kind"] == "file" else "",
+                          doc_type=payload.get("doc_type"),
+                          progress=progress,
+                          start_row=payload.get("checkpoint_rows", 0))
+        
+        if job["kind"] == "gdrive" and os.path.exists(path):
+            os.remove(path)
+        return result
+    
+    def _download_drive_file(self, job: Dict[str, Any]) -> str:
+        access_token = job_queue.get_secret(job["job_id"])
+        if not access_token:
+            raise Exception("Google access token not available after restart, please sync again")
+        
+        export_mime, ext = drive_export_format(job["payload"].get("mime_type"))
+        response = requests.get(
+            f"https://www.googleapis.com/drive/v3/files/{job['file_id']}/export",
+            headers={"Authorization": f"Bearer {access_token}"},
+            params={"mimeType": export_mime},
+            timeout=60
+        )
+        if response.status_code != 200:
+            raise Exception(f"Download failed: {response.status_code}")
+        
+        temp_path = Path("uploads") / f"temp_{job['file_id']}{ext}"
+        with open(temp_path, 'wb') as f:
+            f.write(response.content)
+        
+        job_queue.update_payload(job["job_id"], path=str(temp_path))
+        return str(temp_path)
+    
+    def _save(self, user_id: str):
+        if user_id in kg_builder.graphs:
+            kg_builder._save_graph(user_id)
+        if user_id in rag_engine.indices:
+            rag_engine._save_index(user_id)
+
+ingestion_pipeline = IngestionPipeline()
+job_queue.register("file", ingestion_pipeline.run_job)
+job_queue.register("gdrive", ingestion_pipeline.run_job)
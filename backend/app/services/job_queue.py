@@ -0,0 +1,336 @@
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Callable
+from ..core.config import settings
+
+ACTIVE_STATES = {"queued", "running"}
+
+class JobCancelled(Exception):
+    """Raised from a progress callback when the job has been cancelled"""
+
+class JobQueue:
+    """Persistent background job queue for ingestion work, shared by all worker processes.
+    
+    Jobs live in SQLite (storage/jobs/jobs.db). A free worker thread claims the oldest
+    queued job of a user with nothing running, in one transaction, so a job runs in
+    exactly one process and a user's jobs run one after another without parking a
+    worker: when a job finishes, the worker claims whatever is next.
+    
+    Every process keeps a heartbeat row. Jobs left running by a process whose heartbeat
+    is older than JOB_LEASE_SECONDS (crash, restart) are claimed again and resume from
+    their last checkpoint. Jobs carrying an access token, which is only kept in the
+    memory of the process that received it, are left to that process while it is alive.
+    """
+    
+    def __init__(self, db_path: str = "storage/jobs/jobs.db"):
+        path = Path(db_path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.legacy_file = path.parent / "jobs.json"
+        self.lease = settings.JOB_LEASE_SECONDS
+        self.poll_interval = settings.JOB_POLL_INTERVAL
+        self.lock = threading.RLock()
+        # Autocommit; multi-statement updates open their own IMMEDIATE transactions
+        self.conn = sqlite3.connect(str(path), check_same_thread=False, timeout=30, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""CREATE TABLE IF NOT EXISTS jobs (
+            job_id TEXT PRIMARY KEY,
+            user_id TEXT NOT NULL,
+            status TEXT NOT NULL,
+            created_at TEXT NOT NULL,
+            owner TEXT,
+            pinned TEXT,
+            cancel_requested INTEGER NOT NULL DEFAULT 0,
+            data TEXT NOT NULL
+        )""")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_user ON jobs(user_id, created_at)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, created_at)")
+        self.conn.execute("""CREATE TABLE IF NOT EXISTS workers (
+            token TEXT PRIMARY KEY,
+            heartbeat REAL NOT NULL
+        )""")
+        
+        self.token = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.handlers: Dict[str, Callable] = {}
+        # Access tokens are only kept in memory, never written to disk
+        self.secrets: Dict[str, str] = {}
+        self.run_started: Dict[str, tuple] = {}
+        self.threads: List[threading.Thread] = []
+        self.wakeup = threading.Event()
+        self.stopping = False
+    
+    def register(self, kind: str, handler: Callable):
+        self.handlers[kind] = handler
+    
+    def start(self):
+        if self.threads:
+            return
+        self.stopping = False
+        self._heartbeat()
+        self._import_legacy()
+        
+        self.threads = [threading.Thread(target=self._heartbeat_loop, name="ingest-heartbeat", daemon=True)]
+        self.threads += [threading.Thread(target=self._worker, name=f"ingest-{i}", daemon=True)
+                         for i in range(settings.INGEST_WORKERS)]
+        for thread in self.threads:
+            thread.start()
+        print(f"✅ Job queue started with {settings.INGEST_WORKERS} workers")
+    
+    def stop(self):
+        if not self.threads:
+            return
+        self.stopping = True
+        self.wakeup.set()
+        self.threads = []
+        # Our running jobs become claimable again right away instead of after the lease
+        with self.lock:
+            self.conn.execute("DELETE FROM workers WHERE token = ?", (self.token,))
+    
+    def submit(self, user_id: str, kind: str, file_id: str, filename: str, payload: Dict[str, Any],
+               secret: Optional[str] = None) -> Dict[str, Any]:
+        now = datetime.now().isoformat()
+        job = {
+            "job_id": uuid.uuid4().hex,
+            "user_id": user_id,
+            "kind": kind,
+            "file_id": file_id,
+            "filename": filename,
+            "status": "queued",
+            "stage": "queued",
+            "rows_processed": 0,
+            "rows_total": None,
+            "eta_seconds": None,
+            "doc_type": payload.get("doc_type"),
+            "result": None,
+            "error": None,
+            "cancel_requested": False,
+            "created_at": now,
+            "updated_at": now,
+            "finished_at": None,
+            "payload": payload
+        }
+        
+        with self.lock:
+            if secret:
+                self.secrets[job["job_id"]] = secret
+            self.conn.execute("INSERT INTO jobs (job_id, user_id, status, created_at, pinned, data) VALUES (?, ?, ?, ?, ?, ?)",
+                              (job["job_id"], user_id, "queued", now, self.token if secret else None, json.dumps(job)))
+        
+        self.wakeup.set()
+        return self._public(job)
+    
+    def get(self, job_id: str, user_id: str) -> Optional[Dict[str, Any]]:
+        job = self._load(job_id)
+        if not job or job["user_id"] != user_id:
+            return None
+        return self._public(job)
+    
+    def list_jobs(self, user_id: str) -> List[Dict[str, Any]]:
+        with self.lock:
+            rows = self.conn.execute("SELECT status, cancel_requested, data FROM jobs WHERE user_id = ? ORDER BY created_at DESC",
+                                     (user_id,)).fetchall()
+        return [self._public(self._from_row(row)) for row in rows]
+    
+    def cancel(self, job_id: str, user_id: str) -> Optional[Dict[str, Any]]:
+        job = self._load(job_id)
+        if not job or job["user_id"] != user_id:
+            return None
+        
+        if job["status"] == "queued":
+            self._finish(job_id, "cancelled", only_if="queued")
+        elif job["status"] == "running":
+            # The worker, in whichever process, stops at the next batch boundary
+            with self.lock:
+                self.conn.execute("UPDATE jobs SET cancel_requested = 1 WHERE job_id = ?", (job_id,))
+        return self._public(self._load(job_id))
+    
+    def get_secret(self, job_id: str) -> Optional[str]:
+        return self.secrets.get(job_id)
+    
+    def update_payload(self, job_id: str, **values):
+        self._update(job_id, lambda job: job["payload"].update(values))
+    
+    def _worker(self):
+        while not self.stopping:
+            job = self._claim()
+            if job is None:
+                # Woken by local submits; jobs submitted or freed in other processes are picked up by polling
+                self.wakeup.wait(self.poll_interval)
+                self.wakeup.clear()
+                continue
+            self._run(job)
+            # The user's next job (if any) is claimable now
+            self.wakeup.set()
+    
+    def _claim(self) -> Optional[Dict[str, Any]]:
+        """Atomically take the oldest runnable job: queued, or running under a dead process"""
+        live = "SELECT token FROM workers WHERE heartbeat > :stale"
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self.conn.execute(f"""
+                    SELECT job_id, status FROM jobs AS j
+                    WHERE (j.status = 'queued' OR (j.status = 'running' AND j.owner NOT IN ({live})))
+                      AND (j.pinned IS NULL OR j.pinned = :me OR j.pinned NOT IN ({live}))
+                      AND NOT EXISTS (SELECT 1 FROM jobs AS r
+                                      WHERE r.user_id = j.user_id AND r.status = 'running'
+                                        AND r.job_id != j.job_id AND r.owner IN ({live}))
+                    ORDER BY j.created_at LIMIT 1""",
+                    {"stale": time.time() - self.lease, "me": self.token}).fetchone()
+                if row is None:
+                    self.conn.execute("COMMIT")
+                    return None
+                job_id, previous = row
+                self.conn.execute("UPDATE jobs SET status = 'running', owner = ? WHERE job_id = ?", (self.token, job_id))
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        
+        job = self._update(job_id, lambda job: job.update(status="running", updated_at=datetime.now().isoformat()))
+        if previous == "running":
+            print(f"[JOBS] Resuming {job_id} from row {job['payload'].get('checkpoint_rows', 0)}")
+        return job
+    
+    def _run(self, job: Dict[str, Any]):
+        job_id = job["job_id"]
+        self.run_started[job_id] = (time.time(), job["rows_processed"])
+        print(f"[JOBS] ▶ {job['kind']} job {job_id}: {job['filename']}")
+        try:
+            result = self.handlers[job["kind"]](dict(job), self._reporter(job_id))
+            self._finish(job_id, "completed", result=result, rows_processed=result.get("rows", job["rows_processed"]))
+            print(f"[JOBS] ✓ {job['filename']}: {result}")
+        except JobCancelled:
+            self._finish(job_id, "cancelled")
+            print(f"[JOBS] ⏹ Cancelled {job['filename']}")
+        except Exception as e:
+            self._finish(job_id, "failed", error=str(e))
+            print(f"[JOBS] ✗ {job['filename']}: {e}")
+        finally:
+            self.run_started.pop(job_id, None)
+            self.secrets.pop(job_id, None)
+    
+    def _reporter(self, job_id: str) -> Callable:
+        def progress(stage: str, rows_processed: int, doc_type: str = None, rows_total: int = None,
+                     checkpoint: int = None):
+            def apply(job):
+                if job["cancel_requested"]:
+                    raise JobCancelled()
+                
+                job["stage"] = stage
+                job["rows_processed"] = rows_processed
+                job["updated_at"] = datetime.now().isoformat()
+                if doc_type:
+                    job["doc_type"] = doc_type
+                    job["payload"]["doc_type"] = doc_type
+                if rows_total is not None:
+                    job["rows_total"] = rows_total
+                if checkpoint is not None:
+                    job["payload"]["checkpoint_rows"] = checkpoint
+                job["eta_seconds"] = self._eta(job)
+            self._update(job_id, apply)
+        return progress
+    
+    def _eta(self, job: Dict[str, Any]) -> Optional[float]:
+        started = self.run_started.get(job["job_id"])
+        if not started or not job["rows_total"]:
+            return None
+        
+        started_at, start_rows = started
+        done = job["rows_processed"] - start_rows
+        if done <= 0:
+            return None
+        rate = done / max(time.time() - started_at, 1e-6)
+        return round(max(job["rows_total"] - job["rows_processed"], 0) / rate, 1)
+    
+    def _finish(self, job_id: str, status: str, only_if: str = None, **values):
+        def apply(job):
+            if only_if and job["status"] != only_if:
+                return
+            job.update(values)
+            job["status"] = status
+            job["stage"] = status
+            job["eta_seconds"] = None if status != "completed" else 0
+            job["finished_at"] = job["updated_at"] = datetime.now().isoformat()
+        self._update(job_id, apply)
+    
+    def _update(self, job_id: str, apply: Callable) -> Optional[Dict[str, Any]]:
+        """Read-modify-write one job in a transaction; apply may raise to leave it unchanged"""
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self.conn.execute("SELECT status, cancel_requested, data FROM jobs WHERE job_id = ?",
+                                        (job_id,)).fetchone()
+                if row is None:
+                    self.conn.execute("COMMIT")
+                    return None
+                job = self._from_row(row)
+                apply(job)
+                # A finished job has no owner; the claim sets it
+                self.conn.execute("UPDATE jobs SET status = ?, owner = CASE WHEN ? THEN owner END, data = ? WHERE job_id = ?",
+                                  (job["status"], job["status"] in ACTIVE_STATES, json.dumps(job), job_id))
+                self.conn.execute("COMMIT")
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+        return job
+    
+    def _load(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            row = self.conn.execute("SELECT status, cancel_requested, data FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return self._from_row(row) if row else None
+    
+    def _from_row(self, row) -> Dict[str, Any]:
+        # Status and cancellation are columns, so other processes can change them without touching the data
+        status, cancel_requested, data = row
+        job = json.loads(data)
+        job["status"] = status
+        job["cancel_requested"] = bool(cancel_requested)
+        return job
+    
+    def _heartbeat(self):
+        now = time.time()
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO workers (token, heartbeat) VALUES (?, ?)", (self.token, now))
+            self.conn.execute("DELETE FROM workers WHERE heartbeat < ?", (now - 10 * self.lease,))
+    
+    def _heartbeat_loop(self):
+        while not self.stopping:
+            time.sleep(self.lease / 4)
+            if not self.stopping:
+                self._heartbeat()
+    
+    def _import_legacy(self):
+        """Move jobs from the jobs.json file used before the database, once"""
+        if not self.legacy_file.exists():
+            return
+        try:
+            with open(self.legacy_file, 'r') as f:
+                jobs = json.load(f)
+            with self.lock:
+                for job in jobs.values():
+                    status = "queued" if job["status"] in ACTIVE_STATES else job["status"]
+                    job["status"] = status
+                    self.conn.execute("INSERT OR IGNORE INTO jobs (job_id, user_id, status, created_at, data) VALUES (?, ?, ?, ?, ?)",
+                                      (job["job_id"], job["user_id"], status, job["created_at"], json.dumps(job)))
+            os.replace(self.legacy_file, self.legacy_file.with_suffix(".json.imported"))
+            print(f"[JOBS] Imported {len(jobs)} jobs from {self.legacy_file.name}")
+        except FileNotFoundError:
+            # Another process imported it first
+            pass
+    
+    def _public(self, job: Dict[str, Any]) -> Dict[str, Any]:
+        view = {k: v for k, v in job.items() if k != "payload"}
+        if job["rows_total"]:
+            view["percent"] = round(min(job["rows_processed"] / job["rows_total"], 1.0) * 100, 1)
+        else:
+            view["percent"] = 100.0 if job["status"] == "completed" else None
+        return view
+
+job_queue = JobQueue()
@@ -1,11 +1,21 @@
 import spacy
-import networkx as nx
-import pickle
+import threading
+from itertools import chain, islice
 from pathlib import Path
 from typing import List, Dict, Any
 from .llm_entity_extractor import llm_extractor
 from .pattern_extractor import pattern_extractor
+from .schema_extractor import schema_extractor
 from .supabase_client import supabase_client
+from .knowledge_graph import KnowledgeGraph
+from .graph_store import graph_store
+from .graph_sync import graph_sync
+from .graph_traversal import graph_traversal
+from .centrality import centrality_index
+from .entity_resolver import entity_resolver
+from .user_locks import user_locks
+
+MAX_GRAPH_RESULTS = 50
 
 class KGBuilder:
     def __init__(self):
@@ -17,6 +27,12 @@ class KGBuilder:
         self.storage_dir = Path("storage/graphs")
         self.storage_dir.mkdir(parents=True, exist_ok=True)
         self.graphs = {}
+        # Users with a snapshot rebuild running, and those saved again since it started
+        self.publishing = set()
+        self.publish_pending = set()
+        self.publish_guard = threading.Lock()
+        # Another worker process wrote this user's graph: reload it from disk on next use
+        user_locks.on_stale(lambda user_id: self.graphs.pop(user_id, None))
     
     def extract_entities(self, text: str, use_llm: bool = True) -> List[Dict[str, Any]]:
         entities = []
@@ -37,38 +53,38 @@ class KGBuilder:
         
         return entities
     
-    def build_graph(self, data: List[Dict[str, Any]], file_id: str, user_id: str, doc_type: str = "unknown"):
+    def build_graph(self, data: List[Dict[str, Any]], file_id: str, user_id: str, doc_type: str = "unknown", save: bool = True):
         if not data:
             print(f"⚠️ No data to process for file {file_id}")
             return {"nodes": 0, "doc_type": doc_type}
         
         if user_id not in self.graphs:
-            self.graphs[user_id] = nx.Graph()
+            self.graphs[user_id] = KnowledgeGraph()
         
         G = self.graphs[user_id]
         nodes_added = 0
         detected_type = doc_type
         
-        for item in data:
-            content = str(item.get('content', ''))
-            
-            # Skip empty content
-            if not content or content.strip() in ['', 'nan', 'None', 'Nothing']:
-                continue
-            
+        # Skip empty content
+        items = [(item, str(item.get('content', ''))) for item in data]
+        items = [(item, content) for item, content in items
+                 if content and content.strip() not in ['', 'nan', 'None', 'Nothing']]
+        
+        # Extract the whole batch with as few LLM calls as possible
+        llm_results = []
+        if llm_extractor.enabled:
+            llm_results = llm_extractor.extract_batch([content for _, content in items], doc_type)
+        
+        for idx, (item, content) in enumerate(items):
             # Try LLM extraction first, fallback to spaCy
             entities = []
             relations = []
             
-            if llm_extractor.enabled:
-                try:
-                    llm_result = llm_extractor.extract_entities_and_relations(content, doc_type)
-                    entities = llm_result.get("entities", [])
-                    relations = llm_result.get("relations", [])
-                    # Use passed doc_type, not LLM-detected
-                    detected_type = doc_type
-                except Exception as e:
-                    print(f"LLM extraction failed: {e}")
+            if llm_results:
+                entities = llm_results[idx].get("entities", [])
+                relations = llm_results[idx].get("relations", [])
+                # Use passed doc_type, not LLM-detected
+                detected_type = doc_type
             
             # Try pattern extractor for structured data
             if not entities and ':' in content:
@@ -111,17 +127,8 @@ class KGBuilder:
             
             for rel in relations:
                 # Find matching nodes by entity text or value
-                source_node = None
-                target_node = None
-                
-                for node_id, node_data in G.nodes(data=True):
-                    entity_text = node_data.get('entity_text', '')
-                    entity_value = str(node_data.get('entity_value', ''))
-                    
-                    if entity_text == rel['source'] or entity_value == rel['source']:
-                        source_node = node_id
-                    if entity_text == rel['target'] or entity_value == rel['target']:
-                        target_node = node_id
+                source_node = G.find_entity(rel['source'])
+                target_node = G.find_entity(rel['target'])
                 
                 # If target not found, create it as a node
                 if source_node and not target_node:
@@ -163,139 +170,215 @@ class KGBuilder:
                         if node != hub_node and G.has_node(node):
                             G.add_edge(hub_node, node, relation="related_to")
         
-        self._save_graph(user_id)
+        if save:
+            self._save_graph(user_id)
         return {"nodes": nodes_added, "doc_type": detected_type}
     
-    def query_graph(self, query: str, user_id: str, doc_type_filter: str = None) -> Dict[str, Any]:
+    def build_graph_from_schema(self, data: List[Dict[str, Any]], schema: Dict[str, Any], file_id: str, user_id: str, doc_type: str = "unknown", save: bool = True):
+        """Add a batch of tabular rows using a schema inferred once per file, without per-row extraction"""
+        if not data:
+            return {"nodes": 0, "doc_type": doc_type}
+        
         if user_id not in self.graphs:
-            self._load_graph(user_id)
+            self.graphs[user_id] = KnowledgeGraph()
+        
+        G = self.graphs[user_id]
+        nodes, edges = schema_extractor.apply_schema(data, schema)
         
-        if user_id not in self.graphs or len(self.graphs[user_id].nodes()) == 0:
+        G.add_nodes_from((node_id, {**attrs, "file_id": file_id, "doc_type": doc_type, "metadata": data[row]})
+                         for node_id, row, attrs in nodes)
+        G.add_edges_from((source, target, {"relation": relation}) for source, target, relation in edges)
+        print(f"📐 Schema mapped {len(data)} rows to {len(nodes)} nodes, {len(edges)} edges")
+        
+        if save:
+            self._save_graph(user_id)
+        return {"nodes": len(nodes), "doc_type": doc_type}
+    
+    def query_graph(self, query: str, user_id: str, doc_type_filter: str = None) -> Dict[str, Any]:
+        G = self.read_graph(user_id, doc_type=doc_type_filter)
+        
+        if G is None or len(G) == 0:
             return {"nodes": [], "edges": []}
         
         entities = self.extract_entities(query)
         entity_texts = [e["text"].lower() for e in entities]
         
-        G = self.graphs[user_id]
+        # Filter nodes by doc_type if specified, through the doc_type index
+        filtered_nodes = G.doc_type_nodes(doc_type_filter) if doc_type_filter else None
         
-        # Filter nodes by doc_type if specified
-        if doc_type_filter:
-            filtered_nodes = [(node, data) for node, data in G.nodes(data=True)
-                            if data.get('doc_type', '').lower() == doc_type_filter.lower()]
-        else:
-            filtered_nodes = list(G.nodes(data=True))
+        def in_filter(node) -> bool:
+            return filtered_nodes is None or node in filtered_nodes
         
         # If no query entities, return filtered nodes (limited)
         if not entity_texts:
-            limited_nodes = filtered_nodes[:50]
-            nodes = [{"entity_text": data.get('entity_text', 'Unknown'),
-                     "entity_type": data.get('entity_type', 'UNKNOWN'),
-                     "entity_value": data.get('entity_value', '')} 
-                    for node, data in limited_nodes]
-            
-            edges = []
-            node_ids = [n[0] for n in limited_nodes]
-            for i, (node, _) in enumerate(limited_nodes):
-                for neighbor in G.neighbors(node):
-                    if neighbor in node_ids:
-                        j = node_ids.index(neighbor)
-                        edge_data = G.get_edge_data(node, neighbor)
-                        edges.append({
-                            "source": i,
-                            "target": j,
-                            "relation": edge_data.get('relation', 'related')
-                        })
-            
-            return {"nodes": nodes, "edges": edges}
+            limited_nodes = list(islice(G if filtered_nodes is None else filtered_nodes, MAX_GRAPH_RESULTS))
+            return self._subgraph_response(G, {"nodes": limited_nodes,
+                                               "edges": graph_traversal.induced_edges(G, limited_nodes)})
         
-        # Find matching nodes and neighbors (from filtered set)
-        matched_nodes = []
-        node_map = {}
-        filtered_node_ids = [n[0] for n in filtered_nodes]
+        # Seed with nodes matching through the substring index, then expand best-first (within the filtered set)
+        seeds = {}
+        for node in chain.from_iterable(G.search_text(et) for et in entity_texts):
+            if len(seeds) >= MAX_GRAPH_RESULTS:
+                break
+            if in_filter(node):
+                seeds[node] = None
         
-        for node, data in filtered_nodes:
-            entity_text = data.get('entity_text', '').lower()
-            if any(et in entity_text for et in entity_texts):
-                idx = len(matched_nodes)
-                node_map[node] = idx
-                matched_nodes.append((node, data))
-                
-                # Add neighbors (only if they're in the filtered set)
-                for neighbor in G.neighbors(node):
-                    if neighbor not in node_map and neighbor in filtered_node_ids:
-                        idx = len(matched_nodes)
-                        node_map[neighbor] = idx
-                        matched_nodes.append((neighbor, G.nodes[neighbor]))
+        result = graph_traversal.traverse(G, seeds, max_nodes=MAX_GRAPH_RESULTS,
+                                          node_filter=in_filter if filtered_nodes is not None else None)
+        return self._subgraph_response(G, result)
+    
+    def traverse(self, user_id: str, seeds: List[Any], max_hops: int = None, relations: List[str] = None,
+                 max_nodes: int = MAX_GRAPH_RESULTS, doc_type: str = None) -> Dict[str, Any]:
+        """Bounded k-hop subgraph (with paths) around seeds given as node ids or entity texts/values"""
+        G = self.read_graph(user_id, doc_type=doc_type)
+        if G is None or len(G) == 0:
+            return {"nodes": [], "edges": [], "centrality": [], "paths": [], "truncated": False}
+        
+        seed_nodes = {}
+        for seed in seeds:
+            for node in ([seed] if seed in G else G.find_entities(seed)):
+                seed_nodes[node] = None
         
-        # Build response
-        nodes = [{"entity_text": data.get('entity_text', 'Unknown'),
-                 "entity_type": data.get('entity_type', 'UNKNOWN'),
-                 "entity_value": data.get('entity_value', '')} 
-                for node, data in matched_nodes[:50]]
+        allowed = G.doc_type_nodes(doc_type) if doc_type else None
+        result = graph_traversal.traverse(G, seed_nodes, max_hops=max_hops, relations=relations, max_nodes=max_nodes,
+                                          node_filter=allowed.__contains__ if allowed is not None else None)
+        return self._subgraph_response(G, result)
+    
+    def _subgraph_response(self, G, result: Dict[str, Any]) -> Dict[str, Any]:
+        node_ids = result["nodes"]
+        node_map = {node: idx for idx, node in enumerate(node_ids)}
+        nodes = []
+        for node in node_ids:
+            data = G.nodes[node]
+            nodes.append({"entity_text": data.get('entity_text', 'Unknown'),
+                          "entity_type": data.get('entity_type', 'UNKNOWN'),
+                          "entity_value": data.get('entity_value', '')})
         
-        edges = []
-        for node, _ in matched_nodes[:50]:
-            if node in node_map:
-                for neighbor in G.neighbors(node):
-                    if neighbor in node_map:
-                        edge_data = G.get_edge_data(node, neighbor)
-                        edges.append({
-                            "source": node_map[node],
-                            "target": node_map[neighbor],
-                            "relation": edge_data.get('relation', 'related')
-                        })
+        edges = [{"source": node_map[u], "target": node_map[v], "relation": data.get('relation', 'related')}
+                 for u, v, data in result["edges"]]
         
-        return {"nodes": nodes, "edges": edges}
+        # Parallel to nodes, so callers can rank them without touching the graph
+        response = {"nodes": nodes, "edges": edges,
+                    "centrality": [centrality_index.score(G, node) for node in node_ids]}
+        if "paths" in result:
+            # Paths as node indices, from a seed to each node reached by expansion
+            response["paths"] = [[node_map[n] for n in path] for path in result["paths"].values() if len(path) > 1]
+            response["truncated"] = result["truncated"]
+        return response
     
-    def _save_graph(self, user_id: str):
-        # Save to local file
-        with open(self.storage_dir / f"{user_id}.pkl", 'wb') as f:
-            pickle.dump(self.graphs[user_id], f)
+    def _save_graph(self, user_id: str, G: KnowledgeGraph = None):
+        if G is None:
+            G = self.graphs[user_id]
+        # Merge duplicates among the nodes added since the last save into existing entities
+        entity_resolver.resolve(user_id, G, [op[1] for op in G.journal if op[0] == 'add_node'])
         
-        # Save to Supabase if enabled
+        # Refresh scores before appending, so a compaction triggered by it stores them current
+        centrality_index.update(G, G.journal)
+        
+        # Append the changes since the last save to the local delta log
+        ops = graph_store.append(user_id, G)
+        
+        # Queue the same changes for the background Supabase sync
         if supabase_client.enabled:
+            graph_sync.mark(user_id, G, ops)
+    
+    def _load_graph(self, user_id: str):
+        G = graph_store.load(user_id)
+        if G is not None:
+            self.graphs[user_id] = G
+    
+    def graph_view(self, user_id: str, file_ids: List[str] = (), doc_type: str = None):
+        """Graph covering at least the given files / doc_type.
+        
+        The full graph when it is already in memory, otherwise a view built from just
+        the shards needed. Views are never kept in self.graphs.
+        """
+        if user_id in self.graphs:
+            return self.graphs[user_id]
+        G = graph_store.load_view(user_id, file_ids, doc_type)
+        if G is None:
+            # Not sharded yet (older single-pickle snapshot): fall back to a full load
+            self._load_graph(user_id)
+            G = self.graphs.get(user_id)
+        return G
+    
+    def read_graph(self, user_id: str, file_ids: List[str] = (), doc_type: str = None):
+        """Last published version of the user's graph, for read-only queries.
+        
+        The shared memory-mapped snapshot: self.graphs belongs to writers (holding
+        user_locks.writer), so queries never see a graph mid-update and never wait on one.
+        A graph with no usable snapshot (saved before snapshots, or in an older format) gets
+        one published in the background; until then queries read it from disk, as a view of
+        just the given files / doc_type when they name any (see also migrate_graphs.py).
+        """
+        snapshot = graph_store.open_snapshot(user_id)
+        if snapshot is not None or not graph_store.exists(user_id):
+            return snapshot
+        self.publish_snapshot(user_id)
+        G = graph_store.load_view(user_id, file_ids, doc_type) if file_ids or doc_type else None
+        return G if G is not None else graph_store.load(user_id)
+    
+    def publish_snapshot(self, user_id: str):
+        """Rebuild the version readers see in the background.
+        
+        Readers keep the previous snapshot until the new one is written. Saves made while a
+        rebuild runs are coalesced into one follow-up rebuild, so a burst of checkpoints
+        or deletes does not encode the graph once per save.
+        """
+        with self.publish_guard:
+            if user_id in self.publishing:
+                self.publish_pending.add(user_id)
+                return
+            self.publishing.add(user_id)
+        threading.Thread(target=self._publish_loop, args=(user_id,),
+                         name=f"kg-publish-{user_id}", daemon=True).start()
+    
+    def _publish_loop(self, user_id: str):
+        while True:
             try:
-                G = self.graphs[user_id]
-                for node, data in G.nodes(data=True):
-                    # Convert metadata to JSON-serializable format
-                    metadata = data.get('metadata', {})
-                    clean_metadata = {}
-                    for k, v in metadata.items():
-                        if hasattr(v, 'isoformat'):  # Timestamp/datetime
-                            clean_metadata[k] = v.isoformat()
-                        elif isinstance(v, (str, int, float, bool, type(None))):
-                            clean_metadata[k] = v
-                        else:
-                            clean_metadata[k] = str(v)
-                    
-                    supabase_client.client.table('kg_nodes').upsert({
-                        'user_id': user_id,
-                        'node_id': node,
-                        'entity_text': data.get('entity_text'),
-                        'entity_type': data.get('entity_type'),
-                        'entity_value': data.get('entity_value'),
-                        'file_id': data.get('file_id'),
-                        'doc_type': data.get('doc_type'),
-                        'metadata': clean_metadata
-                    }).execute()
-                
-                for source, target, edge_data in G.edges(data=True):
-                    supabase_client.client.table('kg_edges').upsert({
-                        'user_id': user_id,
-                        'source_node': source,
-                        'target_node': target,
-                        'relation': edge_data.get('relation', 'related')
-                    }).execute()
-                
-                print(f"✅ Saved to Supabase")
+                # The writer lock keeps the in-memory graph still while it is encoded
+                with user_locks.writer(user_id):
+                    G = self.graphs.get(user_id)
+                    if G is not None and not G.journal and not G.partial:
+                        graph_store.publish_snapshot(user_id, G)
+                    else:
+                        graph_store.rebuild_snapshot(user_id)
             except Exception as e:
-                if '23505' not in str(e):
-                    print(f"⚠️ Supabase error: {e}")
+                # Readers stay on the last published version until the next save publishes again
+                print(f"⚠️ Could not publish graph snapshot for {user_id}: {e}")
+            
+            with self.publish_guard:
+                if user_id not in self.publish_pending:
+                    self.publishing.discard(user_id)
+                    return
+                self.publish_pending.discard(user_id)
     
-    def _load_graph(self, user_id: str):
-        graph_path = self.storage_dir / f"{user_id}.pkl"
-        if graph_path.exists():
-            with open(graph_path, 'rb') as f:
-                self.graphs[user_id] = pickle.load(f)
+    def file_ids(self, user_id: str) -> List[str]:
+        file_ids = graph_store.file_ids(user_id)
+        if file_ids is not None:
+            return file_ids
+        G = self.read_graph(user_id)
+        return G.file_ids() if G is not None else []
+    
+    def remove_file_nodes(self, user_id: str, file_ids: List[str]) -> int:
+        """Drop every node that came from the given files and persist the change"""
+        with user_locks.writer(user_id):
+            G = self.graph_view(user_id, file_ids=file_ids)
+            if G is None:
+                return 0
+            
+            nodes_to_remove = [node for file_id in file_ids for node in G.file_nodes(file_id)]
+            if nodes_to_remove:
+                G.remove_nodes_from(nodes_to_remove)
+                self._save_graph(user_id, G)
+                self.publish_snapshot(user_id)
+            return len(nodes_to_remove)
+    
+    def delete_graph(self, user_id: str):
+        with user_locks.writer(user_id):
+            self.graphs.pop(user_id, None)
+            graph_sync.discard(user_id)
+            entity_resolver.discard(user_id)
+            graph_store.delete(user_id)
 
 kg_builder = KGBuilder()
@@ -0,0 +1,245 @@
+import networkx as nx
+from typing import Dict, Any, List, Optional, Iterator
+
+INDEXED_ATTRS = ('entity_text', 'entity_value')
+
+class KnowledgeGraph(nx.Graph):
+    """networkx graph that keeps its lookup indexes in step with node changes.
+    
+    entity_index maps every entity_text / entity_value (and alias) to the node ids carrying it,
+    so relation endpoints resolve with a dict lookup instead of a scan over all nodes.
+    file_index / doc_type_index map file_id (None for nodes without one) and lowercased
+    doc_type to their nodes.
+    These indexes are instance attributes and are pickled together with the graph.
+    search_text scans; published snapshots answer it from trigram postings instead
+    (see CSRGraph.search_text), so only reads falling back to a loaded graph use it.
+    
+    centrality holds each node's PageRank score, stored with the snapshot and
+    refreshed incrementally by CentralityIndex after every change.
+    """
+    
+    # Set on views built from a subset of the shards (see GraphStore.load_view)
+    partial = False
+    
+    def __init__(self, incoming_graph_data=None, **attr):
+        # Must exist before nx.Graph.__init__, which may add nodes
+        self.entity_index: Dict[str, Dict[Any, None]] = {}
+        self.file_index: Dict[Any, Dict[Any, None]] = {}
+        self.doc_type_index: Dict[str, Dict[Any, None]] = {}
+        # Mutations since the last save, drained by GraphStore into the delta log
+        self.journal: Optional[List[tuple]] = []
+        # file_ids whose shard changed since the last compaction; None means all of them
+        self.dirty_files: Optional[set] = set()
+        # node -> PageRank score (mean 1), maintained by CentralityIndex
+        self.centrality: Dict[Any, float] = {}
+        super().__init__(incoming_graph_data, **attr)
+    
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop('journal', None)
+        state.pop('dirty_files', None)
+        return state
+    
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.journal = []
+        self.dirty_files = None
+        if 'file_index' not in state:
+            # Pickled before the file_id / doc_type indexes existed
+            self.file_index, self.doc_type_index = {}, {}
+            for n in self._node:
+                self._index_node(n)
+        if 'centrality' not in state:
+            self.centrality = {}
+    
+    @classmethod
+    def from_graph(cls, G: nx.Graph) -> "KnowledgeGraph":
+        """Upgrade a plain networkx graph (e.g. an older pickle) and build its indexes"""
+        if isinstance(G, cls):
+            return G
+        kg = cls()
+        kg.graph.update(G.graph)
+        kg.add_nodes_from(G.nodes(data=True))
+        kg.add_edges_from(G.edges(data=True))
+        return kg
+    
+    def find_entity(self, key: Any) -> Optional[Any]:
+        """Most recently indexed node whose entity_text or entity_value equals key"""
+        nodes = self.entity_index.get(str(key))
+        return next(reversed(nodes)) if nodes else None
+    
+    def find_entities(self, key: Any) -> List[Any]:
+        return list(self.entity_index.get(str(key), ()))
+    
+    def file_nodes(self, file_id: Any) -> List[Any]:
+        return list(self.file_index.get(file_id, ()))
+    
+    def doc_type_nodes(self, doc_type: str) -> Dict[Any, None]:
+        """Nodes of a doc_type (case-insensitive), as an ordered set for O(1) membership"""
+        return self.doc_type_index.get(str(doc_type).lower(), {})
+    
+    def file_ids(self) -> List[Any]:
+        return [file_id for file_id in self.file_index if file_id is not None]
+    
+    def search_text(self, query: str) -> Iterator[Any]:
+        """Lazily yield nodes whose lowercased entity_text contains query"""
+        query = query.lower()
+        for n, data in self._node.items():
+            text = self._text_key(data)
+            if text is not None and query in text:
+                yield n
+    
+    def drain_journal(self) -> List[tuple]:
+        ops, self.journal = self.journal, []
+        return ops
+    
+    def apply(self, ops: List[tuple]):
+        """Replay journal ops (e.g. from the delta log) without journaling them again"""
+        journal, self.journal = self.journal, None
+        try:
+            for op in ops:
+                if op[0] == 'add_node':
+                    self.add_node(op[1], **op[2])
+                elif op[0] == 'add_edge':
+                    self.add_edge(op[1], op[2], **op[3])
+                elif op[0] == 'remove_node':
+                    self.remove_nodes_from([op[1]])
+                elif op[0] == 'remove_edge':
+                    self.remove_edges_from([(op[1], op[2])])
+                elif op[0] == 'clear':
+                    self.clear()
+        finally:
+            self.journal = journal
+    
+    def _record(self, *op):
+        if self.journal is not None:
+            self.journal.append(op)
+    
+    def add_node(self, node_for_adding, **attr):
+        self._unindex_node(node_for_adding)
+        super().add_node(node_for_adding, **attr)
+        self._index_node(node_for_adding)
+        self._record('add_node', node_for_adding, attr)
+    
+    def add_nodes_from(self, nodes_for_adding, **attr):
+        items = list(nodes_for_adding)
+        nodes = [self._node_key(n) for n in items]
+        for n in nodes:
+            self._unindex_node(n)
+        super().add_nodes_from(items, **attr)
+        for n, item in zip(nodes, items):
+            self._index_node(n)
+            self._record('add_node', n, {**attr, **item[1]} if n is not item else attr)
+    
+    def add_edge(self, u_of_edge, v_of_edge, **attr):
+        created = [n for n in (u_of_edge, v_of_edge) if n not in self._node]
+        super().add_edge(u_of_edge, v_of_edge, **attr)
+        # networkx creates missing endpoints without going through add_node
+        for n in created:
+            self._index_node(n)
+        self._mark_edge(u_of_edge, v_of_edge)
+        self._record('add_edge', u_of_edge, v_of_edge, attr)
+    
+    def add_edges_from(self, ebunch_to_add, **attr):
+        edges = list(ebunch_to_add)
+        created = {n: None for e in edges for n in e[:2] if n not in self._node}
+        super().add_edges_from(edges, **attr)
+        for n in created:
+            self._index_node(n)
+        for e in edges:
+            self._mark_edge(e[0], e[1])
+            self._record('add_edge', e[0], e[1], {**attr, **e[2]} if len(e) == 3 else attr)
+    
+    def remove_node(self, n):
+        self._unindex_node(n)
+        super().remove_node(n)
+        self._record('remove_node', n)
+    
+    def remove_nodes_from(self, nodes):
+        nodes = list(nodes)
+        for n in nodes:
+            self._unindex_node(n)
+        super().remove_nodes_from(nodes)
+        for n in nodes:
+            self._record('remove_node', n)
+    
+    def remove_edge(self, u, v):
+        super().remove_edge(u, v)
+        self._mark_edge(u, v)
+        self._record('remove_edge', u, v)
+    
+    def remove_edges_from(self, ebunch):
+        edges = list(ebunch)
+        super().remove_edges_from(edges)
+        for e in edges:
+            self._mark_edge(e[0], e[1])
+            self._record('remove_edge', e[0], e[1])
+    
+    def clear(self):
+        super().clear()
+        self.entity_index = {}
+        self.file_index = {}
+        self.doc_type_index = {}
+        self.dirty_files = None
+        self.centrality = {}
+        self._record('clear')
+    
+    def _node_key(self, n):
+        # Mirrors nx.Graph.add_nodes_from: (node, attr_dict) tuples are unhashable
+        try:
+            hash(n)
+            return n
+        except TypeError:
+            return n[0]
+    
+    def _index_node(self, n):
+        data = self._node.get(n)
+        if data is None:
+            return
+        for key in self._index_keys(data):
+            self._add_to(self.entity_index, key, n)
+        self._add_to(self.file_index, data.get('file_id'), n)
+        self._mark_dirty(data.get('file_id'))
+        if data.get('doc_type') is not None:
+            self._add_to(self.doc_type_index, str(data['doc_type']).lower(), n)
+    
+    def _unindex_node(self, n):
+        data = self._node.get(n)
+        if data is None:
+            return
+        for key in self._index_keys(data):
+            self._remove_from(self.entity_index, key, n)
+        self._remove_from(self.file_index, data.get('file_id'), n)
+        self._mark_dirty(data.get('file_id'))
+        if data.get('doc_type') is not None:
+            self._remove_from(self.doc_type_index, str(data['doc_type']).lower(), n)
+    
+    def _mark_dirty(self, file_id: Any):
+        if self.dirty_files is not None:
+            self.dirty_files.add(file_id)
+    
+    def _mark_edge(self, u, v):
+        for n in (u, v):
+            data = self._node.get(n)
+            if data is not None:
+                self._mark_dirty(data.get('file_id'))
+    
+    def _add_to(self, index: Dict[Any, Dict[Any, None]], key: Any, n):
+        index.setdefault(key, {})[n] = None
+    
+    def _remove_from(self, index: Dict[Any, Dict[Any, None]], key: Any, n):
+        nodes = index.get(key)
+        if nodes is not None:
+            nodes.pop(n, None)
+            if not nodes:
+                del index[key]
+    
+    def _index_keys(self, data: Dict[str, Any]) -> set:
+        keys = {str(data[attr]) for attr in INDEXED_ATTRS if data.get(attr) is not None}
+        # Texts of duplicates merged into this node (see EntityResolver) still resolve to it
+        keys.update(str(alias) for alias in data.get('aliases') or ())
+        return keys
+    
+    def _text_key(self, data: Dict[str, Any]) -> Optional[str]:
+        text = data.get('entity_text')
+        return str(text).lower() if text is not None else None
@@ -1,29 +1,145 @@
-import requests
 from typing import List, Dict, Any
 import json
 from ..core.config import settings
+from .extraction_cache import extraction_cache
+from .llm_gateway import llm_gateway
+
+# Bump whenever either extraction prompt changes so cached results are not reused
+PROMPT_VERSION = "1"
+
+SYSTEM_PROMPT = "You are an expert at extracting structured information from documents. Return ONLY valid JSON, no explanations."
+
+# Rough prompt overhead and chars-per-token ratio used to pack batches under the token budget
+BATCH_PROMPT_TOKENS = 400
+CHARS_PER_TOKEN = 4
+MAX_RECORD_CHARS = 2000
 
 class LLMEntityExtractor:
     def __init__(self):
-        if settings.OPENROUTER_API_KEY:
-            self.api_key = settings.OPENROUTER_API_KEY
-            self.base_url = settings.OPENROUTER_BASE_URL
-            self.model = settings.LLM_MODEL
-            self.enabled = True
+        self.batch_token_budget = settings.LLM_BATCH_TOKEN_BUDGET
+        self.batch_max_records = settings.LLM_BATCH_MAX_RECORDS
+        self.model = settings.LLM_MODEL
+        self.enabled = llm_gateway.enabled
+        if self.enabled:
             print("✅ LLM Entity Extractor enabled")
         else:
-            self.api_key = None
-            self.enabled = False
             print("⚠️ LLM Entity Extractor disabled (no API key)")
     
     def extract_entities_and_relations(self, text: str, doc_type: str = "unknown") -> Dict[str, Any]:
         if not self.enabled or not text.strip():
             return {"entities": [], "relations": [], "doc_type": doc_type}
         
-        prompt = f"""You are a Knowledge Graph expert. Analyze this {doc_type} document and extract a complete knowledge graph.
+        key = self._cache_key(text, doc_type)
+        if key:
+            cached = extraction_cache.get(key)
+            if cached is not None:
+                return cached
+        
+        try:
+            result = self._request_extraction(text, doc_type)
+        except Exception as e:
+            print(f"LLM extraction error: {e}")
+            return {"entities": [], "relations": [], "doc_type": doc_type}
+        
+        if key:
+            extraction_cache.put(key, self.model, PROMPT_VERSION, result)
+        return result
+    
+    def extract_batch(self, texts: List[str], doc_type: str = "unknown") -> List[Dict[str, Any]]:
+        """Extract many records with as few LLM calls as the token budget allows.
+        
+        Results are returned in the same order as texts. A batch whose response is
+        malformed is split in half and retried; single records use the per-record prompt.
+        """
+        results = [{"entities": [], "relations": [], "doc_type": doc_type} for _ in texts]
+        if not self.enabled:
+            return results
+        
+        todo = [i for i, text in enumerate(texts) if text.strip()]
+        
+        # Serve unchanged records from the cache and only send misses to the LLM
+        keys = {}
+        cached = {}
+        if settings.LLM_CACHE_ENABLED:
+            keys = {i: self._cache_key(texts[i], doc_type) for i in todo}
+            cached = extraction_cache.get_many(list(keys.values()))
+            for i in todo:
+                if keys[i] in cached:
+                    results[i] = cached[keys[i]]
+            todo = [i for i in todo if keys[i] not in cached]
+        
+        pending = self._pack(todo, texts)
+        fresh = {}
+        calls = 0
+        
+        # Each round sends every pending group concurrently through the gateway
+        while pending:
+            groups = pending
+            pending = []
+            prompts = [self._extraction_prompt(texts[g[0]], doc_type) if len(g) == 1
+                       else self._batch_prompt([texts[i] for i in g], doc_type) for g in groups]
+            responses = llm_gateway.complete_many([self._messages(p) for p in prompts], temperature=0.1)
+            calls += len(groups)
+            
+            for group, response in zip(groups, responses):
+                if isinstance(response, Exception):
+                    print(f"LLM extraction error: {response}")
+                    continue
+                
+                try:
+                    if len(group) == 1:
+                        parsed = [self._parse_json(response.strip())]
+                    else:
+                        parsed = self._parse_batch(response.strip(), len(group), doc_type)
+                    for i, result in zip(group, parsed):
+                        results[i] = fresh[i] = result
+                except (ValueError, KeyError, TypeError, AttributeError) as e:
+                    if len(group) == 1:
+                        print(f"LLM extraction error: {e}")
+                        continue
+                    # Malformed or incomplete JSON: retry each half on its own
+                    print(f"LLM batch of {len(group)} malformed ({e}), splitting")
+                    middle = len(group) // 2
+                    pending.extend([group[:middle], group[middle:]])
+        
+        if keys:
+            extraction_cache.put_many([(keys[i], result) for i, result in fresh.items()], self.model, PROMPT_VERSION)
+        
+        print(f"LLM extracted {len(texts)} records in {calls} calls ({len(cached)} cached)")
+        return results
+    
+    def _cache_key(self, text: str, doc_type: str) -> str:
+        if not settings.LLM_CACHE_ENABLED:
+            return None
+        return extraction_cache.make_key(text, doc_type, self.model, PROMPT_VERSION)
+    
+    def _pack(self, indices: List[int], texts: List[str]) -> List[List[int]]:
+        groups = []
+        current = []
+        current_tokens = BATCH_PROMPT_TOKENS
+        
+        for i in indices:
+            tokens = len(texts[i][:MAX_RECORD_CHARS]) // CHARS_PER_TOKEN + 10
+            if current and (current_tokens + tokens > self.batch_token_budget or len(current) >= self.batch_max_records):
+                groups.append(current)
+                current = []
+                current_tokens = BATCH_PROMPT_TOKENS
+            current.append(i)
+            current_tokens += tokens
+        
+        if current:
+            groups.append(current)
+        return groups
+    
+    def _request_extraction(self, text: str, doc_type: str) -> Dict[str, Any]:
+        prompt = self._extraction_prompt(text, doc_type)
+        return self._parse_json(llm_gateway.complete(self._messages(prompt), temperature=0.1).strip())
+    
+    def _extraction_prompt(self, text: str, doc_type: str) -> str:
+        return f"""You are a Knowledge Graph expert. Analyze this {doc_type} document and extract a complete knowledge graph.
 
 Document:
-{text[:2000]}
+{text[:MAX_RECORD_CHARS]}
 
 Your task:
 1. Identify ALL entities (IDs, names, organizations, amounts, dates, statuses, etc.)
@@ -51,41 +167,70 @@ Return ONLY valid JSON:
 }}
 
 IMPORTANT: Create relations that show HOW entities connect, not just that they exist together."""
+    
+    def _batch_prompt(self, texts: List[str], doc_type: str) -> str:
+        records = "\n\n".join(f"### Record {i}\n{text[:MAX_RECORD_CHARS]}" for i, text in enumerate(texts))
         
-        try:
-            response = requests.post(
-                f"{self.base_url}/chat/completions",
-                headers={
-                    "Authorization": f"Bearer {self.api_key}",
-                    "Content-Type": "application/json"
-                },
-                json={
-                    "model": self.model,
-                    "messages": [
-                        {"role": "system", "content": "You are an expert at extracting structured information from documents. Return ONLY valid JSON, no explanations."},
-                        {"role": "user", "content": prompt}
-                    ],
-                    "temperature": 0.1
-                },
-                timeout=120
-            )
-            response.raise_for_status()
-            content = response.json()["choices"][0]["message"]["content"].strip()
-            
-            # Extract JSON from response (handle reasoning text)
-            if '```json' in content:
-                content = content.split('```json')[1].split('```')[0].strip()
-            elif '```' in content:
-                content = content.split('```')[1].split('```')[0].strip()
-            elif '{' in content:
-                start = content.find('{')
-                end = content.rfind('}') + 1
-                content = content[start:end]
-            
-            result = json.loads(content)
-            return result
-        except Exception as e:
-            print(f"LLM extraction error: {e}")
-            return {"entities": [], "relations": [], "doc_type": doc_type}
+        return f"""You are a Knowledge Graph expert. Below are {len(texts)} independent records from a {doc_type} document.
+Extract a knowledge graph for EACH record separately.
+
+{records}
+
+For every record:
+1. Identify ALL entities (IDs, names, organizations, amounts, dates, statuses, etc.)
+2. Create meaningful relationships that capture the business logic (e.g. Deal ID has_client, has_amount, has_status, closed_on, has_name)
+3. Only relate entities that appear in the same record
+
+Return ONLY valid JSON with one entry per record, using the record number as "id":
+{{
+  "records": [
+    {{
+      "id": 0,
+      "entities": [
+        {{"text": "101", "type": "ID", "value": "101"}},
+        {{"text": "Alpha Co", "type": "ORG", "value": "Alpha Co"}}
+      ],
+      "relations": [
+        {{"source": "101", "target": "Alpha Co", "relation": "has_client"}}
+      ]
+    }}
+  ]
+}}"""
+    
+    def _parse_batch(self, content: str, count: int, doc_type: str) -> List[Dict[str, Any]]:
+        parsed = self._parse_json(content)
+        by_id = {}
+        for record in parsed.get("records", []):
+            try:
+                by_id[int(record["id"])] = record
+            except (KeyError, TypeError, ValueError):
+                continue
+        
+        missing = [i for i in range(count) if i not in by_id]
+        if missing:
+            raise ValueError(f"response missing records {missing}")
+        
+        return [{"entities": by_id[i].get("entities", []),
+                 "relations": by_id[i].get("relations", []),
+                 "doc_type": doc_type} for i in range(count)]
+    
+    def _messages(self, prompt: str) -> List[Dict[str, str]]:
+        return [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": prompt}
+        ]
+    
+    def _parse_json(self, content: str) -> Dict[str, Any]:
+        # Extract JSON from response (handle reasoning text)
+        if '```json' in content:
+            content = content.split('```json')[1].split('```')[0].strip()
+        elif '```' in content:
+            content = content.split('```')[1].split('```')[0].strip()
+        elif '{' in content:
+            start = content.find('{')
+            end = content.rfind('}') + 1
+            content = content[start:end]
+        
+        return json.loads(content)
 
 llm_extractor = LLMEntityExtractor()
@@ -0,0 +1,183 @@
+import asyncio
+import random
+import threading
+import time
+from collections import deque
+from typing import List, Dict, Any, Optional, Union
+import httpx
+from ..core.config import settings
+
+RETRYABLE_STATUS = {408, 409, 425, 429, 500, 502, 503, 504}
+
+class TokenBucket:
+    """Async token bucket: `rate` requests per second with bursts up to `capacity`"""
+    
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+    
+    async def acquire(self):
+        if self.rate <= 0:
+            return
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+class LLMGateway:
+    """Shared chat-completions client for every LLM caller in the app.
+    
+    All requests go through one pooled httpx.AsyncClient running on a dedicated event
+    loop thread, so the concurrency limit and rate limit are global across request
+    handlers and ingestion workers. Sync callers use complete()/complete_many().
+    """
+    
+    def __init__(self):
+        self.api_key = settings.OPENROUTER_API_KEY
+        self.base_url = settings.OPENROUTER_BASE_URL
+        self.model = settings.LLM_MODEL
+        self.enabled = bool(self.api_key)
+        self.max_concurrency = settings.LLM_MAX_CONCURRENCY
+        self.max_retries = settings.LLM_MAX_RETRIES
+        self.timeout = settings.LLM_TIMEOUT
+        
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.client: Optional[httpx.AsyncClient] = None
+        self.semaphore: Optional[asyncio.Semaphore] = None
+        self.bucket: Optional[TokenBucket] = None
+        self.start_lock = threading.Lock()
+        
+        self.latencies = deque(maxlen=1000)
+        self.calls = 0
+        self.errors = 0
+        self.retries = 0
+        self.in_flight = 0
+    
+    def _ensure_started(self):
+        with self.start_lock:
+            if self.loop:
+                return
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="llm-gateway", daemon=True).start()
+            asyncio.run_coroutine_threadsafe(self._setup(), loop).result()
+            self.loop = loop
+    
+    async def _setup(self):
+        self.client = httpx.AsyncClient(
+            base_url=self.base_url,
+            headers={
+                "Authorization": f"Bearer {self.api_key}",
+                "Content-Type": "application/json"
+            },
+            timeout=self.timeout,
+            limits=httpx.Limits(max_connections=self.max_concurrency,
+                                max_keepalive_connections=self.max_concurrency)
+        )
+        self.semaphore = asyncio.Semaphore(self.max_concurrency)
+        self.bucket = TokenBucket(settings.LLM_RATE_LIMIT_RPS, settings.LLM_RATE_LIMIT_BURST)
+    
+    async def acomplete(self, messages: List[Dict[str, str]], temperature: float = 0.1, model: str = None) -> str:
+        """Run one chat completion on the gateway loop and return the message content"""
+        async with self.semaphore:
+            self.in_flight += 1
+            try:
+                return await self._post_with_retry(messages, temperature, model or self.model)
+            finally:
+                self.in_flight -= 1
+    
+    async def _post_with_retry(self, messages: List[Dict[str, str]], temperature: float, model: str) -> str:
+        for attempt in range(self.max_retries + 1):
+            await self.bucket.acquire()
+            started = time.perf_counter()
+            retry_after = None
+            
+            try:
+                response = await self.client.post("/chat/completions", json={
+                    "model": model,
+                    "messages": messages,
+                    "temperature": temperature
+                })
+                if response.status_code not in RETRYABLE_STATUS:
+                    response.raise_for_status()
+                    content = response.json()["choices"][0]["message"]["content"]
+                    self.calls += 1
+                    self.latencies.append(time.perf_counter() - started)
+                    return content
+                error = httpx.HTTPStatusError(f"LLM returned {response.status_code}",
+                                              request=response.request, response=response)
+                retry_after = response.headers.get("retry-after")
+            except httpx.TransportError as e:
+                error = e
+            except Exception:
+                self.errors += 1
+                raise
+            
+            if attempt == self.max_retries:
+                self.errors += 1
+                raise error
+            
+            self.retries += 1
+            await asyncio.sleep(self._backoff(attempt, retry_after))
+    
+    def _backoff(self, attempt: int, retry_after: Optional[str]) -> float:
+        try:
+            if retry_after:
+                return min(float(retry_after), 60.0)
+        except ValueError:
+            pass
+        # Full jitter exponential backoff
+        return random.uniform(0, min(30.0, 0.5 * (2 ** attempt)))
+    
+    def complete(self, messages: List[Dict[str, str]], temperature: float = 0.1, model: str = None) -> str:
+        self._ensure_started()
+        future = asyncio.run_coroutine_threadsafe(self.acomplete(messages, temperature, model), self.loop)
+        return future.result()
+    
+    def complete_many(self, requests: List[List[Dict[str, str]]], temperature: float = 0.1,
+                      model: str = None) -> List[Union[str, Exception]]:
+        """Run many completions concurrently; failures come back as exception objects"""
+        if not requests:
+            return []
+        self._ensure_started()
+        
+        async def run_all():
+            return await asyncio.gather(*(self.acomplete(m, temperature, model) for m in requests),
+                                        return_exceptions=True)
+        
+        return asyncio.run_coroutine_threadsafe(run_all(), self.loop).result()
+    
+    def metrics(self) -> Dict[str, Any]:
+        latencies = sorted(self.latencies)
+        
+        def percentile(p: float) -> Optional[float]:
+            if not latencies:
+                return None
+            return round(latencies[min(int(len(latencies) * p), len(latencies) - 1)], 3)
+        
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "retries": self.retries,
+            "in_flight": self.in_flight,
+            "max_concurrency": self.max_concurrency,
+            "latency_avg_s": round(sum(latencies) / len(latencies), 3) if latencies else None,
+            "latency_p50_s": percentile(0.5),
+            "latency_p95_s": percentile(0.95)
+        }
+    
+    def close(self):
+        if not self.loop:
+            return
+        asyncio.run_coroutine_threadsafe(self.client.aclose(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.loop = None
+
+llm_gateway = LLMGateway()
@@ -2,13 +2,16 @@ import pandas as pd
 import json
 from pathlib import Path
 from docx import Document
-from typing import List, Dict, Any
+from openpyxl import load_workbook
+from typing import List, Dict, Any, Iterator, Optional
 
 try:
     from PyPDF2 import PdfReader
 except ImportError:
     PdfReader = None
 
+DEFAULT_BATCH_SIZE = 1000
+
 class Parser:
     def parse_file(self, file_path: str) -> List[Dict[str, Any]]:
         ext = Path(file_path).suffix.lower()
@@ -33,16 +36,7 @@ class Parser:
         if df.empty:
             return []
         
-        # Convert each row to a content string for better entity extraction
-        records = []
-        for _, row in df.iterrows():
-            # Create a readable content string from the row
-            content_parts = [f"{col}: {val}" for col, val in row.items() if pd.notna(val)]
-            if content_parts:
-                records.append({
-                    'content': ' | '.join(content_parts),
-                    **row.to_dict()
-                })
+        records = self._frame_to_records(df)
         return records if records else df.to_dict('records')
     
     def _parse_excel(self, file_path: str) -> List[Dict[str, Any]]:
@@ -50,17 +44,112 @@ class Parser:
         if df.empty:
             return []
         
-        # Convert each row to a content string
-        records = []
-        for _, row in df.iterrows():
-            content_parts = [f"{col}: {val}" for col, val in row.items() if pd.notna(val)]
-            if content_parts:
-                records.append({
-                    'content': ' | '.join(content_parts),
-                    **row.to_dict()
-                })
+        records = self._frame_to_records(df)
         return records if records else df.to_dict('records')
     
+    def _frame_to_records(self, df: pd.DataFrame) -> List[Dict[str, Any]]:
+        """Build "col: val | ..." content strings column-wise instead of per row"""
+        content = pd.Series('', index=df.index, dtype=object)
+        for col in df.columns:
+            present = df[col].notna()
+            labelled = f"{col}: " + df[col].astype(str)
+            content = content.mask(present & content.ne(''), content + ' | ')
+            content = content.mask(present, content + labelled)
+        
+        keep = content.ne('')
+        if not keep.any():
+            return []
+        
+        # Row values win over the generated content if the sheet has its own column
+        rows = df[keep]
+        if 'content' not in rows.columns:
+            rows = rows.copy()
+            rows.insert(0, 'content', content[keep])
+        return rows.to_dict('records')
+    
+    def iter_records(self, file_path: str, batch_size: int = DEFAULT_BATCH_SIZE) -> Iterator[List[Dict[str, Any]]]:
+        """Yield parsed records in batches so large sheets never sit in memory whole"""
+        ext = Path(file_path).suffix.lower()
+        
+        if ext == '.csv':
+            yield from self._iter_csv(file_path, batch_size)
+        elif ext == '.xlsx':
+            yield from self._iter_excel(file_path, batch_size)
+        else:
+            records = self.parse_file(file_path)
+            for start in range(0, len(records), batch_size):
+                yield records[start:start + batch_size]
+    
+    def count_rows(self, file_path: str) -> Optional[int]:
+        """Cheap row-count estimate used for progress reporting"""
+        ext = Path(file_path).suffix.lower()
+        
+        if ext == '.csv':
+            lines = 0
+            with open(file_path, 'rb') as f:
+                for block in iter(lambda: f.read(1024 * 1024), b''):
+                    lines += block.count(b'\n')
+            return max(lines - 1, 0)
+        elif ext == '.xlsx':
+            workbook = load_workbook(file_path, read_only=True)
+            try:
+                max_row = workbook.active.max_row
+            finally:
+                workbook.close()
+            return max(max_row - 1, 0) if max_row else None
+        return None
+    
+    def _iter_csv(self, file_path: str, batch_size: int) -> Iterator[List[Dict[str, Any]]]:
+        try:
+            reader = pd.read_csv(file_path, chunksize=batch_size)
+        except pd.errors.EmptyDataError:
+            return
+        
+        with reader:
+            for chunk in reader:
+                records = self._frame_to_records(chunk)
+                if records:
+                    yield records
+    
+    def _iter_excel(self, file_path: str, batch_size: int) -> Iterator[List[Dict[str, Any]]]:
+        workbook = load_workbook(file_path, read_only=True, data_only=True)
+        try:
+            rows = workbook.active.iter_rows(values_only=True)
+            header = next(rows, None)
+            if header is None:
+                return
+            
+            columns = self._excel_columns(header)
+            batch = []
+            for row in rows:
+                batch.append(row)
+                if len(batch) >= batch_size:
+                    records = self._frame_to_records(pd.DataFrame(batch, columns=columns))
+                    if records:
+                        yield records
+                    batch = []
+            
+            if batch:
+                records = self._frame_to_records(pd.DataFrame(batch, columns=columns))
+                if records:
+                    yield records
+        finally:
+            workbook.close()
+    
+    def _excel_columns(self, header: tuple) -> List[Any]:
+        """Column names as pd.read_excel gives them: "Unnamed: i" for blanks, "col.1", "col.2" for repeats"""
+        names = [col if col is not None and col != "" else f"Unnamed: {i}" for i, col in enumerate(header)]
+        counts = {}
+        for i, col in enumerate(names):
+            count = counts.get(col, 0)
+            while count > 0:
+                counts[col] = count + 1
+                col = f"{col}.{count}"
+                count = counts.get(col, 0)
+            names[i] = col
+            counts[col] = count + 1
+        return names
+    
     def _parse_json(self, file_path: str) -> List[Dict[str, Any]]:
         with open(file_path, 'r') as f:
             data = json.load(f)
@@ -22,22 +22,9 @@ class PatternExtractor:
             if not value or value.lower() in ['', 'none', 'null']:
                 continue
             
-            # Determine entity type
-            if 'id' in label.lower():
-                entity_type = 'ID'
+            entity_type = self.classify(label, value)
+            if entity_type == 'ID':
                 deal_id = value
-            elif 'client' in label.lower() or 'company' in label.lower():
-                entity_type = 'ORG'
-            elif 'name' in label.lower() and 'deal' in label.lower():
-                entity_type = 'PRODUCT'
-            elif 'amount' in label.lower() or 'price' in label.lower() or '$' in value:
-                entity_type = 'MONEY'
-            elif 'status' in label.lower():
-                entity_type = 'STATUS'
-            elif 'date' in label.lower() or 'on' in label.lower():
-                entity_type = 'DATE'
-            else:
-                entity_type = 'VALUE'
             
             entities.append({
                 'text': value,
@@ -59,5 +46,22 @@ class PatternExtractor:
             'relations': relations,
             'doc_type': 'structured'
         }
+    
+    def classify(self, label: str, value: str) -> str:
+        """Determine entity type from a field label and its value"""
+        label = label.lower()
+        if 'id' in label:
+            return 'ID'
+        elif 'client' in label or 'company' in label:
+            return 'ORG'
+        elif 'name' in label and 'deal' in label:
+            return 'PRODUCT'
+        elif 'amount' in label or 'price' in label or '$' in value:
+            return 'MONEY'
+        elif 'status' in label:
+            return 'STATUS'
+        elif 'date' in label or 'on' in label:
+            return 'DATE'
+        return 'VALUE'
 
 pattern_extractor = PatternExtractor()
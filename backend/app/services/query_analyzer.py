@@ -1,19 +1,10 @@
-from openai import OpenAI
 from typing import Dict, Any
 import json
-from ..core.config import settings
+from .llm_gateway import llm_gateway
 
 class QueryAnalyzer:
     def __init__(self):
-        try:
-            self.client = OpenAI(
-                api_key=settings.OPENROUTER_API_KEY,
-                base_url=settings.OPENROUTER_BASE_URL
-            )
-            self.enabled = True
-        except:
-            self.client = None
-            self.enabled = False
+        self.enabled = llm_gateway.enabled
     
     def analyze_query(self, query: str) -> Dict[str, Any]:
         """Analyze query to determine if it needs aggregation, filtering, or simple search"""
@@ -47,8 +38,7 @@ Return JSON:
 }}"""
         
         try:
-            response = self.client.chat.completions.create(
-                model=settings.LLM_MODEL,
+            content = llm_gateway.complete(
                 messages=[
                     {"role": "system", "content": "You are a query analysis expert. Return valid JSON only."},
                     {"role": "user", "content": prompt}
@@ -56,7 +46,7 @@ Return JSON:
                 temperature=0.1
             )
             
-            result = json.loads(response.choices[0].message.content)
+            result = json.loads(content)
             return result
         except Exception as e:
             print(f"Query analysis error: {e}")
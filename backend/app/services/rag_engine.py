@@ -1,20 +1,144 @@
 from sentence_transformers import SentenceTransformer, CrossEncoder
 import faiss
 import numpy as np
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Set, Callable
+import os
 import pickle
+import threading
+import time
 from pathlib import Path
-from .supabase_client import supabase_client
+from ..core.config import settings
+from .embedding_sync import embedding_sync
+from .embedding_cache import embedding_cache
+from .ann_index import (ann_builder, new_index, stage, is_flat, is_quantized, is_id_mapped, stored_ids,
+                        decode_vectors, remove_ids, search_parameters, exact_search, public_report)
+from .user_locks import user_locks
+
+def positions_by(documents: List[Optional[Dict[str, Any]]], field: str) -> Dict[str, List[int]]:
+    """field value -> positions (= chunk / FAISS ids) of the live documents with that value"""
+    positions = {}
+    for i, doc in enumerate(documents):
+        value = doc.get(field) if doc is not None else None
+        if value is not None:
+            positions.setdefault(value, []).append(i)
+    return positions
+
+def doc_type_positions(documents: List[Optional[Dict[str, Any]]]) -> Dict[str, List[int]]:
+    """doc_type -> positions (= FAISS ids) of the documents of that type"""
+    return positions_by(documents, 'doc_type')
+
+def live_ids(documents: List[Optional[Dict[str, Any]]]) -> np.ndarray:
+    """Ids of the documents not deleted"""
+    return np.array([i for i, doc in enumerate(documents) if doc is not None], dtype=np.int64)
+
+class IndexVersion:
+    """Immutable published state of a user's vector index: searched lock-free, never mutated
+    
+    documents is indexed by chunk id; deleted chunks are None, and the ids in deleted
+    still have vectors in the index until it is compacted, so searches exclude them.
+    """
+    
+    def __init__(self, index, documents: List[Optional[Dict[str, Any]]], doc_types: Dict[str, List[int]],
+                 vectors=None, deleted: Set[int] = ()):
+        self.index = index
+        self.documents = documents
+        # Full-precision vectors by id (memory-mapped), for exact re-scoring of quantized results
+        self.vectors = vectors
+        self.deleted = np.array(sorted(deleted), dtype=np.int64)
+        self.doc_type_ids = {doc_type: np.array(ids, dtype=np.int64) for doc_type, ids in doc_types.items()}
+        self.selectors: Dict[Optional[str], Any] = {}
+        self.decoded = None
+    
+    def live_ids(self) -> np.ndarray:
+        return live_ids(self.documents)
+    
+    def search_params(self, doc_type: Optional[str] = None):
+        """Parameters restricting a search to one doc_type's ids, or to ids not deleted (None: no restriction)
+        
+        Built per search, around selectors built once per version: an IndexIDMap swaps
+        the selector in the parameters it is given while it searches.
+        """
+        cached = self.selectors.get(doc_type)
+        if cached is None:
+            if doc_type is not None:
+                ids = self.doc_type_ids[doc_type]
+                cached = (faiss.IDSelectorBatch(len(ids), faiss.swig_ptr(ids)),)
+            elif len(self.deleted):
+                # Kept together: IDSelectorNot only holds a raw pointer to the batch
+                deleted = faiss.IDSelectorBatch(len(self.deleted), faiss.swig_ptr(self.deleted))
+                cached = (faiss.IDSelectorNot(deleted), deleted)
+            else:
+                cached = (None,)
+            self.selectors[doc_type] = cached
+        return search_parameters(self.index, cached[0]) if cached[0] is not None else None
+    
+    def id_vectors(self):
+        """Full-precision vectors by id: the memory-mapped file, or decoded from the index if it falls short"""
+        if self.vectors is not None:
+            return self.vectors
+        if self.decoded is None:
+            self.decoded = decode_vectors(self.index, len(self.documents))
+        return self.decoded
+    
+    def without(self, ids: List[int], doc_types: Dict[str, List[int]]) -> 'IndexVersion':
+        """Next version with ids deleted, sharing the index and vectors; doc_types holds the
+        remaining ids of the doc_types those ids had"""
+        documents = list(self.documents)
+        for i in ids:
+            documents[i] = None
+        version = IndexVersion(self.index, documents, {}, self.vectors)
+        version.deleted = np.union1d(self.deleted, np.array(ids, dtype=np.int64))
+        version.doc_type_ids = dict(self.doc_type_ids)
+        for doc_type, remaining in doc_types.items():
+            if remaining:
+                version.doc_type_ids[doc_type] = np.array(remaining, dtype=np.int64)
+            else:
+                version.doc_type_ids.pop(doc_type, None)
+        version.decoded = self.decoded
+        return version
 
 class RAGEngine:
     def __init__(self):
-        self.encoder = SentenceTransformer('all-MiniLM-L6-v2')
+        self.model_name = settings.EMBED_MODEL
+        self.encoder = SentenceTransformer(self.model_name)
+        self.batch_size = settings.EMBED_BATCH_SIZE
         self.reranker = CrossEncoder('cross-encoder/ms-marco-MiniLM-L-6-v2')
         self.chunk_size = 500
         self.storage_dir = Path("storage")
         self.storage_dir.mkdir(exist_ok=True)
+        # Writer working state, only touched while holding user_locks.writer(user_id)
         self.indices = {}
         self.documents = {}
+        # user_id -> doc_type / file_id -> positions, extended as documents are added
+        self.doc_types: Dict[str, Dict[str, List[int]]] = {}
+        self.file_chunks: Dict[str, Dict[str, List[int]]] = {}
+        # user_id -> ids of deleted documents whose vectors the index still holds
+        self.tombstones: Dict[str, Set[int]] = {}
+        # user_id -> float32 embeddings added since the last save, not yet in {user}.vec
+        self.pending_vectors: Dict[str, List[np.ndarray]] = {}
+        # Last saved state per user, what searches read, and the (inode, mtime, size) of the
+        # .index / .pkl files it came from: another worker process saving replaces them
+        self.published: Dict[str, IndexVersion] = {}
+        self.published_files: Dict[str, tuple] = {}
+        self.load_lock = threading.Lock()
+        # Called with (user_id, version) for every version published, e.g. to index its documents
+        self.publish_handlers: List[Callable[[str, IndexVersion], None]] = []
+        # Users whose index is being promoted (quantized / ANN) or compacted, and the last tuning report
+        self.promoting = set()
+        self.index_reports: Dict[str, Dict[str, Any]] = {}
+        self.compact_ratio = settings.VECTOR_COMPACT_RATIO
+        # Another worker process saved this user's index: reload the working state on next use
+        user_locks.on_stale(self.forget_working)
+    
+    def on_publish(self, handler: Callable[[str, IndexVersion], None]):
+        """Call handler(user_id, version) whenever a new version of the user's index is published"""
+        self.publish_handlers.append(handler)
+    
+    def _publish(self, user_id: str, version: IndexVersion) -> IndexVersion:
+        self.published[user_id] = version
+        for handler in self.publish_handlers:
+            handler(user_id, version)
+        return version
     
     def chunk_text(self, text: str) -> List[str]:
         words = text.split()
@@ -23,12 +147,37 @@ class RAGEngine:
     def generate_embedding(self, text: str) -> np.ndarray:
         return self.encoder.encode(text, convert_to_numpy=True)
     
-    def store_embeddings(self, data: List[Dict[str, Any]], file_id: str, user_id: str):
+    def embed_chunks(self, chunks: List[str]) -> np.ndarray:
+        """Embeddings for chunks, in order; only chunks not seen before (by model + hash) hit the encoder"""
+        unique = list(dict.fromkeys(chunks))
+        vectors = {}
+        keys = {}
+        if settings.EMBED_CACHE_ENABLED:
+            keys = {chunk: embedding_cache.make_key(chunk, self.model_name) for chunk in unique}
+            cached = embedding_cache.get_many(list(keys.values()))
+            vectors = {chunk: cached[key] for chunk, key in keys.items() if key in cached}
+        
+        # Similar lengths per batch keep padding (and wasted encoder work) to a minimum
+        misses = sorted((chunk for chunk in unique if chunk not in vectors), key=len)
+        for start in range(0, len(misses), self.batch_size):
+            batch = misses[start:start + self.batch_size]
+            encoded = self.encoder.encode(batch, batch_size=len(batch), convert_to_numpy=True).astype(np.float32)
+            vectors.update(zip(batch, encoded))
+            if keys:
+                embedding_cache.put_many([(keys[chunk], vector) for chunk, vector in zip(batch, encoded)], self.model_name)
+        
+        if misses:
+            print(f"🧮 Encoded {len(misses)} of {len(chunks)} chunks ({len(chunks) - len(misses)} reused)")
+        return np.stack([vectors[chunk] for chunk in chunks])
+    
+    def store_embeddings(self, data: List[Dict[str, Any]], file_id: str, user_id: str, doc_type: str = None,
+                         save: bool = True):
         chunks = []
         metadata = []
         
         for item in data:
             content = str(item.get('content', ''))
+            item = {**item, "file_id": file_id, "doc_type": doc_type}
             
             # If content is short (< 1000 chars), keep as single chunk
             if len(content) < 1000:
@@ -40,47 +189,114 @@ class RAGEngine:
                 chunks.extend(text_chunks)
                 metadata.extend([{**item, "chunk": chunk} for chunk in text_chunks])
         
-        embeddings = self.encoder.encode(chunks, convert_to_numpy=True)
+        if not chunks:
+            return
+        
+        embeddings = self.embed_chunks(chunks)
         
         if user_id not in self.indices:
             dimension = embeddings.shape[1]
-            self.indices[user_id] = faiss.IndexFlatL2(dimension)
+            self.indices[user_id] = new_index(dimension)
             self.documents[user_id] = []
+            self.doc_types[user_id] = {}
+            self.file_chunks[user_id] = {}
+            self.tombstones[user_id] = set()
         
-        self.indices[user_id].add(embeddings)
+        # New documents get the next chunk ids, never reused, so the position lists stay sorted
+        start = len(self.documents[user_id])
+        ids = np.arange(start, start + len(metadata), dtype=np.int64)
+        if doc_type is not None:
+            self.doc_types[user_id].setdefault(doc_type, []).extend(ids.tolist())
+        self.file_chunks[user_id].setdefault(file_id, []).extend(ids.tolist())
+        self.indices[user_id].add_with_ids(embeddings, ids)
         self.documents[user_id].extend(metadata)
+        self.pending_vectors.setdefault(user_id, []).append(np.asarray(embeddings, dtype=np.float32))
         
-        self._save_index(user_id)
+        if save:
+            self._save_index(user_id)
     
-    def search_similar(self, query: str, user_id: str, top_k: int = 10, doc_type_filter: str = None) -> List[Dict[str, Any]]:
-        if user_id not in self.indices:
-            self._load_index(user_id)
+    def current(self, user_id: str) -> Optional[IndexVersion]:
+        """The user's last published index version, reloaded from disk when another process saved since"""
+        identity = self._saved_identity(user_id)
+        version = self.published.get(user_id)
+        if version is None or self.published_files.get(user_id) != identity:
+            with self.load_lock:
+                version = self._reload_published(user_id)
+        return version
+    
+    def _reload_published(self, user_id: str) -> Optional[IndexVersion]:
+        index_path = self.storage_dir / f"{user_id}.index"
+        docs_path = self.storage_dir / f"{user_id}.pkl"
+        # The two files are replaced one after the other: retry until both come from the same save
+        for _ in range(5):
+            identity = self._saved_identity(user_id)
+            if identity is None:
+                self.published.pop(user_id, None)
+                self.published_files.pop(user_id, None)
+                return None
+            if self.published_files.get(user_id) == identity and user_id in self.published:
+                return self.published[user_id]
+            try:
+                index = faiss.read_index(str(index_path))
+                with open(docs_path, 'rb') as f:
+                    documents = pickle.load(f)
+                self._apply_deletes(user_id, documents)
+            except (OSError, RuntimeError, EOFError, pickle.UnpicklingError):
+                continue
+            if self._saved_identity(user_id) != identity:
+                continue
+            self.published_files[user_id] = identity
+            return self._publish(user_id, IndexVersion(index, documents, doc_type_positions(documents),
+                                                       self._map_vectors(user_id, index.d, len(documents)),
+                                                       self._deleted_ids(index, documents)))
+        # Still being rewritten: keep serving what we have
+        return self.published.get(user_id)
+    
+    def _saved_identity(self, user_id: str) -> Optional[tuple]:
+        """(inode, mtime, size) of the saved .index, .pkl and .del, None if .index or .pkl is missing"""
+        try:
+            stats = [os.stat(self.storage_dir / f"{user_id}{ext}") for ext in (".index", ".pkl")]
+        except FileNotFoundError:
+            return None
+        try:
+            stats.append(os.stat(self.delete_log_path(user_id)))
+        except FileNotFoundError:
+            pass
+        return tuple((stat.st_ino, stat.st_mtime_ns, stat.st_size) for stat in stats)
+    
+    def search_similar(self, query: str, user_id: str, top_k: int = 10, doc_type_filter: str = None,
+                       version: IndexVersion = None) -> List[Dict[str, Any]]:
+        if version is None:
+            version = self.current(user_id)
         
-        if user_id not in self.indices or self.indices[user_id].ntotal == 0:
+        if version is None or version.index.ntotal == 0:
             return []
+        documents = version.documents
         
-        # Filter documents by doc_type if specified
-        if doc_type_filter and user_id in self.documents:
-            filtered_indices = [i for i, doc in enumerate(self.documents[user_id])
-                              if doc.get('metadata', {}).get('doc_type') == doc_type_filter]
-            
-            if not filtered_indices:
+        query_embedding = self.generate_embedding(query).reshape(1, -1)
+        if doc_type_filter:
+            if doc_type_filter not in version.doc_type_ids:
                 return []
-            
-            # Search only in filtered documents
-            query_embedding = self.generate_embedding(query).reshape(1, -1)
-            distances, indices = self.indices[user_id].search(query_embedding, min(top_k * 2, self.indices[user_id].ntotal))
-            
-            # Filter results to only include documents with matching doc_type
-            candidates = [(self.documents[user_id][idx], 1 / (1 + distances[0][i])) 
-                         for i, idx in enumerate(indices[0]) 
-                         if idx < len(self.documents[user_id]) and idx in filtered_indices]
+            # Pre-filtered: the index only considers ids of that doc_type, so rare types still fill top-k
+            ids = version.doc_type_ids[doc_type_filter]
+            k = min(top_k * 2, len(ids))
+            if len(ids) <= ann_builder.exact_filter_max and not is_flat(version.index):
+                # HNSW / IVF walks can end before reaching k matches of a rare type
+                # Scanned exactly from the vectors by id rather than kept as a per-type index
+                distances, indices = exact_search(query_embedding.astype(np.float32), ids, version.id_vectors(), k)
+            else:
+                distances, indices = ann_builder.search(version.index, query_embedding, k, version.vectors,
+                                                        params=version.search_params(doc_type_filter))
         else:
-            query_embedding = self.generate_embedding(query).reshape(1, -1)
-            distances, indices = self.indices[user_id].search(query_embedding, min(top_k * 2, self.indices[user_id].ntotal))
-            
-            candidates = [(self.documents[user_id][idx], 1 / (1 + distances[0][i])) 
-                         for i, idx in enumerate(indices[0]) if idx < len(self.documents[user_id])]
+            k = min(top_k * 2, version.index.ntotal - len(version.deleted))
+            if k <= 0:
+                return []
+            # Vectors of deleted documents stay in the index until compaction and are skipped here
+            distances, indices = ann_builder.search(version.index, query_embedding, k, version.vectors,
+                                                    params=version.search_params())
+        
+        candidates = [(documents[idx], 1 / (1 + distances[0][i]))
+                     for i, idx in enumerate(indices[0]) if 0 <= idx < len(documents) and documents[idx] is not None]
         
         if not candidates:
             return []
@@ -94,23 +310,324 @@ class RAGEngine:
                 for (doc, _), score in reranked]
     
     def _save_index(self, user_id: str):
-        faiss.write_index(self.indices[user_id], str(self.storage_dir / f"{user_id}.index"))
-        with open(self.storage_dir / f"{user_id}.pkl", 'wb') as f:
+        # Vectors first: {user}.vec may run ahead of the index on disk, never behind it
+        self._flush_vectors(user_id)
+        
+        # Written aside and renamed, so a reader loading from disk never sees a half-written file
+        index_path = self.storage_dir / f"{user_id}.index"
+        docs_path = self.storage_dir / f"{user_id}.pkl"
+        faiss.write_index(self.indices[user_id], str(index_path) + ".tmp")
+        with open(str(docs_path) + ".tmp", 'wb') as f:
             pickle.dump(self.documents[user_id], f)
+        os.replace(str(index_path) + ".tmp", index_path)
+        os.replace(str(docs_path) + ".tmp", docs_path)
+        # The saved documents already hold every delete logged since the last save
+        self.delete_log_path(user_id).unlink(missing_ok=True)
+        self.published_files[user_id] = self._saved_identity(user_id)
         
-        if supabase_client.enabled:
-            try:
-                for doc in self.documents[user_id]:
-                    embedding = self.encoder.encode(doc['chunk']).tolist()
-                    supabase_client.client.table('embeddings').upsert({
-                        'user_id': user_id,
-                        'content': doc.get('content', ''),
-                        'chunk': doc['chunk'],
-                        'embedding': embedding
-                    }).execute()
-                print(f"✅ Saved {len(self.documents[user_id])} embeddings to Supabase")
-            except Exception as e:
-                print(f"⚠️ Supabase save failed: {e}")
+        # Copy-on-write: searches keep the version they started with, new ones see this one
+        vectors = self._map_vectors(user_id, self.indices[user_id].d, len(self.documents[user_id]))
+        self._publish(user_id, IndexVersion(faiss.clone_index(self.indices[user_id]),
+                                            list(self.documents[user_id]), self.doc_types[user_id], vectors,
+                                            self.tombstones[user_id]))
+        
+        # Only the documents added since the last save go to Supabase, in the background
+        embedding_sync.mark(user_id, vectors, self.documents[user_id])
+        self._maybe_promote(user_id, self.published[user_id])
+    
+    def delete_files(self, user_id: str, file_ids: List[str]) -> int:
+        """Delete the chunks of the given files without rewriting the saved index
+        
+        Their documents become None under their ids and their vectors turn into
+        tombstones: searches skip them from the next version on, and once they pass
+        VECTOR_COMPACT_RATIO of the index a background compaction removes them.
+        The ids are appended to {user}.del, which loads apply on top of the .pkl until
+        the next full save; the next version shares the published index.
+        
+        Chunk ids are positions, so compaction leaves the deleted chunks' rows in
+        {user}.vec and their None entries in the documents: those only shrink with
+        reclaim() (migrate_vectors.py --reclaim), run offline.
+        """
+        with user_locks.writer(user_id):
+            if user_id not in self.indices:
+                self._load_index(user_id)
+            if user_id not in self.indices:
+                return 0
+            deleted = []
+            for file_id in set(file_ids):
+                deleted.extend(self.file_chunks[user_id].pop(file_id, []))
+            if not deleted:
+                return 0
+            
+            documents = self.documents[user_id]
+            published = self.published.get(user_id)
+            # Logged alone only when the published version is what is saved and no adds await a save
+            incremental = (published is not None and len(published.documents) == len(documents)
+                           and not self.pending_vectors.get(user_id)
+                           and self.published_files.get(user_id) == self._saved_identity(user_id))
+            by_type = {}
+            for i in deleted:
+                by_type.setdefault(documents[i].get('doc_type'), set()).add(i)
+                documents[i] = None
+            for doc_type, ids in by_type.items():
+                remaining = [i for i in self.doc_types[user_id].get(doc_type, []) if i not in ids]
+                if remaining:
+                    self.doc_types[user_id][doc_type] = remaining
+                else:
+                    self.doc_types[user_id].pop(doc_type, None)
+            self.tombstones[user_id].update(deleted)
+            if incremental:
+                self._log_deletes(user_id, deleted)
+                self._publish(user_id, published.without(
+                    deleted, {doc_type: self.doc_types[user_id].get(doc_type, []) for doc_type in by_type}))
+                self._maybe_promote(user_id, self.published[user_id])
+            else:
+                self._save_index(user_id)
+            embedding_sync.remove(user_id, deleted)
+        
+        print(f"🗑️ Deleted {len(deleted)} chunks of {len(file_ids)} files for {user_id}")
+        return len(deleted)
+    
+    def _maybe_promote(self, user_id: str, version: IndexVersion):
+        """Rebuild in the background when the index outgrew its stage or holds too many deleted vectors
+        
+        Called by writers after publishing a version, never by searches. One process at a
+        time rebuilds a user's index: the others see its result as a newly saved version.
+        """
+        promote = ann_builder.should_promote(version.index)
+        compact = len(version.deleted) > 0 and len(version.deleted) >= self.compact_ratio * version.index.ntotal
+        if not (promote or compact):
+            return
+        with self.load_lock:
+            if user_id in self.promoting:
+                return
+            release = user_locks.try_claim(user_id, "promote")
+            if release is None:
+                return
+            self.promoting.add(user_id)
+        # The current index keeps serving while the new one is built
+        threading.Thread(target=self._promote, args=(user_id, version, promote, release),
+                         name="ann-promote", daemon=True).start()
+    
+    def _promote(self, user_id: str, version: IndexVersion, promote: bool = True, release=None):
+        try:
+            # Built from the published version, which nothing mutates, so no lock is needed here
+            n = len(version.documents)
+            start = time.time()
+            report = None
+            # Compacting alone removes the deleted vectors in place where the index type can (all but HNSW)
+            index = None if promote else remove_ids(version.index, version.deleted)
+            if index is None:
+                live = version.live_ids()
+                vectors = version.id_vectors()
+                index = ann_builder.build(np.asarray(vectors[live]), live)
+                if len(live):
+                    report = ann_builder.tune(index, vectors, live)
+            
+            with user_locks.writer(user_id):
+                if user_id not in self.indices:
+                    self._load_index(user_id)
+                working = self.indices.get(user_id)
+                if working is None or len(self.documents[user_id]) < n:
+                    # Deleted or rewritten meanwhile
+                    return
+                if (not ann_builder.should_promote(working)) if promote else stage(working) != stage(version.index):
+                    # Already promoted meanwhile
+                    return
+                # Catch up with what was added or deleted while building, then swap in as the next version
+                self._swap_index(user_id, index, version.documents)
+            
+            if report is not None:
+                self.index_reports[user_id] = public_report(report)
+            if not promote:
+                print(f"🧹 Compacted {user_id}: removed {len(version.deleted)} deleted vectors ({time.time() - start:.0f}s)")
+            elif report is not None:
+                print(f"🚀 Promoted {user_id} to {report['index']} ({report['vectors']} vectors, {report['bytes_per_vector']} B each, "
+                      f"{time.time() - start:.0f}s): recall@{report['k']} {report['steps'][-1]['recall']} "
+                      f"at {report['steps'][-1]['ms_per_query']} ms vs exact {report['exact_ms']} ms")
+        except Exception as e:
+            print(f"⚠️ Index rebuild failed for {user_id}, keeping the current index: {e}")
+        finally:
+            with self.load_lock:
+                self.promoting.discard(user_id)
+                if release is not None:
+                    release()
+    
+    def index_report(self, user_id: str) -> Dict[str, Any]:
+        """Recall-vs-latency of the user's current index against exact search"""
+        version = self.current(user_id)
+        if version is None or version.index.ntotal == 0:
+            return {"index": None, "vectors": 0}
+        report = public_report(ann_builder.report(version.index, version.id_vectors(), stored_ids(version.index)))
+        if user_id in self.index_reports:
+            report["promotion"] = self.index_reports[user_id]
+        return report
+    
+    def migrate_index(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """Rebuild a stored index with the configured quantization / ANN settings for its size,
+        without the vectors of deleted documents"""
+        with user_locks.writer(user_id):
+            if user_id not in self.indices:
+                self._load_index(user_id)
+            if user_id not in self.indices:
+                return None
+            self._flush_vectors(user_id)
+            documents = list(self.documents[user_id])
+            vectors = self._map_vectors(user_id, self.indices[user_id].d, len(documents))
+            if vectors is None:
+                return None
+            live = live_ids(documents)
+            index = ann_builder.build(np.asarray(vectors[live]), live)
+            report = public_report(ann_builder.tune(index, vectors, live)) if len(live) else {}
+            self._swap_index(user_id, index, documents)
+        self.index_reports[user_id] = report
+        return report
+    
+    def reclaim(self, user_id: str) -> Optional[int]:
+        """Renumber the user's live chunks 0..n-1, dropping the deleted ones from {user}.vec and .pkl;
+        returns how many ids were reclaimed (None without an index)
+        
+        Searches and writers of other processes still use the old ids: only run it with the
+        API stopped. The user's embeddings are resent to Supabase under the new ids.
+        """
+        with user_locks.writer(user_id):
+            if user_id not in self.indices:
+                self._load_index(user_id)
+            if user_id not in self.indices:
+                return None
+            self._flush_vectors(user_id)
+            documents = self.documents[user_id]
+            d = self.indices[user_id].d
+            live = live_ids(documents)
+            if len(live) == len(documents):
+                return 0
+            
+            path = self.vector_path(user_id)
+            tmp = str(path) + ".tmp"
+            vectors = self._map_vectors(user_id, d, len(documents))
+            with open(tmp, 'wb') as f:
+                for start in range(0, len(live), 65536):
+                    f.write(np.asarray(vectors[live[start:start + 65536]]).tobytes())
+            del vectors
+            # Kept until the renumbered documents are saved: a load in between puts it back
+            os.replace(path, self.reclaim_backup_path(user_id))
+            os.replace(tmp, path)
+            
+            renumbered = [documents[i] for i in live]
+            ids = np.arange(len(live), dtype=np.int64)
+            vectors = self._map_vectors(user_id, d, len(renumbered))
+            index = ann_builder.build(np.asarray(vectors), ids) if len(ids) else new_index(d)
+            self.index_reports[user_id] = public_report(ann_builder.tune(index, vectors, ids)) if len(ids) else {}
+            self.indices[user_id] = index
+            self.documents[user_id] = renumbered
+            self.doc_types[user_id] = doc_type_positions(renumbered)
+            self.file_chunks[user_id] = positions_by(renumbered, 'file_id')
+            self.tombstones[user_id] = set()
+            embedding_sync.renumber(user_id, len(renumbered), len(documents))
+            self._save_index(user_id)
+            self.reclaim_backup_path(user_id).unlink()
+        return len(documents) - len(renumbered)
+    
+    def reclaim_backup_path(self, user_id: str) -> Path:
+        return self.storage_dir / f"{user_id}.vec.reclaim"
+    
+    def _swap_index(self, user_id: str, index, documents: List[Optional[Dict[str, Any]]]):
+        """Replace the working index with one built from documents, an earlier copy of the user's
+        (writer lock held)"""
+        n = len(documents)
+        current = self.documents[user_id]
+        added = np.array([i for i in range(n, len(current)) if current[i] is not None], dtype=np.int64)
+        if len(added):
+            self._flush_vectors(user_id)
+            index.add_with_ids(np.asarray(self._map_vectors(user_id, index.d, len(current))[added]), added)
+        # Deleted after the copy was taken: the new index still holds those vectors
+        self.tombstones[user_id] = {i for i in self.tombstones[user_id] if i < n and documents[i] is not None}
+        self.indices[user_id] = index
+        self._save_index(user_id)
+    
+    def vector_path(self, user_id: str) -> Path:
+        return self.storage_dir / f"{user_id}.vec"
+    
+    def _flush_vectors(self, user_id: str):
+        pending = self.pending_vectors.pop(user_id, None)
+        if pending:
+            with open(self.vector_path(user_id), 'ab') as f:
+                for block in pending:
+                    f.write(block.tobytes())
+    
+    def delete_log_path(self, user_id: str) -> Path:
+        return self.storage_dir / f"{user_id}.del"
+    
+    def _log_deletes(self, user_id: str, ids: List[int]):
+        with open(self.delete_log_path(user_id), 'ab') as f:
+            f.write(np.array(ids, dtype=np.int64).tobytes())
+        self.published_files[user_id] = self._saved_identity(user_id)
+    
+    def _apply_deletes(self, user_id: str, documents: List[Optional[Dict[str, Any]]]):
+        """Set the documents deleted since the last full save to None"""
+        path = self.delete_log_path(user_id)
+        if not path.exists():
+            return
+        data = path.read_bytes()
+        # A delete cut short mid-write leaves a partial id at the end
+        ids = np.frombuffer(data[:len(data) - len(data) % 8], dtype=np.int64)
+        for i in ids[ids < len(documents)].tolist():
+            documents[i] = None
+    
+    def _map_vectors(self, user_id: str, d: int, count: int):
+        """Read-only memory map of the vectors of ids 0..count-1 (None if the file falls short)"""
+        path = self.vector_path(user_id)
+        if count == 0 or not path.exists() or path.stat().st_size < count * d * 4:
+            return None
+        return np.memmap(path, dtype=np.float32, mode='r', shape=(count, d))
+    
+    def _deleted_ids(self, index, documents: List[Optional[Dict[str, Any]]]) -> Set[int]:
+        """Ids of deleted documents whose vectors the index still holds"""
+        dead = [i for i, doc in enumerate(documents) if doc is None]
+        if not dead:
+            return set()
+        return set(np.intersect1d(np.array(dead, dtype=np.int64), stored_ids(index)).tolist())
+    
+    def _ensure_vector_file(self, user_id: str):
+        """Make {user}.vec hold exactly one vector per document id (written from the index for older data)"""
+        index = self.indices[user_id]
+        count = len(self.documents[user_id])
+        path = self.vector_path(user_id)
+        row_bytes = index.d * 4
+        size = path.stat().st_size if path.exists() else 0
+        if size == count * row_bytes:
+            return
+        if size > count * row_bytes:
+            # Vectors of a save that did not reach the index (crash in between)
+            os.truncate(path, count * row_bytes)
+            return
+        if is_quantized(index):
+            print(f"⚠️ {path.name} is incomplete; rebuilding it from quantized codes for {user_id}")
+        tmp = str(path) + ".tmp"
+        with open(tmp, 'wb') as f:
+            if is_id_mapped(index):
+                f.write(decode_vectors(index, count).tobytes())
+            else:
+                # Positional ids: stream the vectors out in order
+                total = min(count, index.ntotal)
+                for start in range(0, total, 65536):
+                    f.write(index.reconstruct_n(start, min(65536, total - start)).astype(np.float32).tobytes())
+        os.replace(tmp, path)
+    
+    def drop(self, user_id: str):
+        """Forget the user's in-memory working and published state"""
+        self.forget_working(user_id)
+        self.published.pop(user_id, None)
+        self.published_files.pop(user_id, None)
+    
+    def forget_working(self, user_id: str):
+        """Forget the user's writer state; the next writer reloads it from disk"""
+        self.indices.pop(user_id, None)
+        self.documents.pop(user_id, None)
+        self.doc_types.pop(user_id, None)
+        self.file_chunks.pop(user_id, None)
+        self.tombstones.pop(user_id, None)
+        self.pending_vectors.pop(user_id, None)
     
     def _load_index(self, user_id: str):
         index_path = self.storage_dir / f"{user_id}.index"
@@ -120,5 +637,35 @@ class RAGEngine:
             self.indices[user_id] = faiss.read_index(str(index_path))
             with open(docs_path, 'rb') as f:
                 self.documents[user_id] = pickle.load(f)
+            documents = self.documents[user_id]
+            self._apply_deletes(user_id, documents)
+            self.doc_types[user_id] = doc_type_positions(documents)
+            self.file_chunks[user_id] = positions_by(documents, 'file_id')
+            self.pending_vectors.pop(user_id, None)
+            backup = self.reclaim_backup_path(user_id)
+            if backup.exists():
+                # A reclaim stopped before saving the renumbered documents: their ids are still the old ones
+                d = self.indices[user_id].d
+                if backup.stat().st_size == len(documents) * d * 4:
+                    os.replace(backup, self.vector_path(user_id))
+                    # The saved index may already be the renumbered one
+                    live = live_ids(documents)
+                    vectors = self._map_vectors(user_id, d, len(documents))
+                    self.indices[user_id] = ann_builder.build(np.asarray(vectors[live]), live) if len(live) else new_index(d)
+                else:
+                    backup.unlink()
+            self._ensure_vector_file(user_id)
+            
+            index = self.indices[user_id]
+            if not is_id_mapped(index):
+                # Saved before chunk ids: rebuilt once, every vector under its id (= its position)
+                live = live_ids(documents)
+                if len(live):
+                    vectors = self._map_vectors(user_id, index.d, len(documents))
+                    index = ann_builder.build(np.asarray(vectors[live]), live)
+                else:
+                    index = new_index(index.d)
+                self.indices[user_id] = index
+            self.tombstones[user_id] = self._deleted_ids(index, documents)
 
 rag_engine = RAGEngine()
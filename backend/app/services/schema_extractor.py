@@ -0,0 +1,153 @@
+import json
+import pandas as pd
+from typing import List, Dict, Any, Optional, Tuple
+from .llm_gateway import llm_gateway
+from .pattern_extractor import pattern_extractor
+
+SAMPLE_ROWS = 5
+EMPTY_VALUES = ['', 'nan', 'None', 'NaT', 'Nothing']
+
+class TabularSchemaExtractor:
+    """Infer the column -> entity mapping of a sheet once and apply it to every row.
+    
+    A schema looks like:
+        {"hub": "Deal ID",
+         "columns": {"Deal ID": {"type": "ID", "relation": None},
+                     "Client": {"type": "ORG", "relation": "has_client"}}}
+    Every mapped column becomes a node per row; the hub column is linked to the others.
+    """
+    
+    def infer_schema(self, records: List[Dict[str, Any]], doc_type: str = "unknown") -> Optional[Dict[str, Any]]:
+        columns = [col for col in records[0].keys() if col != 'content'] if records else []
+        if not columns:
+            return None
+        
+        sample = [{col: record.get(col) for col in columns} for record in records[:SAMPLE_ROWS]]
+        
+        schema = None
+        if llm_gateway.enabled:
+            schema = self._infer_with_llm(columns, sample, doc_type)
+        if not schema:
+            schema = self._infer_heuristic(columns, sample)
+        
+        print(f"📐 Tabular schema: hub={schema['hub']}, "
+              f"{len(schema['columns'])}/{len(columns)} columns mapped")
+        return schema
+    
+    def _infer_heuristic(self, columns: List[str], sample: List[Dict[str, Any]]) -> Dict[str, Any]:
+        mapped = {}
+        for col in columns:
+            values = [str(row[col]) for row in sample if self._present(row.get(col))]
+            entity_type = pattern_extractor.classify(str(col), values[0] if values else '')
+            mapped[col] = {"type": entity_type, "relation": f"has_{str(col).strip().lower().replace(' ', '_')}"}
+        
+        # Hub is the first ID column, else the first ORG column
+        hub = next((col for col, spec in mapped.items() if spec["type"] == 'ID'), None)
+        if hub is None:
+            hub = next((col for col, spec in mapped.items() if spec["type"] == 'ORG'), None)
+        if hub is not None:
+            mapped[hub]["relation"] = None
+        
+        return {"hub": hub, "columns": mapped}
+    
+    def _present(self, value: Any) -> bool:
+        return value is not None and not (isinstance(value, float) and pd.isna(value)) and str(value).strip() not in EMPTY_VALUES
+    
+    def _infer_with_llm(self, columns: List[str], sample: List[Dict[str, Any]], doc_type: str) -> Optional[Dict[str, Any]]:
+        prompt = f"""You are a Knowledge Graph expert. Below is the header and a few sample rows of a {doc_type} spreadsheet.
+Every row has the same columns. Decide once how columns map to knowledge-graph entities.
+
+Columns: {json.dumps([str(c) for c in columns])}
+
+Sample rows:
+{json.dumps(sample, default=str, indent=1)[:3000]}
+
+Rules:
+- Pick the hub column: the one identifying the row (e.g. Deal ID, Invoice No), or null if none
+- Give each column an entity type (ID, ORG, PERSON, PRODUCT, MONEY, DATE, STATUS, VALUE) or null to skip it
+- Give each non-hub column the relation from the hub to it (e.g. has_client, has_amount, closed_on)
+
+Return ONLY valid JSON:
+{{
+  "hub": "Deal ID",
+  "columns": {{
+    "Deal ID": {{"type": "ID", "relation": null}},
+    "Client": {{"type": "ORG", "relation": "has_client"}},
+    "Amount": {{"type": "MONEY", "relation": "has_amount"}}
+  }}
+}}"""
+        
+        try:
+            content = llm_gateway.complete(
+                messages=[
+                    {"role": "system", "content": "You are an expert at understanding spreadsheet structure. Return ONLY valid JSON, no explanations."},
+                    {"role": "user", "content": prompt}
+                ],
+                temperature=0.1
+            )
+            start = content.find('{')
+            end = content.rfind('}') + 1
+            return self._validate(json.loads(content[start:end]), columns)
+        except Exception as e:
+            print(f"Schema inference error: {e}")
+            return None
+    
+    def _validate(self, schema: Dict[str, Any], columns: List[str]) -> Optional[Dict[str, Any]]:
+        by_name = {str(col): col for col in columns}
+        mapped = {}
+        for name, spec in (schema.get("columns") or {}).items():
+            if name not in by_name or not isinstance(spec, dict) or not spec.get("type"):
+                continue
+            mapped[by_name[name]] = {"type": str(spec["type"]).upper(), "relation": spec.get("relation")}
+        
+        if not mapped:
+            return None
+        
+        hub = by_name.get(str(schema.get("hub")))
+        if hub not in mapped:
+            hub = None
+        return {"hub": hub, "columns": mapped}
+    
+    def apply_schema(self, records: List[Dict[str, Any]], schema: Dict[str, Any]) -> Tuple[List[Tuple[str, int, Dict[str, Any]]], List[Tuple[str, str, str]]]:
+        """Turn a batch of rows into (node_id, row, attrs) and (source, target, relation) lists column-wise"""
+        df = pd.DataFrame.from_records(records)
+        node_ids = {}
+        nodes = []
+        
+        for col, spec in schema["columns"].items():
+            if col not in df.columns:
+                continue
+            
+            text = df[col].astype(str).str.strip()
+            present = df[col].notna() & ~text.isin(EMPTY_VALUES)
+            text = text[present]
+            ids = text + f"_{spec['type']}"
+            node_ids[col] = ids
+            
+            value = text
+            if spec["type"] == 'MONEY':
+                # Same normalization build_graph applies to LLM-extracted amounts
+                numeric = pd.to_numeric(text.str.replace(',', '', regex=False).str.replace('$', '', regex=False),
+                                        errors='coerce')
+                value = numeric.astype(str).where(numeric.notna(), text)
+            
+            for row, node_id, entity_text, entity_value in zip(ids.index, ids, text, value):
+                nodes.append((node_id, row, {"entity_text": entity_text,
+                                             "entity_type": spec["type"],
+                                             "entity_value": entity_value}))
+        
+        edges = []
+        hub = schema.get("hub")
+        if hub in node_ids:
+            hub_ids = node_ids[hub]
+            for col, ids in node_ids.items():
+                relation = schema["columns"][col].get("relation")
+                if col == hub or not relation:
+                    continue
+                pairs = pd.concat([hub_ids.rename("source"), ids.rename("target")], axis=1, join="inner")
+                pairs = pairs[pairs["source"] != pairs["target"]]
+                edges.extend((source, target, relation) for source, target in zip(pairs["source"], pairs["target"]))
+        
+        return nodes, edges
+
+schema_extractor = TabularSchemaExtractor()
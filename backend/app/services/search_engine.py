@@ -1,5 +1,7 @@
+import heapq
+import threading
 from rank_bm25 import BM25Okapi
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple
 import numpy as np
 from .rag_engine import rag_engine
 from .kg_builder import kg_builder
@@ -9,40 +11,99 @@ class HybridSearchEngine:
         self.bm25_weight = 0.3
         self.dense_weight = 0.5
         self.kg_weight = 0.2
-        self.bm25_corpus = {}
-        self.bm25_indices = {}
+        # user_id -> (documents, BM25 over them); replaced whole, never mutated
+        self.bm25_indices: Dict[str, Tuple[List[Optional[Dict[str, Any]]], BM25Okapi]] = {}
+        # Users with a BM25 build running, and the latest version published since it started
+        self.bm25_building = set()
+        self.bm25_pending: Dict[str, Any] = {}
+        self.bm25_ready = threading.Condition()
+        rag_engine.on_publish(self._schedule_bm25)
     
-    def _update_bm25(self, user_id: str):
-        if user_id in rag_engine.documents and rag_engine.documents[user_id]:
-            corpus = [doc.get('chunk', '').split() for doc in rag_engine.documents[user_id]]
-            self.bm25_indices[user_id] = BM25Okapi(corpus)
-            self.bm25_corpus[user_id] = rag_engine.documents[user_id]
+    def _schedule_bm25(self, user_id: str, version):
+        """Index a newly published version's documents in the background.
+        
+        Searches keep the previous BM25 meanwhile. Versions published while a build runs
+        are coalesced: only the latest one is built next.
+        """
+        with self.bm25_ready:
+            self.bm25_pending[user_id] = version
+            if user_id in self.bm25_building:
+                return
+            self.bm25_building.add(user_id)
+        threading.Thread(target=self._build_loop, args=(user_id,), name=f"bm25-{user_id}", daemon=True).start()
+    
+    def _build_loop(self, user_id: str):
+        while True:
+            with self.bm25_ready:
+                version = self.bm25_pending.pop(user_id, None)
+                if version is None:
+                    self.bm25_building.discard(user_id)
+                    self.bm25_ready.notify_all()
+                    return
+                cached = self.bm25_indices.get(user_id)
+            try:
+                if cached is not None and not extends(cached[0], version.documents):
+                    # Chunk ids were reassigned (the user's index was reset): the old scores no longer apply
+                    with self.bm25_ready:
+                        self.bm25_indices.pop(user_id, None)
+                    cached = None
+                # Deletes alone keep the built BM25: searches skip the chunks deleted in their version
+                if cached is None or len(version.documents) > len(cached[0]):
+                    documents = version.documents
+                    # Deleted chunks (None) stay as empty entries so BM25 positions keep matching chunk ids
+                    bm25 = BM25Okapi([doc.get('chunk', '').split() if doc is not None else [] for doc in documents]) if documents else None
+                    with self.bm25_ready:
+                        self.bm25_indices[user_id] = (documents, bm25)
+            except Exception as e:
+                print(f"⚠️ Could not build BM25 for {user_id}: {e}")
+            with self.bm25_ready:
+                self.bm25_ready.notify_all()
+    
+    def _bm25(self, user_id: str, version) -> Optional[Tuple[List[Optional[Dict[str, Any]]], BM25Okapi]]:
+        """The last BM25 built for the user, with the documents it covers
+        
+        It may predate version: chunks added since are not in it yet, and searches skip the
+        ones version deleted. Only a process's first search waits, for the first build.
+        """
+        if version is None or not version.documents:
+            return None
+        with self.bm25_ready:
+            if user_id not in self.bm25_indices:
+                if user_id not in self.bm25_building:
+                    self._schedule_bm25(user_id, version)
+                self.bm25_ready.wait_for(lambda: user_id in self.bm25_indices or user_id not in self.bm25_building)
+            cached = self.bm25_indices.get(user_id)
+        return cached if cached is not None and cached[1] is not None else None
     
     def hybrid_search(self, query: str, user_id: str, top_k: int = 10, doc_type_filter: str = None) -> List[Dict[str, Any]]:
+        # Dense and BM25 results come from the same published version, whatever ingestion does meanwhile
+        version = rag_engine.current(user_id)
+        
         # Filter documents by doc_type before searching
-        dense_results = rag_engine.search_similar(query, user_id, top_k, doc_type_filter)
+        dense_results = rag_engine.search_similar(query, user_id, top_k, doc_type_filter, version=version)
         kg_results = kg_builder.query_graph(query, user_id, doc_type_filter)
         
         combined = []
         
         # BM25 keyword search
-        if user_id not in self.bm25_indices:
-            self._update_bm25(user_id)
-        
-        if user_id in self.bm25_indices:
-            # Filter corpus by doc_type if specified
+        built = self._bm25(user_id, version)
+        if built is not None:
+            bm25 = built[1]
+            corpus = version.documents
+            # Filter corpus by doc_type if specified, through the version's per-doc_type ids
             if doc_type_filter:
-                filtered_corpus = [(i, doc) for i, doc in enumerate(self.bm25_corpus[user_id])
-                                  if doc.get('metadata', {}).get('doc_type') == doc_type_filter]
-                if filtered_corpus:
-                    filtered_indices, filtered_docs = zip(*filtered_corpus)
-                    bm25_scores = self.bm25_indices[user_id].get_scores(query.split())
-                    filtered_scores = [bm25_scores[i] for i in filtered_indices]
+                filtered_indices = version.doc_type_ids.get(doc_type_filter)
+                if filtered_indices is not None:
+                    # Chunks added after the BM25 was built are not scored yet
+                    filtered_indices = filtered_indices[filtered_indices < len(built[0])]
+                if filtered_indices is not None and len(filtered_indices):
+                    bm25_scores = bm25.get_scores(query.split())
+                    filtered_scores = bm25_scores[filtered_indices]
                     top_bm25_idx = np.argsort(filtered_scores)[-top_k:][::-1]
                     
                     for idx in top_bm25_idx:
-                        if idx < len(filtered_docs):
-                            doc = filtered_docs[idx]
+                        if idx < len(filtered_indices):
+                            doc = corpus[filtered_indices[idx]]
                             combined.append({
                                 "content": doc.get('chunk', ''),
                                 "score": self.bm25_weight * float(filtered_scores[idx]),
@@ -50,12 +111,17 @@ class HybridSearchEngine:
                                 "metadata": doc
                             })
             else:
-                bm25_scores = self.bm25_indices[user_id].get_scores(query.split())
-                top_bm25_idx = np.argsort(bm25_scores)[-top_k:][::-1]
+                bm25_scores = bm25.get_scores(query.split())
+                top_bm25_idx = np.argsort(bm25_scores)[::-1]
                 
+                hits = 0
                 for idx in top_bm25_idx:
-                    if idx < len(self.bm25_corpus[user_id]):
-                        doc = self.bm25_corpus[user_id][idx]
+                    if hits == top_k:
+                        break
+                    # Chunks deleted in this version, or built after it, are skipped
+                    if idx < len(corpus) and corpus[idx] is not None:
+                        hits += 1
+                        doc = corpus[idx]
                         combined.append({
                             "content": doc.get('chunk', ''),
                             "score": self.bm25_weight * float(bm25_scores[idx]),
@@ -73,10 +139,14 @@ class HybridSearchEngine:
                 "metadata": result.get("metadata", {})
             })
         
-        # Knowledge graph expansion
+        # Knowledge graph expansion, ranked by node centrality (precomputed, so only O(k log k) here)
         kg_nodes = kg_results.get('nodes', [])
-        for idx, result in enumerate(kg_nodes[:top_k]):
-            score = self.kg_weight * (1 - idx / max(len(kg_nodes), 1))
+        centrality = kg_results.get('centrality') or [1.0] * len(kg_nodes)
+        ranked = heapq.nlargest(top_k, range(len(kg_nodes)), key=centrality.__getitem__)
+        top_centrality = max((centrality[idx] for idx in ranked), default=0.0) or 1.0
+        for idx in ranked:
+            result = kg_nodes[idx]
+            score = self.kg_weight * centrality[idx] / top_centrality
             combined.append({
                 "content": str(result),
                 "score": score,
@@ -87,4 +157,11 @@ class HybridSearchEngine:
         combined.sort(key=lambda x: x["score"], reverse=True)
         return combined[:top_k]
 
+def extends(built: List[Optional[Dict[str, Any]]], documents: List[Optional[Dict[str, Any]]]) -> bool:
+    """Whether documents keeps every chunk id of built, only deleting some or adding more"""
+    if len(documents) < len(built):
+        return False
+    return all(new is None or (old is not None and new.get('chunk') == old.get('chunk'))
+               for old, new in zip(built, documents))
+
 search_engine = HybridSearchEngine()
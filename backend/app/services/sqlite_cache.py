@@ -0,0 +1,155 @@
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Any, List, Tuple, Union
+
+class SQLiteLRUCache:
+    """Disk-backed, size-bounded LRU cache kept in one SQLite table.
+    
+    Subclasses set the table, the tag columns stored with every entry (what invalidate()
+    filters on), the value column and how values are encoded to / decoded from it.
+    Entries are evicted least recently used first once the table outgrows max_bytes.
+    """
+    
+    table: str = None
+    tags: Tuple[str, ...] = ()
+    tag_index: str = None
+    value_column = "value"
+    value_type = "TEXT"
+    
+    def __init__(self, db_path: str, max_bytes: int):
+        path = Path(db_path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(str(path), check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        tag_columns = "".join(f"{tag} TEXT NOT NULL, " for tag in self.tags)
+        self.conn.execute(f"""CREATE TABLE IF NOT EXISTS {self.table} (
+            key TEXT PRIMARY KEY, {tag_columns}{self.value_column} {self.value_type} NOT NULL,
+            size INTEGER NOT NULL, last_access REAL NOT NULL
+        )""")
+        self.conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{self.table}_access ON {self.table}(last_access)")
+        if self.tags:
+            self.conn.execute(f"CREATE INDEX IF NOT EXISTS {self.tag_index} ON {self.table}({', '.join(self.tags)})")
+        self.conn.commit()
+        
+        self.total_bytes = self._table_size()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    def encode(self, value: Any) -> Union[str, bytes]:
+        raise NotImplementedError
+    
+    def decode(self, stored: Union[str, bytes]) -> Any:
+        raise NotImplementedError
+    
+    def get_many(self, keys: List[str]) -> Dict[str, Any]:
+        found = {}
+        unique = list(dict.fromkeys(keys))
+        
+        with self.lock:
+            # Stay well under SQLite's bound-parameter limit
+            for start in range(0, len(unique), 500):
+                chunk = unique[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self.conn.execute(
+                    f"SELECT key, {self.value_column} FROM {self.table} WHERE key IN ({placeholders})", chunk).fetchall()
+                for key, stored in rows:
+                    found[key] = self.decode(stored)
+            
+            if found:
+                now = time.time()
+                self.conn.executemany(f"UPDATE {self.table} SET last_access = ? WHERE key = ?",
+                                      [(now, key) for key in found])
+                self.conn.commit()
+            
+            self.hits += len(found)
+            self.misses += len(unique) - len(found)
+        return found
+    
+    def _put_many(self, entries: List[Tuple[str, Any]], tag_values: Tuple[str, ...]):
+        if not entries:
+            return
+        
+        now = time.time()
+        rows = []
+        for key, value in dict(entries).items():
+            encoded = self.encode(value)
+            rows.append((key, *tag_values, encoded, len(encoded), now))
+        
+        columns = ", ".join(("key",) + self.tags + (self.value_column, "size", "last_access"))
+        placeholders = ", ".join("?" * (len(self.tags) + 4))
+        with self.lock:
+            replaced = self._stored_size([row[0] for row in rows])
+            self.conn.executemany(f"INSERT OR REPLACE INTO {self.table} ({columns}) VALUES ({placeholders})", rows)
+            self.conn.commit()
+            self.total_bytes += sum(row[-2] for row in rows) - replaced
+            if self.total_bytes > self.max_bytes:
+                self._evict()
+    
+    def _stored_size(self, keys: List[str]) -> int:
+        total = 0
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            total += self.conn.execute(
+                f"SELECT COALESCE(SUM(size), 0) FROM {self.table} WHERE key IN ({placeholders})", chunk).fetchone()[0]
+        return total
+    
+    def _table_size(self) -> int:
+        return self.conn.execute(f"SELECT COALESCE(SUM(size), 0) FROM {self.table}").fetchone()[0]
+    
+    def _evict(self):
+        # Drop least recently used entries until we are back under 90% of the budget
+        target = int(self.max_bytes * 0.9)
+        while self.total_bytes > target:
+            victims = self.conn.execute(
+                f"SELECT key, size FROM {self.table} ORDER BY last_access LIMIT 500").fetchall()
+            if not victims:
+                self.total_bytes = 0
+                break
+            
+            removed = []
+            for key, size in victims:
+                removed.append((key,))
+                self.total_bytes -= size
+                if self.total_bytes <= target:
+                    break
+            
+            self.conn.executemany(f"DELETE FROM {self.table} WHERE key = ?", removed)
+            self.evictions += len(removed)
+        self.conn.commit()
+    
+    def _invalidate(self, **tag_values) -> int:
+        """Remove entries matching the given tags (None matches anything); returns the count"""
+        clauses = []
+        params = []
+        for tag, value in tag_values.items():
+            if value is not None:
+                clauses.append(f"{tag} = ?")
+                params.append(value)
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        
+        with self.lock:
+            deleted = self.conn.execute(f"DELETE FROM {self.table}{where}", params).rowcount
+            self.conn.commit()
+            self.total_bytes = self._table_size()
+        print(f"🗑️ Invalidated {deleted} cached {self.table}")
+        return deleted
+    
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            entries = self.conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "entries": entries,
+            "bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0
+        }
@@ -7,14 +7,11 @@ class StructuredQueryEngine:
     def execute_count_query(self, entity_type: str, user_id: str, time_filter: str = None) -> Dict[str, Any]:
         """Execute counting queries like 'How many deals?'"""
         
-        # Load user's graph
-        if user_id not in kg_builder.graphs:
-            kg_builder._load_graph(user_id)
-        
-        if user_id not in kg_builder.graphs:
+        # User's graph: the shared snapshot when there is one, without loading it into this process
+        G = kg_builder.read_graph(user_id)
+        if G is None:
             return {"count": 0, "items": []}
         
-        G = kg_builder.graphs[user_id]
         matching_nodes = []
         
         # Find nodes matching entity type
@@ -37,7 +34,7 @@ class StructuredQueryEngine:
         
         return {
             "count": len(ids) if ids else len(matching_nodes),
-            "items": matching_nodes[:10],  # Return first 10 for display
+            "items": [dict(data) for data in matching_nodes[:10]],  # Return first 10 for display
             "query_type": "count"
         }
     
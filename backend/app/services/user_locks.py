@@ -0,0 +1,114 @@
+import os
+import socket
+import threading
+import uuid
+from pathlib import Path
+from typing import Dict, List, Callable, Optional
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+class UserLocks:
+    """Per-user writer locks, shared by every worker process.
+    
+    Everything that mutates a user's in-memory graph or vector index (ingestion,
+    deletes) holds that user's lock, so writers of one user serialize while other
+    users are never blocked. Readers take no lock: they use the last published
+    immutable version (the graph's CSR snapshot, RAGEngine's IndexVersion).
+    
+    A writer holds a thread lock plus an flock on storage/locks/{user}.lock, so writers
+    in other processes wait too. The lock file records the process that held it last;
+    when that was another process, the working state services cached for the user is
+    stale, so the handlers registered with on_stale() drop it and it is reloaded from disk.
+    Without fcntl (Windows) the lock only covers this process.
+    """
+    
+    def __init__(self, lock_dir: str = "storage/locks"):
+        self.lock_dir = Path(lock_dir)
+        self.lock_dir.mkdir(parents=True, exist_ok=True)
+        self.locks: Dict[str, "UserLock"] = {}
+        self.guard = threading.Lock()
+        self.token = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}".encode("utf-8")
+        self.stale_handlers: List[Callable[[str], None]] = []
+    
+    def writer(self, user_id: str) -> "UserLock":
+        with self.guard:
+            lock = self.locks.get(user_id)
+            if lock is None:
+                lock = self.locks[user_id] = UserLock(self, user_id)
+            return lock
+    
+    def on_stale(self, handler: Callable[[str], None]):
+        """Call handler(user_id) when another process wrote the user's data since we last did"""
+        self.stale_handlers.append(handler)
+    
+    def try_claim(self, user_id: str, task: str) -> Optional[Callable[[], None]]:
+        """Claim a background task for the user (e.g. an index rebuild) across processes, without waiting.
+        
+        Returns the function releasing the claim, or None when another process holds it.
+        The claim is an flock on storage/locks/{user}.{task}, so it also ends with its process.
+        """
+        if fcntl is None:
+            return lambda: None
+        fd = os.open(self.lock_dir / f"{user_id}.{task}", os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return None
+        
+        def release():
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+        return release
+
+class UserLock:
+    """Reentrant within a thread; only the outermost acquire takes the file lock"""
+    
+    def __init__(self, owner: UserLocks, user_id: str):
+        self.owner = owner
+        self.path = owner.lock_dir / f"{user_id}.lock"
+        self.user_id = user_id
+        self.rlock = threading.RLock()
+        self.depth = 0
+        self.fd = None
+    
+    def __enter__(self) -> "UserLock":
+        self.rlock.acquire()
+        try:
+            if self.depth == 0 and fcntl is not None:
+                self._lock_file()
+        except BaseException:
+            self.rlock.release()
+            raise
+        self.depth += 1
+        return self
+    
+    def __exit__(self, *exc):
+        self.depth -= 1
+        try:
+            if self.depth == 0 and self.fd is not None:
+                fcntl.flock(self.fd, fcntl.LOCK_UN)
+                os.close(self.fd)
+                self.fd = None
+        finally:
+            self.rlock.release()
+    
+    def _lock_file(self):
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            last_writer = os.pread(fd, 256, 0)
+            if last_writer != self.owner.token:
+                for handler in self.owner.stale_handlers:
+                    handler(self.user_id)
+                os.ftruncate(fd, 0)
+                os.pwrite(fd, self.owner.token, 0)
+        except BaseException:
+            os.close(fd)
+            raise
+        self.fd = fd
+
+user_locks = UserLocks()
@@ -0,0 +1,96 @@
+import random
+import threading
+import time
+from typing import Dict, Any, List, Optional
+from ..core.config import settings
+from .supabase_client import supabase_client
+
+class WriteBehindSync:
+    """Background worker shared by the Supabase write-behind syncs (GraphSync, EmbeddingSync).
+    
+    Subclasses queue per-user work in self.pending under self.lock and call _notify().
+    A daemon thread wakes every SUPABASE_SYNC_INTERVAL seconds (or when notified) and
+    calls _push(user_id) for every user with pending work; a failing user is counted,
+    logged and retried on the next cycle. Calls to Supabase go through _with_retry,
+    which retries SUPABASE_SYNC_RETRIES times with jittered exponential backoff.
+    """
+    
+    thread_name = "supabase-sync"
+    label = "Supabase sync"
+    
+    def __init__(self):
+        self.batch_size = settings.SUPABASE_SYNC_BATCH_SIZE
+        self.interval = settings.SUPABASE_SYNC_INTERVAL
+        self.max_retries = settings.SUPABASE_SYNC_RETRIES
+        self.pending: Dict[str, Any] = {}
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.stopping = False
+        self.thread: Optional[threading.Thread] = None
+        self.synced_rows = 0
+        self.failures = 0
+    
+    def start(self):
+        if self.thread or not supabase_client.enabled:
+            return
+        self.stopping = False
+        self.thread = threading.Thread(target=self._loop, name=self.thread_name, daemon=True)
+        self.thread.start()
+    
+    def stop(self, timeout: float = 30.0):
+        """Flush what is pending and stop the worker"""
+        if not self.thread:
+            return
+        self.stopping = True
+        self.wakeup.set()
+        self.thread.join(timeout)
+        self.thread = None
+    
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            pending_rows = self._pending_rows()
+        return {"pending_rows": pending_rows, "synced_rows": self.synced_rows, "failures": self.failures}
+    
+    def _notify(self):
+        self.start()
+        self.wakeup.set()
+    
+    def _pending_users(self) -> List[str]:
+        return list(self.pending)
+    
+    def _pending_rows(self) -> int:
+        raise NotImplementedError
+    
+    def _push(self, user_id: str):
+        raise NotImplementedError
+    
+    def _loop(self):
+        while True:
+            self.wakeup.wait(self.interval)
+            self.wakeup.clear()
+            stopping = self.stopping
+            
+            with self.lock:
+                users = self._pending_users()
+            for user_id in users:
+                try:
+                    self._push(user_id)
+                except Exception as e:
+                    self.failures += 1
+                    print(f"⚠️ {self.label} failed for {user_id}, will retry: {e}")
+            
+            if stopping:
+                return
+    
+    def _with_retry(self, call):
+        for attempt in range(self.max_retries + 1):
+            try:
+                return call()
+            except Exception:
+                if attempt == self.max_retries:
+                    raise
+                time.sleep(random.uniform(0, min(30.0, 0.5 * (2 ** attempt))))
+    
+    def _batches(self, items: list):
+        for start in range(0, len(items), self.batch_size):
+            yield items[start:start + self.batch_size]
@@ -1,7 +1,13 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from app.api import auth, upload, search, sync, files, delete, process
+from app.api import auth, upload, search, sync, files, delete, process, jobs
 from app.core.config import settings
+from app.services.job_queue import job_queue
+from app.services import ingestion  # registers the ingestion job handlers
+from app.services.llm_gateway import llm_gateway
+from app.services.extraction_cache import extraction_cache
+from app.services.graph_sync import graph_sync
+from app.services.embedding_sync import embedding_sync
 
 app = FastAPI(title="KG-Search API", version="1.0.0")
 
@@ -20,6 +26,20 @@ app.include_router(sync.router)
 app.include_router(files.router)
 app.include_router(delete.router, prefix="/delete", tags=["delete"])
 app.include_router(process.router)
+app.include_router(jobs.router)
+
+@app.on_event("startup")
+async def start_job_queue():
+    job_queue.start()
+    graph_sync.start()
+    embedding_sync.start()
+
+@app.on_event("shutdown")
+async def stop_job_queue():
+    job_queue.stop()
+    graph_sync.stop()
+    embedding_sync.stop()
+    llm_gateway.close()
 
 @app.get("/")
 async def root():
@@ -28,3 +48,8 @@ async def root():
 @app.get("/health")
 async def health():
     return {"status": "healthy"}
+
+@app.get("/metrics")
+async def metrics():
+    return {"llm": llm_gateway.metrics(), "extraction_cache": extraction_cache.stats(),
+            "supabase_sync": graph_sync.stats(), "embedding_sync": embedding_sync.stats()}
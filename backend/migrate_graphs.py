@@ -0,0 +1,28 @@
+"""Publish the memory-mapped snapshot of stored knowledge graphs that have none (or one in an older format).
+
+Run from backend/ after deploying:  python migrate_graphs.py [user_id ...]   (all users when none given)
+Graphs already published at their current log position are skipped.
+"""
+import sys
+from app.services.graph_store import graph_store
+from app.services.user_locks import user_locks
+
+def main(user_ids):
+    if not user_ids:
+        root = graph_store.storage_dir
+        user_ids = sorted({path.stem for path in root.glob("*.log")} | {path.stem for path in root.glob("*.pkl")}
+                          | {path.name for path in root.iterdir() if path.is_dir()})
+    
+    for user_id in user_ids:
+        try:
+            # Held like a writer's publish, so it never races a save of the same graph
+            with user_locks.writer(user_id):
+                found = graph_store.rebuild_snapshot(user_id)
+        except Exception as e:
+            print(f"⚠️ Could not publish graph snapshot for {user_id}: {e}")
+            continue
+        if not found:
+            print(f"⚠️ No graph for {user_id}")
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
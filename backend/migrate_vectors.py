@@ -0,0 +1,38 @@
+"""Rebuild stored vector indexes with the current VECTOR_QUANTIZATION / ANN settings.
+
+Run from backend/:  python migrate_vectors.py [--reclaim] [user_id ...]   (all users when none given)
+
+--reclaim also renumbers each user's chunks without the deleted ones, shrinking
+{user}.vec and {user}.pkl, which compaction never does. Stop the API first: running
+workers still search with the old chunk ids.
+"""
+import sys
+from app.services.rag_engine import rag_engine
+from app.services.embedding_sync import embedding_sync
+
+def main(user_ids, reclaim: bool = False):
+    if not user_ids:
+        user_ids = sorted(path.stem for path in rag_engine.storage_dir.glob("*.index"))
+    
+    for user_id in user_ids:
+        try:
+            reclaimed = rag_engine.reclaim(user_id) if reclaim else 0
+            # Reclaiming rebuilt the index already
+            report = rag_engine.index_reports.get(user_id) if reclaimed else rag_engine.migrate_index(user_id)
+        except Exception as e:
+            print(f"⚠️ Could not migrate {user_id}: {e}")
+            continue
+        if reclaimed:
+            print(f"🧹 {user_id}: reclaimed {reclaimed} deleted chunk ids")
+        if report is None:
+            print(f"⚠️ No vector index for {user_id}")
+        elif report:
+            print(f"✅ {user_id}: {report['index']}, {report['vectors']} vectors at {report['bytes_per_vector']} B, "
+                  f"recall@{report['k']} {report['steps'][-1]['recall']}")
+    
+    # Renumbered embeddings are resent to Supabase before exiting
+    embedding_sync.stop()
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    main([arg for arg in args if arg != "--reclaim"], "--reclaim" in args)
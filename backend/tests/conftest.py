@@ -0,0 +1,14 @@
+import atexit
+import os
+import shutil
+import tempfile
+
+# Settings fields without a default; none of the services under test use them
+for name in ("GOOGLE_CLIENT_ID", "GOOGLE_CLIENT_SECRET", "GOOGLE_REDIRECT_URI", "JWT_SECRET",
+             "FRONTEND_URL", "BACKEND_URL"):
+    os.environ.setdefault(name, "test")
+
+# Module-level services create their storage/ directories relative to the working directory
+workdir = tempfile.mkdtemp(prefix="kg-search-tests-")
+os.chdir(workdir)
+atexit.register(shutil.rmtree, workdir, True)
@@ -0,0 +1,80 @@
+from app.services.csr_graph import CSRGraph
+from app.services.knowledge_graph import KnowledgeGraph
+
+def build_graph() -> KnowledgeGraph:
+    G = KnowledgeGraph()
+    row = {"content": "Deal D-1 | Client: Acme Corp | Amount: 5000", "id": 1}
+    G.add_node("acme", entity_text="Acme Corp", entity_type="ORG", entity_value="Acme Corp",
+               file_id="f1", doc_type="Deals", metadata=row, aliases=["ACME"])
+    G.add_node("d1", entity_text="D-1", entity_type="DEAL", entity_value="D-1",
+               file_id="f1", doc_type="Deals", metadata=row)
+    G.add_node("bob", entity_text="Bob Smith", entity_type="PERSON", file_id="f2", doc_type="customers")
+    G.add_node("orphan", entity_text="Line\nbreak", score=3)
+    G.add_node("cafe", entity_text="Café Zoë", file_id="f2")
+    G.add_node("cafe-2", entity_text="CAFÉ ZOË", file_id="f3")
+    G.add_edge("d1", "acme", relation="client_of")
+    G.add_edge("acme", "bob", relation="contact")
+    G.add_edge("bob", "d1")
+    G.centrality = {"acme": 2.0, "d1": 1.0, "bob": 0.5}
+    return G
+
+def open_snapshot(G: KnowledgeGraph, tmp_path) -> CSRGraph:
+    path = tmp_path / "graph.kgc"
+    path.write_bytes(CSRGraph.encode(G, 3, 128))
+    return CSRGraph(path)
+
+def ids(snapshot: CSRGraph, nodes) -> set:
+    return {snapshot.nodes[i]['node_id'] for i in nodes}
+
+def test_nodes_round_trip(tmp_path):
+    G = build_graph()
+    snapshot = open_snapshot(G, tmp_path)
+    
+    assert (snapshot.log_generation, snapshot.log_offset) == (3, 128)
+    assert len(snapshot) == len(G)
+    assert snapshot.number_of_edges() == G.number_of_edges()
+    for n, data in G.nodes(data=True):
+        i = snapshot.node_index(n)
+        assert i is not None
+        assert snapshot.nodes[i]['node_id'] == n
+        assert dict(snapshot.nodes[i]) == data
+        assert snapshot.centrality.get(i) == G.centrality.get(n, 1.0)
+    assert snapshot.node_index("missing") is None
+
+def test_adjacency_round_trip(tmp_path):
+    G = build_graph()
+    snapshot = open_snapshot(G, tmp_path)
+    
+    for n in G:
+        i = snapshot.node_index(n)
+        row = {snapshot.nodes[v]['node_id']: data for v, data in snapshot._adj[i].items()}
+        assert row == {v: dict(data) for v, data in G._adj[n].items()}
+        for v in G._adj[n]:
+            assert snapshot.node_index(v) in snapshot._adj[i]
+    assert snapshot.node_index("orphan") not in snapshot._adj[snapshot.node_index("acme")]
+
+def test_lookups_round_trip(tmp_path):
+    G = build_graph()
+    snapshot = open_snapshot(G, tmp_path)
+    
+    for key in ("Acme Corp", "ACME", "D-1", "Bob Smith", "nobody"):
+        assert ids(snapshot, snapshot.find_entities(key)) == set(G.find_entities(key))
+    # Node ids resolve too on the snapshot
+    assert ids(snapshot, snapshot.find_entities("bob")) == {"bob"}
+    for file_id in ("f1", "f2", None, "f3"):
+        assert ids(snapshot, snapshot.file_nodes(file_id)) == set(G.file_nodes(file_id))
+    assert ids(snapshot, snapshot.doc_type_nodes("deals")) == set(G.doc_type_nodes("deals"))
+    assert sorted(snapshot.file_ids()) == sorted(G.file_ids())
+
+def test_search_text(tmp_path):
+    G = build_graph()
+    snapshot = open_snapshot(G, tmp_path)
+    
+    for query in ("acme", "SMITH", "corp", "-1", "d", "", "e\nb", "é z", "café zoë", "me co", "zzz", "acmex"):
+        expected = {n for n, data in G.nodes(data=True)
+                    if data.get('entity_text') is not None and query.lower() in data['entity_text'].lower()}
+        found = list(snapshot.search_text(query))
+        assert len(found) == len(set(found))
+        assert ids(snapshot, found) == expected, query
+    # Texts are stored back to back in sorted order; short-query scans never match across two
+    assert list(snapshot.search_text("hc")) == list(snapshot.search_text("ëd")) == []
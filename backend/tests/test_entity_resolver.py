@@ -0,0 +1,58 @@
+from app.services.entity_resolver import EntityResolver
+from app.services.knowledge_graph import KnowledgeGraph
+
+def add_entity(G: KnowledgeGraph, n: str, text: str, file_id: str = "f1", entity_type: str = "ORG"):
+    G.add_node(n, entity_text=text, entity_type=entity_type, file_id=file_id, doc_type="deals")
+
+def resolver() -> EntityResolver:
+    resolver = EntityResolver()
+    resolver.enabled = True
+    return resolver
+
+def test_merge_moves_edges_and_keeps_aliases():
+    G = KnowledgeGraph()
+    add_entity(G, "acme", "Acme Corporation")
+    add_entity(G, "amount", "1,000", entity_type="MONEY")
+    add_entity(G, "date", "2024-01-01", entity_type="DATE")
+    G.add_edge("acme", "amount", relation="pays")
+    er = resolver()
+    assert er.resolve("u", G, list(G)) == 0
+    
+    add_entity(G, "acme.", "ACME Corporation.")
+    add_entity(G, "acmes", "Acme Corporations")
+    G.add_edge("acme.", "date", relation="signed_on")
+    G.add_edge("acme.", "amount", relation="owes")
+    G.add_edge("acmes", "acme.", relation="same")
+    assert er.resolve("u", G, ["acme.", "acmes"]) == 2
+    
+    assert "acme." not in G and "acmes" not in G
+    assert G.nodes["acme"]["aliases"] == ["ACME Corporation.", "Acme Corporations"]
+    assert set(G["acme"]) == {"amount", "date"}
+    # An edge the canonical node already had keeps its data; no self-loop from the merged pair
+    assert G["acme"]["amount"]["relation"] == "pays"
+    assert G["acme"]["date"]["relation"] == "signed_on"
+    assert G.find_entity("Acme Corporation") == "acme"
+
+def test_distinct_types_and_numbers_stay_apart():
+    G = KnowledgeGraph()
+    add_entity(G, "acme", "Acme")
+    add_entity(G, "acme_person", "Acme", entity_type="PERSON")
+    add_entity(G, "inv1", "Invoice 1001", entity_type="ID")
+    add_entity(G, "inv2", "Invoice 1002", entity_type="ID")
+    assert resolver().resolve("u", G, list(G)) == 0
+    assert set(G) == {"acme", "acme_person", "inv1", "inv2"}
+
+def test_no_merge_across_files():
+    G = KnowledgeGraph()
+    add_entity(G, "acme", "Acme Corporation", "f1")
+    add_entity(G, "acme.", "ACME Corporation.", "f2")
+    er = resolver()
+    assert er.resolve("u", G, list(G)) == 0
+    
+    # Deleting a file then drops only its own entities
+    G.remove_nodes_from(G.file_nodes("f2"))
+    assert set(G) == {"acme"}
+    add_entity(G, "acme2", "Acme Corporation", "f2")
+    add_entity(G, "acme3", "Acme Corporation", "f1")
+    assert er.resolve("u", G, ["acme2", "acme3"]) == 1
+    assert set(G) == {"acme", "acme2"}
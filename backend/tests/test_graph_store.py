@@ -0,0 +1,130 @@
+import json
+from app.services.graph_store import GraphStore, LOG_HEADER, LOG_MAGIC
+from app.services.knowledge_graph import KnowledgeGraph
+
+def add_entity(G: KnowledgeGraph, n: str, file_id: str = "f1"):
+    G.add_node(n, entity_text=n.title(), entity_type="ORG", file_id=file_id, doc_type="deals")
+
+def tear_log(store: GraphStore, user_id: str) -> int:
+    """Append half a frame, as a crash mid-append leaves it; returns the log size before"""
+    log_path = store.log_path(user_id)
+    size = log_path.stat().st_size
+    with open(log_path, 'ab') as f:
+        f.write(store._frame([('add_node', 'torn', {})])[:-3])
+    return size
+
+def test_readers_stop_at_torn_tail_without_truncating(tmp_path):
+    store = GraphStore(tmp_path)
+    G = KnowledgeGraph()
+    add_entity(G, "acme")
+    store.append("u", G)
+    tear_log(store, "u")
+    torn_size = store.log_path("u").stat().st_size
+    
+    loaded = store.load("u")
+    assert set(loaded) == {"acme"}
+    assert store._read_log(store.log_path("u"), 0, 0) == [('add_node', 'acme', dict(G.nodes["acme"]))]
+    # A torn tail may be a frame another process is still writing: readers leave it alone
+    assert store.log_path("u").stat().st_size == torn_size
+
+def test_append_repairs_torn_tail(tmp_path):
+    store = GraphStore(tmp_path)
+    G = KnowledgeGraph()
+    add_entity(G, "acme")
+    store.append("u", G)
+    good_size = tear_log(store, "u")
+    
+    add_entity(G, "globex")
+    store.append("u", G)
+    
+    ops = store._read_log(store.log_path("u"), 0, 0)
+    assert [op[1] for op in ops] == ["acme", "globex"]
+    assert store.log_path("u").stat().st_size == good_size + len(store._frame(ops[1:]))
+    assert set(store.load("u")) == {"acme", "globex"}
+
+def test_append_finds_tail_torn_by_another_writer(tmp_path):
+    store, other = GraphStore(tmp_path), GraphStore(tmp_path)
+    G = KnowledgeGraph()
+    add_entity(G, "acme")
+    store.append("u", G)
+    
+    # Another process appends a whole frame, then crashes mid-append
+    H = store.load("u")
+    add_entity(H, "globex")
+    other.append("u", H)
+    tear_log(other, "u")
+    
+    add_entity(G, "initech")
+    store.append("u", G)
+    assert [op[1] for op in store._read_log(store.log_path("u"), 0, 0)] == ["acme", "globex", "initech"]
+
+def test_log_generation_and_offset(tmp_path):
+    store = GraphStore(tmp_path)
+    log_path = store.log_path("u")
+    frames = [store._frame([('add_node', n, {'file_id': 'f1'})]) for n in ("a", "b")]
+    log_path.write_bytes(LOG_HEADER.pack(LOG_MAGIC, 3) + frames[0] + frames[1])
+    
+    # Same generation as the snapshot: only what follows its offset
+    assert [op[1] for op in store._read_log(log_path, 3, LOG_HEADER.size + len(frames[0]))] == ["b"]
+    # A newer log was rotated after the snapshot: all of it
+    assert [op[1] for op in store._read_log(log_path, 2, 999)] == ["a", "b"]
+    # An older log is already covered by the snapshot
+    assert store._read_log(log_path, 4, 0) == []
+
+def test_compaction_rotates_log_and_keeps_later_ops(tmp_path):
+    store = GraphStore(tmp_path)
+    G = KnowledgeGraph()
+    add_entity(G, "acme")
+    add_entity(G, "globex", "f2")
+    G.add_edge("acme", "globex", relation="partner")
+    store.append("u", G)
+    store.compact("u", G, background=False)
+    
+    manifest = json.loads(store.manifest_path("u").read_text())
+    assert store._log_position("u") == (manifest["log_generation"] + 1, LOG_HEADER.size)
+    
+    G.remove_node("globex")
+    add_entity(G, "initech", "f2")
+    store.append("u", G)
+    loaded = store.load("u")
+    assert set(loaded) == {"acme", "initech"}
+    assert loaded.number_of_edges() == 0
+    assert [n for n in store.load_view("u", ["f2"])] == ["initech"]
+    assert sorted(store.file_ids("u")) == ["f1", "f2"]
+
+def test_snapshot_published_once_per_log_position(tmp_path):
+    store, other = GraphStore(tmp_path), GraphStore(tmp_path)
+    G = KnowledgeGraph()
+    add_entity(G, "acme")
+    store.append("u", G)
+    
+    assert store.rebuild_snapshot("u")
+    path = store.snapshot_path("u")
+    identity = (path.stat().st_ino, path.stat().st_mtime_ns)
+    # Already covered, here or in another process: nothing is encoded again
+    assert store.rebuild_snapshot("u") and other.rebuild_snapshot("u")
+    other.publish_snapshot("u", other.load("u"))
+    assert (path.stat().st_ino, path.stat().st_mtime_ns) == identity
+    
+    add_entity(G, "globex")
+    store.append("u", G)
+    assert other.rebuild_snapshot("u")
+    snapshot = store.open_snapshot("u")
+    assert snapshot.log_offset == store.log_path("u").stat().st_size
+    assert sorted(snapshot.nodes[i]['node_id'] for i in snapshot) == ["acme", "globex"]
+    assert not store.rebuild_snapshot("nobody")
+
+def test_snapshot_in_older_format_is_rebuilt(tmp_path):
+    store = GraphStore(tmp_path)
+    G = KnowledgeGraph()
+    add_entity(G, "acme")
+    store.append("u", G)
+    store.rebuild_snapshot("u")
+    path = store.snapshot_path("u")
+    data = bytearray(path.read_bytes())
+    data[4:8] = (1).to_bytes(4, 'little')
+    path.write_bytes(bytes(data))
+    
+    assert store.open_snapshot("u") is None
+    assert store.rebuild_snapshot("u")
+    assert store.open_snapshot("u").find_entities("Acme") != []
@@ -0,0 +1,60 @@
+import threading
+import time
+from app.services.job_queue import JobQueue
+
+def queues(tmp_path, count: int = 2):
+    """Queues sharing one database, as worker processes do"""
+    result = [JobQueue(str(tmp_path / "jobs.db")) for _ in range(count)]
+    for queue in result:
+        queue._heartbeat()
+    return result
+
+def submit(queue: JobQueue, user_id: str, n: int):
+    job = queue.submit(user_id, "ingest", f"file{n}", f"file{n}.csv", {})
+    # created_at orders claims: keep submits distinct
+    time.sleep(0.002)
+    return job["job_id"]
+
+def claim_all(queues, threads_per_queue: int = 4):
+    claimed = []
+    start = threading.Barrier(len(queues) * threads_per_queue)
+    
+    def worker(queue):
+        start.wait()
+        job = queue._claim()
+        if job is not None:
+            claimed.append((job["job_id"], job["user_id"], queue.token))
+    threads = [threading.Thread(target=worker, args=(queue,)) for queue in queues for _ in range(threads_per_queue)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return claimed
+
+def test_concurrent_claims_take_each_job_once_and_one_per_user(tmp_path):
+    first, second = queues(tmp_path)
+    a1, a2 = submit(first, "a", 1), submit(second, "a", 2)
+    b1 = submit(second, "b", 3)
+    
+    claimed = claim_all([first, second])
+    assert sorted(job_id for job_id, _, _ in claimed) == sorted([a1, b1])
+    
+    # a's next job waits for the running one, then goes to exactly one claimer
+    assert claim_all([first, second]) == []
+    owner = next(token for job_id, _, token in claimed if job_id == a1)
+    running = first if first.token == owner else second
+    running._finish(a1, "completed")
+    assert [job_id for job_id, _, _ in claim_all([first, second])] == [a2]
+    assert first._load(a2)["status"] == "running"
+
+def test_jobs_of_a_dead_process_are_claimed_again(tmp_path):
+    first, second = queues(tmp_path)
+    job_id = submit(first, "a", 1)
+    assert first._claim()["job_id"] == job_id
+    assert second._claim() is None
+    
+    # The owner's heartbeat went stale (crash): its running job is resumed elsewhere
+    first.conn.execute("UPDATE workers SET heartbeat = ? WHERE token = ?", (time.time() - 10 * first.lease, first.token))
+    job = second._claim()
+    assert job["job_id"] == job_id
+    assert second._claim() is None
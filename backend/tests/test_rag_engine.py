@@ -0,0 +1,125 @@
+import zlib
+import numpy as np
+import pytest
+
+pytest.importorskip("sentence_transformers")
+pytest.importorskip("faiss")
+
+from app.core.config import settings
+from app.services.ann_index import ann_builder, stored_ids
+from app.services.rag_engine import rag_engine, IndexVersion
+from app.services.user_locks import user_locks
+
+class FakeEncoder:
+    """Deterministic vectors per text, so tests need no model"""
+    
+    def encode(self, texts, batch_size=None, convert_to_numpy=True):
+        if isinstance(texts, str):
+            return self.vector(texts)
+        return np.stack([self.vector(text) for text in texts])
+    
+    def vector(self, text: str) -> np.ndarray:
+        return np.random.default_rng(zlib.crc32(text.encode())).standard_normal(8).astype(np.float32)
+    
+    def predict(self, pairs):
+        # Reranking keeps the retrieval order
+        return [-i for i in range(len(pairs))]
+
+@pytest.fixture
+def engine(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "EMBED_CACHE_ENABLED", False)
+    monkeypatch.setattr(rag_engine, "encoder", FakeEncoder())
+    monkeypatch.setattr(rag_engine, "reranker", FakeEncoder())
+    monkeypatch.setattr(rag_engine, "storage_dir", tmp_path)
+    # Deletes stay tombstones unless a test compacts
+    monkeypatch.setattr(rag_engine, "compact_ratio", 10.0)
+    yield rag_engine
+    rag_engine.drop("u")
+
+def store(engine, file_id: str, count: int, doc_type: str = "deals"):
+    with user_locks.writer("u"):
+        engine.store_embeddings([{"content": f"{file_id} row {i}"} for i in range(count)], file_id, "u", doc_type)
+
+def contents(engine, query: str, **kwargs):
+    return {result["content"] for result in engine.search_similar(query, "u", top_k=50, **kwargs)}
+
+def test_deletes_are_tombstones_logged_beside_the_saved_index(engine, tmp_path):
+    store(engine, "f1", 5)
+    store(engine, "f2", 3, "memos")
+    pkl = (tmp_path / "u.pkl").read_bytes()
+    
+    assert engine.delete_files("u", ["f1"]) == 5
+    version = engine.current("u")
+    assert version.deleted.tolist() == [0, 1, 2, 3, 4]
+    assert version.index.ntotal == 8
+    assert contents(engine, "f1 row 0") == {f"f2 row {i}" for i in range(3)}
+    assert "deals" not in version.doc_type_ids
+    # The saved documents are untouched: the delete is only in {user}.del
+    assert (tmp_path / "u.pkl").read_bytes() == pkl
+    assert np.frombuffer((tmp_path / "u.del").read_bytes(), dtype=np.int64).tolist() == [0, 1, 2, 3, 4]
+
+def test_delete_log_is_replayed_on_load(engine):
+    store(engine, "f1", 5)
+    store(engine, "f2", 3)
+    engine.delete_files("u", ["f1"])
+    
+    # Another process starting up: nothing in memory
+    engine.drop("u")
+    version = engine.current("u")
+    assert version.documents[:5] == [None] * 5
+    assert version.deleted.tolist() == [0, 1, 2, 3, 4]
+    assert contents(engine, "f1 row 0") == {f"f2 row {i}" for i in range(3)}
+    
+    with user_locks.writer("u"):
+        engine._load_index("u")
+    assert engine.tombstones["u"] == {0, 1, 2, 3, 4}
+    assert list(engine.file_chunks["u"]) == ["f2"]
+    
+    # The next full save folds the log into the documents
+    store(engine, "f3", 1)
+    assert not engine.delete_log_path("u").exists()
+    engine.drop("u")
+    assert engine.current("u").documents[:5] == [None] * 5
+
+def test_version_without_shares_the_index(engine):
+    store(engine, "f1", 4, "deals")
+    store(engine, "f2", 2, "memos")
+    version = engine.current("u")
+    
+    after = version.without([4, 5], {"memos": []})
+    assert after.index is version.index and after.vectors is version.vectors
+    assert after.documents[4] is None and after.documents[5] is None
+    assert after.deleted.tolist() == [4, 5]
+    assert "memos" not in after.doc_type_ids
+    assert after.doc_type_ids["deals"].tolist() == [0, 1, 2, 3]
+    # The published version is immutable
+    assert version.documents[4] is not None and len(version.deleted) == 0
+    assert version.doc_type_ids["memos"].tolist() == [4, 5]
+    
+    partial = after.without([0], {"deals": [1, 2, 3]})
+    assert partial.deleted.tolist() == [0, 4, 5]
+    assert partial.doc_type_ids["deals"].tolist() == [1, 2, 3]
+
+def test_swap_index_catches_up_with_concurrent_changes(engine):
+    store(engine, "f1", 4)
+    store(engine, "f2", 3)
+    engine.delete_files("u", ["f1"])
+    
+    # A rebuild starts from a copy of the documents, as _promote does
+    with user_locks.writer("u"):
+        documents = list(engine.documents["u"])
+        vectors = engine._map_vectors("u", engine.indices["u"].d, len(documents))
+    live = np.array([i for i, doc in enumerate(documents) if doc is not None], dtype=np.int64)
+    index = ann_builder.build(np.asarray(vectors[live]), live)
+    
+    # Meanwhile: a file is added and one the copy still holds is deleted
+    store(engine, "f3", 2)
+    engine.delete_files("u", ["f2"])
+    
+    with user_locks.writer("u"):
+        engine._swap_index("u", index, documents)
+        assert engine.tombstones["u"] == {4, 5, 6}
+    version = engine.current("u")
+    assert sorted(stored_ids(version.index).tolist()) == [4, 5, 6, 7, 8]
+    assert version.deleted.tolist() == [4, 5, 6]
+    assert contents(engine, "f3 row 0") == {"f3 row 0", "f3 row 1"}